@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Feed pager
+
+Pages through a Hevy workout feed (your own, or another user's) for the profile
+and social pages. While a page is shown the next one is already being fetched,
+which also starts its picture downloads. Workouts are deduped by id across pages,
+a reload revalidates the first page with its Etag, and the first few pages are
+kept on disk so a feed can be shown straight away on startup
+"""
+
+import concurrent.futures
+import json
+import os
+import tempfile
+import threading
+
+import hevy_api
+import session_store
+
+# Pages of each feed kept on disk
+FEED_CACHE_PAGES = 3
+
+# Fetches the next page of each feed in the background
+_prefetcher = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+
+#
+# One feed, user=None being the logged in user's own feed
+# reload() and next_page() block on the network, call them from a worker
+# Both return {"user": user, "workouts": [new workouts], "reset": True if the feed should be cleared first}
+#
+class FeedPager:
+
+	def __init__(self, user=None):
+		self.user = user
+		# held for the whole of reload() / next_page(), so the page's workers never interleave
+		self._lock = threading.Lock()
+		self._etag = None
+		self._pages = []
+		self._seen = set()
+		self._cursor = 0
+		self._prefetch = None
+
+	#
+	# The workouts kept on disk from last time, and continue paging after them
+	#
+	def cached(self):
+		with self._lock:
+			data = _read(self._cache_path())
+			self._etag = data.get("etag")
+			self._pages = []
+			self._seen = set()
+			self._cursor = 0
+			workouts = []
+			for page in data.get("pages", []):
+				workouts += self._add_page(page)
+			return workouts
+
+	#
+	# Fetch the first page again. If the server says it hasn't changed (304) the
+	# feed as shown is still good and nothing is returned
+	#
+	def reload(self):
+		with self._lock:
+			etag = self._etag if self._pages else None
+			returnjson = hevy_api.feed_workouts_paged(0, user=self.user, etag=etag)
+			if returnjson == 304:
+				self._start_prefetch()
+				return self._result([])
+			if not isinstance(returnjson, dict):
+				return self._result([])
+			self._etag = returnjson["Etag"]
+			self._pages = []
+			self._seen = set()
+			self._cursor = 0
+			self._cancel_prefetch()
+			workouts = self._add_page(returnjson["data"]["workouts"])
+			self._save()
+			self._start_prefetch()
+			return self._result(workouts, reset=True)
+
+	#
+	# The next page, usually already fetched by the prefetch started for it
+	#
+	def next_page(self):
+		with self._lock:
+			returnjson = None
+			if self._prefetch is not None and self._prefetch[0] == self._cursor:
+				returnjson = self._prefetch[1].result()
+			self._prefetch = None
+			if not isinstance(returnjson, dict):
+				returnjson = hevy_api.feed_workouts_paged(self._cursor, user=self.user)
+			if not isinstance(returnjson, dict):
+				return self._result([])
+			page = returnjson["data"]["workouts"]
+			workouts = self._add_page(page)
+			if len(self._pages) <= FEED_CACHE_PAGES:
+				self._save()
+			if page:
+				self._start_prefetch()
+			return self._result(workouts)
+
+	def _result(self, workouts, reset=False):
+		return {"user": self.user, "workouts": workouts, "reset": reset}
+
+	#
+	# Move the cursor past a page and return its workouts not already in the feed
+	# Your own feed pages from the last workout's index, a user's feed by offset
+	#
+	def _add_page(self, page):
+		self._pages.append(page)
+		if page:
+			if self.user == None:
+				self._cursor = page[-1]["index"]
+			else:
+				self._cursor += len(page)
+		workouts = [workout for workout in page if workout["id"] not in self._seen]
+		self._seen.update(workout["id"] for workout in workouts)
+		return workouts
+
+	def _start_prefetch(self):
+		if self._prefetch is None or self._prefetch[0] != self._cursor:
+			self._cancel_prefetch()
+			self._prefetch = (self._cursor, _prefetcher.submit(hevy_api.feed_workouts_paged, self._cursor, user=self.user))
+
+	def _cancel_prefetch(self):
+		if self._prefetch is not None:
+			self._prefetch[1].cancel()
+			self._prefetch = None
+
+	def _cache_path(self):
+		user_id = session_store.load().get("user-id")
+		if user_id == None:
+			return None
+		name = "home.json" if self.user == None else "user_" + self.user + ".json"
+		return session_store.utb_folder() + "/user_" + user_id + "/feed/" + name
+
+	def _save(self):
+		path = self._cache_path()
+		if path == None:
+			return
+		_write(path, {"etag": self._etag, "pages": self._pages[:FEED_CACHE_PAGES]})
+
+
+def _read(path):
+	if path == None:
+		return {}
+	try:
+		with open(path, 'r') as file:
+			return json.load(file)
+	except (FileNotFoundError, ValueError):
+		return {}
+
+
+def _write(path, data):
+	folder = os.path.dirname(path)
+	if not os.path.exists(folder):
+		os.makedirs(folder)
+	fd, temp_path = tempfile.mkstemp(dir=folder, prefix=".feed-", suffix=".json")
+	try:
+		with os.fdopen(fd, 'w') as f:
+			json.dump(data, f)
+		os.replace(temp_path, path)
+	except BaseException:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+		raise
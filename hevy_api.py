@@ -5,6 +5,7 @@ Provides the methods for interacting with the Hevy API
 """
 
 import requests
+import requests.adapters
 import json
 import os
 import getpass
@@ -12,10 +13,25 @@ import re
 import time
 import datetime
 import shutil
+import threading
 
 from pathlib import Path
 import concurrent.futures 
 
+import session_store
+import routines_store
+import social_store
+
+# Renew the Hevy access token in the background this many seconds before it expires
+TOKEN_REFRESH_AHEAD = 300
+
+# Held while refreshing tokens, so only one refresh is ever in flight
+_refresh_lock = threading.Lock()
+# The background refresh timer and the expires_at it was scheduled for
+_refresher = None
+_refresher_expires_at = None
+_refresher_lock = threading.Lock()
+
 # Basic headers to use throughout
 BASIC_HEADERS = {
 	'x-api-key': 'with_great_power',
@@ -80,8 +96,7 @@ def temp_login(old_access_token, old_refresh_token):
 				os.makedirs(user_folder+"/workouts")
 				os.makedirs(user_folder+"/routines")
 			
-			with open(utb_folder+"/session.json", 'w') as f:
-				json.dump({"access_token":access_token, "expires_at":access_token_expiry, "refresh_token":refresh_token, "user-id":user_id},f)
+			session_store.save({"access_token":access_token, "expires_at":access_token_expiry, "refresh_token":refresh_token, "user-id":user_id})
 			
 			with open(user_folder+"/account.json", 'w') as f:
 				json.dump(account_data, f)
@@ -137,9 +152,6 @@ def cookie_login():
 # Takes the old Hevy access tokens and requests new access tokens
 #
 def update_tokens(old_access_token, old_refresh_token):
-	home_folder = str(Path.home())
-	utb_folder = home_folder + "/.underthebar"
-
 	headers = BASIC_HEADERS.copy()
 	
 	s = requests.Session()
@@ -161,13 +173,7 @@ def update_tokens(old_access_token, old_refresh_token):
 		refresh_token = returned_json["refresh_token"]
 		print("Refresh_Token", refresh_token)
 		
-		with open(utb_folder+"/session.json", 'r') as file:
-			session_data = json.load(file)
-		session_data["access_token"] = access_token
-		session_data["expires_at"] = access_token_expiry
-		session_data["refresh_token"] = refresh_token
-		with open(utb_folder+"/session.json", 'w') as f:
-			json.dump(session_data,f)
+		session_store.update({"access_token":access_token, "expires_at":access_token_expiry, "refresh_token":refresh_token})
 
 		return access_token # return the new access token so it can get used directly
 	
@@ -236,8 +242,7 @@ def login(user, password):
 				os.makedirs(user_folder+"/workouts")
 				os.makedirs(user_folder+"/routines")
 			
-			with open(utb_folder+"/session.json", 'w') as f:
-				json.dump({"auth-token":auth_token,"user-id":user_id},f)
+			session_store.save({"auth-token":auth_token,"user-id":user_id})
 			
 			with open(user_folder+"/account.json", 'w') as f:
 				json.dump(account_data, f)
@@ -272,22 +277,10 @@ def login(user, password):
 # Updated for access/refresh tokens update from Hevy API
 #
 def logout():
-	# The folder to access/store data files
-	home_folder = str(Path.home())
-	utb_folder = home_folder + "/.underthebar"
-	session_data = {}
-	if os.path.exists(utb_folder+"/session.json"):	
-		with open(utb_folder+"/session.json", 'r') as file:
-			session_data = json.load(file)
-	else:
+	_cancel_refresher()
+	if not session_store.exists():
 		return True
-	#del session_data["auth-token"]
-	del session_data["access_token"]
-	del session_data["expires_at"]
-	del session_data["refresh_token"]
-	del session_data["user-id"]
-	with open(utb_folder+"/session.json", 'w') as f:
-		json.dump({},f)
+	session_store.save({})
 	return True
 
 #
@@ -302,11 +295,8 @@ def is_logged_in():
 	home_folder = str(Path.home())
 	utb_folder = home_folder + "/.underthebar"
 	
-	session_data = {}
-	if os.path.exists(utb_folder+"/session.json"):	
-		with open(utb_folder+"/session.json", 'r') as file:
-			session_data = json.load(file)
-	else:
+	session_data = session_store.load()
+	if not session_data:
 		return False, None, None
 	
 	try:
@@ -314,21 +304,76 @@ def is_logged_in():
 		print("accessing session tokens")
 		access_token = session_data["access_token"]
 		access_token_expiry = session_data["expires_at"]
-		refresh_token = session_data["refresh_token"]
-		print("Comparing token expiry with current time", access_token_expiry, datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]+"Z")
-		if access_token_expiry < datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]+"Z":
+		if _seconds_left(access_token_expiry) <= 0:
+			# Only if the background refresh didn't get there first (e.g. the machine slept)
 			print("Tokens expired, refreshing")
-			access_token = update_tokens(access_token, refresh_token)
+			access_token = _refresh_once(access_token)
 			if not access_token:
 				return False, None, None
 		else:
 			print("Tokens good, logged in")
+		_schedule_refresh()
 		# this is the folder we'll save the data file to
 		user_folder = utb_folder + "/user_" + session_data["user-id"]	
 		return True, user_folder, access_token
 	except:
 		return False, None, None
 
+#
+# Refresh the tokens unless another thread already replaced seen_access_token while we waited
+# Returns the current access token, or False if the refresh failed
+#
+def _refresh_once(seen_access_token):
+	with _refresh_lock:
+		session_data = session_store.load()
+		if session_data.get("access_token") != seen_access_token:
+			return session_data.get("access_token", False)
+		return update_tokens(session_data["access_token"], session_data["refresh_token"])
+
+#
+# Make sure a background timer will refresh the saved tokens TOKEN_REFRESH_AHEAD seconds before they expire
+#
+def _schedule_refresh():
+	global _refresher, _refresher_expires_at
+	expires_at = session_store.load().get("expires_at")
+	if not expires_at:
+		return
+	with _refresher_lock:
+		if _refresher is not None and _refresher.is_alive() and _refresher_expires_at == expires_at:
+			return
+		if _refresher is not None:
+			_refresher.cancel()
+		delay = max(0, _seconds_left(expires_at) - TOKEN_REFRESH_AHEAD)
+		_refresher = threading.Timer(delay, _background_refresh)
+		_refresher.daemon = True
+		_refresher_expires_at = expires_at
+		_refresher.start()
+
+def _background_refresh():
+	session_data = session_store.load()
+	if "access_token" not in session_data:
+		return
+	print("Refreshing Hevy tokens ahead of expiry")
+	if _refresh_once(session_data["access_token"]):
+		_schedule_refresh()
+	else:
+		print("Background token refresh failed, will refresh on next use")
+
+def _cancel_refresher():
+	global _refresher, _refresher_expires_at
+	with _refresher_lock:
+		if _refresher is not None:
+			_refresher.cancel()
+		_refresher = None
+		_refresher_expires_at = None
+
+#
+# Seconds until a Hevy expires_at timestamp ("2025-08-23T00:53:43.532Z"), negative once past
+#
+def _seconds_left(expires_at):
+	expiry = datetime.datetime.fromisoformat(expires_at.replace("Z", "+00:00"))
+	return (expiry - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+
 #
 # Updates a local JSON file and returns a http status code indicating success.
 # to_update is the API call to be used. Needs to be from pre-determined list as below in lookup dict.
@@ -381,6 +426,10 @@ def update_generic(to_update):
 			json.dump(new_data, f)
 			
 			
+		# SUGGESTED USERS ALSO GO IN THE SOCIAL STORE
+		if to_update == "suggested_users":
+			social_store.sync(user_folder, social_store.SUGGESTED, [user["username"] for user in data])
+			
 		# IF ACCOUNT UPDATED WE ALSO WILL RE-FETCH PROFILE IMAGE
 		if to_update == "account":
 			try:
@@ -552,17 +601,12 @@ def routines_sync_batch():
 	#headers["auth-token"] = auth_token # update for hevy api change
 	headers["Authorization"] = "Bearer "+auth_token	
 	
-	# Go through all workouts and compile the workout ID and when it was updated
+	# Compile the routine IDs and when they were updated, from the routines index
 	existing_data = {}
 	existing_id_file = {}
-	for file in os.listdir(routines_folder):
-		match_workout = re.search('^routine_([A-Za-z0-9_-]+).json\Z',file)
-		if match_workout:
-			
-			f = open(routines_folder+'/'+file)
-			workout_data = json.load(f)
-			existing_data[workout_data['id']] = workout_data['updated_at']
-			existing_id_file[workout_data['id']] = file
+	for routine_id, entry in routines_store.load_index(routines_folder).items():
+		existing_data[routine_id] = entry['updated_at']
+		existing_id_file[routine_id] = entry['file']
 	
 	# Post our existing data that we have compiled, and see what gets returned
 	s = requests.Session()
@@ -575,6 +619,7 @@ def routines_sync_batch():
 		workoutfilename=routines_folder+"/"+"routine_"+routine_id+".json"
 		with open(workoutfilename, 'w') as f:
 			json.dump(updated_workout, f, indent=4)
+		routines_store.update_routine(routines_folder, updated_workout)
 		
 		print("updated",workoutfilename)
 		
@@ -585,6 +630,7 @@ def routines_sync_batch():
 			os.makedirs(deletedir)
 		print("delete", deleted_workout, existing_id_file[deleted_workout])
 		shutil.move(routines_folder+"/"+existing_id_file[deleted_workout],deletedir+"/"+existing_id_file[deleted_workout])
+		routines_store.remove_routine(routines_folder, deleted_workout)
 		
 		# Does a local copy exist as well?
 		if os.path.exists(routines_folder+"/modified/"+existing_id_file[deleted_workout]):
@@ -635,6 +681,133 @@ def put_routine(the_json, routine_id=None):
 	return r.status_code
 	#return 400
 
+# Routines uploaded at once by upload_routines
+ROUTINE_UPLOAD_WORKERS = 4
+
+#
+# Upload every local routine edit (routines/modified), ROUTINE_UPLOAD_WORKERS at a time
+# Edits whose routine has changed on Hevy since the edit was started are not uploaded (409), and
+# the newer server version is saved locally instead
+# Each accepted upload is applied straight to the local routines from Hevy's response, and the
+# local copy moved to modified/uploaded, so no follow-up routines_sync_batch is needed
+# Returns {filename: (status_code, applied)}, or 403 if not logged in
+#
+def upload_routines():
+	# Make sure user is logged in, have their folder, and auth-token
+	user_data = is_logged_in()
+	if user_data[0] == False:
+		return 403
+	user_folder = user_data[1]
+	auth_token = user_data[2]
+
+	routines_folder = user_folder + "/routines"
+	modified_folder = routines_folder + "/modified"
+	if not os.path.exists(modified_folder):
+		return {}
+
+	routines = {}
+	for routine_id, entry in routines_store.load_index(routines_folder).items():
+		routines[entry["file"]] = (routine_id, entry)
+	queue = [filename for filename in sorted(os.listdir(modified_folder)) if filename == "newroutine.json" or filename in routines]
+
+	s = requests.Session()
+	s.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=ROUTINE_UPLOAD_WORKERS))
+	s.headers.update(BASIC_HEADERS)
+	s.headers.update({"Authorization": "Bearer "+auth_token})
+
+	results = {}
+	base = {}
+	for filename in queue:
+		if filename in routines:
+			routine_id, entry = routines[filename]
+			base[routine_id] = entry.get("base_updated_at") or entry["updated_at"]
+	conflicts = _routine_conflicts(s, routines_folder, base)
+	for filename in queue:
+		if filename in routines and routines[filename][0] in conflicts:
+			print("conflict, changed on Hevy since edit", filename)
+			results[filename] = (409, False)
+
+	def upload(filename):
+		routine_id = routines[filename][0] if filename in routines else None
+		try:
+			return _upload_routine(s, routines_folder, filename, routine_id)
+		except Exception as e:
+			print("upload_routines exception:", filename, e)
+			return (0, False)
+
+	todo = [filename for filename in queue if filename not in results]
+	with concurrent.futures.ThreadPoolExecutor(max_workers=ROUTINE_UPLOAD_WORKERS) as executor:
+		results.update(zip(todo, executor.map(upload, todo)))
+	return results
+
+#
+# Ask routines_sync_batch which of the routines in base ({routine_id: updated_at the edit started from})
+# have changed or been deleted on Hevy. Changed ones are saved locally. Returns the set of routine ids
+#
+def _routine_conflicts(s, routines_folder, base):
+	if not base:
+		return set()
+	r = s.post('https://api.hevyapp.com/routines_sync_batch', data=json.dumps(base))
+	if r.status_code != 200:
+		# Can't tell, so don't overwrite anything
+		print("routine conflict check failed", r.status_code)
+		return set(base)
+	json_content = r.json()
+	conflicts = set(json_content['deleted']) & set(base)
+	for updated_routine in json_content['updated']:
+		routine_id = updated_routine['id']
+		if routine_id in base and updated_routine['updated_at'] != base[routine_id]:
+			conflicts.add(routine_id)
+			with open(routines_folder+"/routine_"+routine_id+".json", 'w') as f:
+				json.dump(updated_routine, f, indent=4)
+			routines_store.update_routine(routines_folder, updated_routine)
+	return conflicts
+
+#
+# POST (new) or PUT one local routine edit, and apply the routine Hevy sends back
+#
+def _upload_routine(s, routines_folder, filename, routine_id):
+	with open(routines_folder+"/modified/"+filename, 'r') as f:
+		try:
+			the_json = json.load(f)
+		except ValueError:
+			print("not valid json", filename)
+			return (400, False)
+
+	if routine_id == None:
+		r = s.post('https://api.hevyapp.com/routine/', data=json.dumps(the_json))
+	else:
+		r = s.put('https://api.hevyapp.com/routine/'+routine_id, data=json.dumps(the_json))
+	print("routine upload", filename, r.status_code)
+	if r.status_code not in (200, 201):
+		return (r.status_code, False)
+
+	# Keep the uploaded copy, but out of the queue
+	uploaded_folder = routines_folder+"/modified/uploaded"
+	if not os.path.exists(uploaded_folder):
+		os.makedirs(uploaded_folder)
+	shutil.move(routines_folder+"/modified/"+filename, uploaded_folder+"/"+filename)
+
+	routine_data = _routine_from_response(r)
+	if routine_data is None:
+		routines_store.set_modified(routines_folder, filename, False)
+		return (r.status_code, False)
+	with open(routines_folder+"/routine_"+routine_data["id"]+".json", 'w') as f:
+		json.dump(routine_data, f, indent=4)
+	routines_store.update_routine(routines_folder, routine_data)
+	return (r.status_code, True)
+
+def _routine_from_response(r):
+	try:
+		data = r.json()
+	except ValueError:
+		return None
+	if isinstance(data, dict) and isinstance(data.get("routine"), dict):
+		data = data["routine"]
+	if isinstance(data, dict) and all(key in data for key in ("id", "title", "folder_id", "index", "updated_at", "exercises")):
+		return data
+	return None
+
 def delete_routine(routine_id):
 	# Make sure user is logged in, have their folder, and auth-token
 	user_data = is_logged_in()
@@ -653,8 +826,9 @@ def delete_routine(routine_id):
 
 #	
 # Get the Hevy workout feed starting from workout with given index, returns json data
+# Given the Etag of a previous response, returns 304 if the page hasn't changed
 #
-def feed_workouts_paged(start_from, user=None):
+def feed_workouts_paged(start_from, user=None, etag=None):
 	print("feed_workouts_paged",start_from)
 	# Make sure user is logged in, have their folder, and auth-token
 	user_data = is_logged_in()
@@ -676,7 +850,8 @@ def feed_workouts_paged(start_from, user=None):
 	headers = BASIC_HEADERS.copy()
 	#headers["auth-token"] = auth_token # update for hevy api change
 	headers["Authorization"] = "Bearer "+auth_token	
-	
+	if etag != None:
+		headers["if-none-match"] = etag
 	
 	url = "https://api.hevyapp.com/feed_workouts_paged/"
 	if user != None:
@@ -691,7 +866,7 @@ def feed_workouts_paged(start_from, user=None):
 	if r.status_code == 200:
 	
 		data = r.json()
-		new_data = {"data":data, "Etag":r.headers['Etag']}
+		new_data = {"data":data, "Etag":r.headers.get('Etag')}
 		
 		# this bit is for downloading feed workout images, request in parallel
 		img_urls = []
@@ -882,76 +1057,32 @@ def friends():
 	#headers["auth-token"] = auth_token # update for hevy api change
 	headers["Authorization"] = "Bearer "+auth_token	
 	
-	# FOLLOWING DATA
-	url = "https://api.hevyapp.com/following/" + account_data["data"]["username"]	
-	s = requests.Session()	
-	r = s.get(url, headers=headers)	
-	following_data = r.json()
-	following = []
-	for datum in following_data:
-		following.append(datum['username'])
-	# Do Delta Assessment
-	following_data = {}
-	new_following_data = {"data":following,"added":[],"removed":[]}
-	if os.path.exists(user_folder+"/following.json"):	
-		with open(user_folder+"/following.json", 'r') as file:
-			following_data = json.load(file)
-	else:
-		following_data = {"data":[],"added":[],"removed":[]}
-	for user in new_following_data["data"]:
-		if user not in following_data["data"]:
-			new_following_data["added"].append(user)
-	for user in following_data["data"]:
-		if user not in new_following_data["data"]:
-			new_following_data["removed"].append(user)
-	# Write the file
-	with open(user_folder+"/"+"following.json", 'w') as f:
-		json.dump(new_following_data, f, indent=4)
-			
-	# FOLLOWER DATA
-	url = "https://api.hevyapp.com/followers/" + account_data["data"]["username"]	
-	r = s.get(url, headers=headers)	
-	followers_data = r.json()
-	follower = []
-	for datum in followers_data:
-		follower.append(datum['username'])
-	# Do Delta Assessment
-	follower_data = {}
-	new_follower_data = {"data":follower,"added":[],"removed":[]}
-	if os.path.exists(user_folder+"/follower.json"):	
-		with open(user_folder+"/follower.json", 'r') as file:
-			follower_data = json.load(file)
-	else:
-		follower_data = {"data":[],"added":[],"removed":[]}
-	for user in new_follower_data["data"]:
-		if user not in follower_data["data"]:
-			new_follower_data["added"].append(user)
-	for user in follower_data["data"]:
-		if user not in new_follower_data["data"]:
-			new_follower_data["removed"].append(user)
-	# Write the file
-	with open(user_folder+"/"+"follower.json", 'w') as f:
-		json.dump(new_follower_data, f, indent=4)
-	
-	mutual_friend = []
-	follow_only = []
-	not_follow = []
-	for follow in following:
-		if follow in follower:
-			mutual_friend.append(follow)
-		else:
-			follow_only.append(follow)
-	for follow in follower:
-		if follow not in following:
-			not_follow.append(follow)
-			
-	#print("Mutual Friends:")
-	#print(mutual_friend)
+	# Fetch who you follow and who follows you at the same time
+	def fetch_usernames(url):
+		r = requests.get(url, headers=headers)
+		if r.status_code != 200:
+			return r.status_code
+		return [datum['username'] for datum in r.json()]
+	with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+		following_future = executor.submit(fetch_usernames, "https://api.hevyapp.com/following/" + account_data["data"]["username"])
+		follower_future = executor.submit(fetch_usernames, "https://api.hevyapp.com/followers/" + account_data["data"]["username"])
+		following = following_future.result()
+		follower = follower_future.result()
+	if not isinstance(following, list):
+		return following
+	if not isinstance(follower, list):
+		return follower
+	
+	# Record them, the store works out who was added / removed since last time
+	social_store.sync(user_folder, social_store.FOLLOWING, following)
+	social_store.sync(user_folder, social_store.FOLLOWER, follower)
+	
+	following = set(following)
+	follower = set(follower)
 	print("\nYou Folllow:")
-	print(follow_only)
-	print("Otherwise you have",len(mutual_friend),"mutual friends, and",len(not_follow),"that just follow you.")
-	#print("\nFollowing You:")
-	#print(not_follow)
+	print(sorted(following - follower))
+	print("Otherwise you have",len(following & follower),"mutual friends, and",len(follower - following),"that just follow you.")
+	return 200
 
 #
 # List of users actively liking your last 10 workouts
@@ -987,9 +1118,7 @@ def cheer_squad():
 	#print(len(workouts),"workout data files to process")
 	
 	# Find the likes for each workout
-	the_squad = []
-	the_squad_score = {}
-	the_squad_following = {}
+	the_squad = {}
 	s = requests.Session()
 	for workout_id in workouts:
 		url = "https://api.hevyapp.com/workout_likes/" + workout_id	
@@ -997,35 +1126,16 @@ def cheer_squad():
 		likes_data = r.json()
 		for like_element in likes_data:
 			username = like_element["username"]
-			the_squad_following[username] = like_element["following_status"]
 			if username not in the_squad:
-				the_squad.append(username)
-				the_squad_score[username] = 1
-			else:
-				the_squad_score[username] += 1
+				the_squad[username] = {"score": 0}
+			the_squad[username]["score"] += 1
+			the_squad[username]["following_status"] = like_element["following_status"]
 				
-	print(len(the_squad), "members in your squad.", sum(the_squad_score.values()), "likes over 10 workouts.")
-	sorted_squad = dict(sorted(the_squad_score.items(), key=lambda item: (item[1],item[0]), reverse=True))
-	#for squad_member in sorted_squad.keys():
-	#	print(" - ", squad_member, the_squad_score[squad_member])
+	print(len(the_squad), "members in your squad.", sum(member["score"] for member in the_squad.values()), "likes over 10 workouts.")
 		
-	# Do Delta Assessment and write file
-	squad_data = {}
-	new_squad_data = {"data":sorted_squad,"following_data":the_squad_following, "added":[],"removed":[]}
-	if os.path.exists(user_folder+"/squad.json"):	
-		with open(user_folder+"/squad.json", 'r') as file:
-			squad_data = json.load(file)
-	else:
-		squad_data = {"data":{},"added":[],"removed":[]}
-	for user in new_squad_data["data"].keys():
-		if user not in squad_data["data"].keys():
-			new_squad_data["added"].append(user)
-	for user in squad_data["data"].keys():
-		if user not in new_squad_data["data"].keys():
-			new_squad_data["removed"].append(user)
-	# Write the file
-	with open(user_folder+"/"+"squad.json", 'w') as f:
-		json.dump(new_squad_data, f, indent=4)
+	# Record them, the store works out who was added / removed since last time
+	social_store.sync(user_folder, social_store.SQUAD, the_squad)
+	return 200
 		
 
 if __name__ == "__main__":
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Routines store
+
+Keeps routines/index.json, a summary of every routine file in the routines folder
+(id -> title, folder, index, updated_at, modified flag, exercise titles), so the
+routines page can list and sort routines without parsing every routine file
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+
+INDEX_FILE = "index.json"
+
+# Held while reading / writing the index, routines_sync_batch runs on a worker thread
+_lock = threading.RLock()
+
+_ROUTINE_FILE = re.compile(r'^routine_([A-Za-z0-9_-]+)\.json\Z')
+
+
+#
+# Return the index for routines_folder as {routine_id: entry}, each entry being
+# {"file", "mtime", "title", "folder_id", "index", "updated_at", "modified", "base_updated_at", "exercises"}
+# base_updated_at is the updated_at the local edit (if any) was started from
+# Only routine files that are new or changed on disk since the index was written get parsed
+#
+def load_index(routines_folder):
+	with _lock:
+		index = _read(routines_folder)
+		changed = False
+
+		on_disk = {}
+		for filename in os.listdir(routines_folder):
+			match_routine = _ROUTINE_FILE.search(filename)
+			if match_routine:
+				on_disk[match_routine[1]] = filename
+
+		for routine_id in list(index.keys()):
+			if routine_id not in on_disk:
+				del index[routine_id]
+				changed = True
+
+		modified_files = set()
+		if os.path.exists(routines_folder+"/modified"):
+			modified_files = set(os.listdir(routines_folder+"/modified"))
+
+		for routine_id, filename in on_disk.items():
+			mtime = os.stat(routines_folder+"/"+filename).st_mtime_ns
+			entry = index.get(routine_id)
+			if entry is None or entry["mtime"] != mtime:
+				with open(routines_folder+"/"+filename, 'r') as file:
+					entry = _entry(json.load(file), filename, mtime, entry)
+				index[routine_id] = entry
+				changed = True
+			modified = filename in modified_files
+			if entry["modified"] != modified:
+				_set_modified(entry, modified)
+				changed = True
+
+		if changed:
+			_write(routines_folder, index)
+		return index
+
+
+#
+# Index entries sorted the way Hevy shows them: by folder, then index within the folder
+#
+def ordered(index):
+	entries = sorted(index.values(), key=lambda entry: entry["file"], reverse=True)
+	return sorted(entries, key=lambda entry: (entry["folder_id"] or 0, entry["index"]))
+
+
+#
+# Record a routine just written to routines_folder (e.g. by routines_sync_batch)
+#
+def update_routine(routines_folder, routine_data):
+	filename = "routine_"+routine_data["id"]+".json"
+	with _lock:
+		index = _read(routines_folder)
+		mtime = os.stat(routines_folder+"/"+filename).st_mtime_ns
+		entry = _entry(routine_data, filename, mtime, index.get(routine_data["id"]))
+		modified = os.path.exists(routines_folder+"/modified/"+filename)
+		if entry["modified"] != modified:
+			_set_modified(entry, modified)
+		index[routine_data["id"]] = entry
+		_write(routines_folder, index)
+
+
+#
+# Drop a routine that has been moved out of routines_folder
+#
+def remove_routine(routines_folder, routine_id):
+	with _lock:
+		index = _read(routines_folder)
+		if index.pop(routine_id, None) is not None:
+			_write(routines_folder, index)
+
+
+#
+# Flag whether a routine has a local edit under routines/modified
+#
+def set_modified(routines_folder, filename, modified):
+	match_routine = _ROUTINE_FILE.search(filename)
+	if not match_routine:
+		return
+	with _lock:
+		index = _read(routines_folder)
+		entry = index.get(match_routine[1])
+		if entry is not None and entry["modified"] != modified:
+			_set_modified(entry, modified)
+			_write(routines_folder, index)
+
+
+#
+# Exercise title -> [routine filename, ...] in list order
+#
+def exercise_routines(entries):
+	exercises = {}
+	for entry in entries:
+		for exercise_title in entry["exercises"]:
+			files = exercises.setdefault(exercise_title, [])
+			if entry["file"] not in files:
+				files.append(entry["file"])
+	return exercises
+
+
+#
+# A fresh entry for routine_data, keeping the local edit state of the previous entry
+# (a sync replacing the server version doesn't change what the local edit was based on)
+#
+def _entry(routine_data, filename, mtime, previous=None):
+	return {
+		"file": filename,
+		"mtime": mtime,
+		"title": routine_data["title"],
+		"folder_id": routine_data["folder_id"],
+		"index": routine_data["index"],
+		"updated_at": routine_data["updated_at"],
+		"modified": previous["modified"] if previous else False,
+		"base_updated_at": previous.get("base_updated_at") if previous else None,
+		"exercises": [exercise["title"] for exercise in routine_data["exercises"]],
+	}
+
+
+def _set_modified(entry, modified):
+	entry["modified"] = modified
+	entry["base_updated_at"] = entry["updated_at"] if modified else None
+
+
+def _read(routines_folder):
+	try:
+		with open(routines_folder+"/"+INDEX_FILE, 'r') as file:
+			return json.load(file)
+	except (FileNotFoundError, ValueError):
+		return {}
+
+
+def _write(routines_folder, index):
+	fd, temp_path = tempfile.mkstemp(dir=routines_folder, prefix=".index-", suffix=".json")
+	try:
+		with os.fdopen(fd, 'w') as f:
+			json.dump(index, f)
+		os.replace(temp_path, routines_folder+"/"+INDEX_FILE)
+	except BaseException:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+		raise
@@ -6,23 +6,39 @@ Routes group:
   /settings      filters, private toggle, polling interval, creds
   /auth          Strava OAuth bootstrap + Hevy token paste
   /api/*         JSON endpoints used by the import dashboard
+  /api/events    Server-Sent Events: poll progress, log tail, status
+  /webhook/strava  Strava push-subscription callback (challenge + events)
+  /metrics       Prometheus metrics
   /healthz       liveness
 """
 
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import json
 import logging
 import os
+import secrets
 from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Callable
 from urllib.parse import unquote, urlencode
 
 from fastapi import FastAPI, Form, HTTPException, Query, Request
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.templating import Jinja2Templates
 
+import hr_samples
+import metrics
+from events import Broadcaster
 from hevy_client import HevyClient, HevyError
 from poller import Poller
 from state import build_state, State
@@ -30,6 +46,7 @@ from strava_client import (
     ALL_ACTIVITY_TYPES,
     StravaClient,
     StravaError,
+    StravaRateLimited,
     VIRTUAL_RIDE_TYPE,
     VIRTUAL_RIDE_OWNER_HEVY_USER_ID,
     test_credentials,
@@ -45,22 +62,34 @@ log = logging.getLogger("app")
 
 templates = Jinja2Templates(directory=str(Path(__file__).parent / "templates"))
 
+# An idle /api/events stream sends a comment this often, which keeps proxies
+# from timing it out and notices clients that went away.
+SSE_KEEPALIVE_SECONDS = 15
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     state: State = build_state()
     strava = StravaClient(state)
     hevy = HevyClient(state)
-    poller = Poller(state, strava, hevy)
+    events = Broadcaster()
+    state.add_listener(events.publish)
+    poller = Poller(state, strava, hevy, events)
     app.state.state = state
     app.state.strava = strava
     app.state.hevy = hevy
+    app.state.events = events
     app.state.poller = poller
+    # name → (key, value); see _cached(). The boot id keeps ETags from a
+    # previous process (whose State.version started at 0 too) from matching.
+    app.state.view_cache = {}
+    app.state.boot_id = secrets.token_hex(4)
     poller.start()
     state.log("INFO", "Service started")
     try:
         yield
     finally:
+        events.close()
         await poller.stop()
         state.log("INFO", "Service stopping")
 
@@ -69,10 +98,34 @@ app = FastAPI(title="Under the Bar", lifespan=lifespan)
 
 
 # ── Helpers ───────────────────────────────────────────────────────────────
+def _cached(app: FastAPI, name: str, build: Callable[[], dict]) -> tuple[str, dict]:
+    """(etag, build()) — rebuilt only when State has been written, the
+    Strava budget moved or the UTC date rolled over since the last build.
+    Treat the returned dict as read-only; it is shared between requests."""
+    key = (
+        app.state.boot_id,
+        app.state.state.version,
+        app.state.strava.budget.fingerprint(),
+        datetime.now(timezone.utc).date().isoformat(),
+    )
+    hit = app.state.view_cache.get(name)
+    if hit is None or hit[0] != key:
+        # Key taken before building: a write that lands mid-build makes the
+        # next call rebuild rather than serve a stale view.
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+        hit = app.state.view_cache[name] = (key, (f'W/"{digest}"', build()))
+    return hit[1]
+
+
 def _ctx(request: Request, **extra) -> dict:
-    s: State = request.app.state.state
-    hevy: HevyClient = request.app.state.hevy
-    strava: StravaClient = request.app.state.strava
+    _, base = _cached(request.app, "ctx", lambda: _build_ctx(request.app))
+    return {**base, "request": request, **extra}
+
+
+def _build_ctx(app: FastAPI) -> dict:
+    s: State = app.state.state
+    hevy: HevyClient = app.state.hevy
+    strava: StravaClient = app.state.strava
     enabled = set(s.get_json("enabled_types", []))
     types = [
         {"type": at.type, "title": at.title, "enabled": at.type in enabled}
@@ -86,8 +139,7 @@ def _ctx(request: Request, **extra) -> dict:
                 "enabled": VIRTUAL_RIDE_TYPE.type in enabled,
             }
         )
-    base = {
-        "request": request,
+    return {
         "title": "Under the Bar",
         "strava_authorized": strava.is_authorized(),
         "strava_has_creds": strava.has_credentials(),
@@ -97,20 +149,43 @@ def _ctx(request: Request, **extra) -> dict:
         "strava_client_secret_set": bool(s.get("strava_client_secret")),
         "enabled_types": types,
         "import_private": s.get_bool("import_private"),
+        "hr_downsample": s.get("hr_downsample") or hr_samples.DEFAULT_METHOD,
+        "hr_downsample_methods": hr_samples.METHODS,
         "polling_enabled": s.get_bool("polling_enabled"),
         "poll_interval_seconds": s.get_int("poll_interval_seconds", 600),
         "import_lookback_hours": s.get_int("import_lookback_hours", 24),
         "last_poll_at": s.get("last_poll_at") or "never",
+        "webhook_enabled": s.get_bool("webhook_enabled"),
+        "webhook_subscription_id": s.get("strava_subscription_id") or "",
         "counts": s.import_counts(),
+        "strava_budget": strava.budget.snapshot(),
+        "hevy_mirror_count": s.hevy_mirror_count(),
+        "hevy_mirror_synced_at": s.get("hevy_mirror_synced_at") or "never",
     }
-    base.update(extra)
-    return base
 
 
-def _strava_redirect_uri(request: Request) -> str:
+def _hevy_rows(workouts: list[dict]) -> list[dict]:
+    """Display fields for mirrored Hevy workouts."""
+    return [
+        {
+            "id": w["workout_id"],
+            "name": w["name"] or "",
+            "start": datetime.fromtimestamp(w["start_ts"], timezone.utc).strftime(
+                "%Y-%m-%d %H:%M"
+            ),
+            "exercises": len(w["workout"].get("exercises") or []),
+        }
+        for w in workouts
+    ]
+
+
+def _public_base_url(request: Request) -> str:
     override = os.environ.get("PUBLIC_BASE_URL")
-    base = override.rstrip("/") if override else str(request.base_url).rstrip("/")
-    return f"{base}/auth/strava/callback"
+    return override.rstrip("/") if override else str(request.base_url).rstrip("/")
+
+
+def _strava_redirect_uri(request: Request) -> str:
+    return f"{_public_base_url(request)}/auth/strava/callback"
 
 
 # ── Pages ─────────────────────────────────────────────────────────────────
@@ -127,15 +202,24 @@ async def import_dashboard(request: Request):
     ctx = _ctx(
         request,
         recent_imports=s.recent_imports(20),
+        recent_hevy_workouts=_hevy_rows(s.recent_hevy_workouts(10)),
         recent_logs=s.recent_logs(50),
     )
     return templates.TemplateResponse("dashboard.html", ctx)
 
 
 @app.get("/settings", response_class=HTMLResponse)
-async def settings_page(request: Request, saved: str | None = None):
+async def settings_page(
+    request: Request, saved: str | None = None, error: str | None = None
+):
     return templates.TemplateResponse(
-        "settings.html", _ctx(request, saved=saved)
+        "settings.html",
+        _ctx(
+            request,
+            saved=saved,
+            error=error,
+            webhook_callback_url=f"{_public_base_url(request)}/webhook/strava",
+        ),
     )
 
 
@@ -198,6 +282,16 @@ async def save_private(request: Request, import_private: str = Form("")):
     return RedirectResponse("/settings?saved=private", status_code=303)
 
 
+@app.post("/settings/heart-rate")
+async def save_heart_rate(request: Request, hr_downsample: str = Form("lttb")):
+    s: State = request.app.state.state
+    if hr_downsample not in hr_samples.METHODS:
+        raise HTTPException(400, f"Unknown downsample method {hr_downsample}")
+    s.set("hr_downsample", hr_downsample)
+    s.log("INFO", f"hr_downsample set to {hr_downsample}")
+    return RedirectResponse("/settings?saved=heart-rate", status_code=303)
+
+
 @app.post("/settings/polling")
 async def save_polling(
     request: Request,
@@ -217,6 +311,33 @@ async def save_polling(
     return RedirectResponse("/settings?saved=polling", status_code=303)
 
 
+@app.post("/settings/webhook")
+async def save_webhook(request: Request, webhook_enabled: str = Form("")):
+    """Create or remove the Strava push subscription. Creating it makes
+    Strava call GET /webhook/strava before it answers, which is served on
+    the event loop while this handler waits in a worker thread."""
+    s: State = request.app.state.state
+    strava: StravaClient = request.app.state.strava
+    try:
+        if webhook_enabled:
+            if not s.get("strava_subscription_id"):
+                await asyncio.to_thread(
+                    strava.create_subscription,
+                    f"{_public_base_url(request)}/webhook/strava",
+                )
+        else:
+            await asyncio.to_thread(strava.delete_subscription)
+    except StravaError as e:
+        s.log("ERROR", str(e))
+        return RedirectResponse(
+            f"/settings?error={_urlquote(str(e))}", status_code=303
+        )
+    s.set_bool("webhook_enabled", bool(webhook_enabled))
+    s.log("INFO", f"Webhook ingestion enabled={bool(webhook_enabled)}")
+    request.app.state.poller.kick()
+    return RedirectResponse("/settings?saved=webhook", status_code=303)
+
+
 # ── Auth ──────────────────────────────────────────────────────────────────
 @app.get("/auth/strava")
 async def strava_auth_start(request: Request):
@@ -340,6 +461,25 @@ async def sync_now(request: Request):
     return JSONResponse(result)
 
 
+@app.post("/api/hevy/sync")
+async def hevy_sync_now(request: Request):
+    poller: Poller = request.app.state.poller
+    if not request.app.state.hevy.is_authorized():
+        raise HTTPException(400, "Hevy not authorized")
+    return JSONResponse(await poller.sync_hevy())
+
+
+@app.get("/api/hevy/workouts")
+async def hevy_workouts(request: Request, limit: int = Query(20, ge=1, le=200)):
+    """Served from the local mirror; never calls Hevy."""
+    s: State = request.app.state.state
+    return {
+        "synced_at": s.get("hevy_mirror_synced_at"),
+        "count": s.hevy_mirror_count(),
+        "workouts": _hevy_rows(s.recent_hevy_workouts(limit)),
+    }
+
+
 @app.get("/api/activities")
 async def list_activities(request: Request, limit: int = Query(10, ge=1, le=50)):
     strava: StravaClient = request.app.state.strava
@@ -353,6 +493,10 @@ async def list_activities(request: Request, limit: int = Query(10, ge=1, le=50))
             limit,
             request.app.state.state.get_int("import_lookback_hours", 168),
         )
+    except StravaRateLimited as e:
+        raise HTTPException(
+            429, str(e), headers={"Retry-After": str(e.retry_after)}
+        )
     except StravaError as e:
         raise HTTPException(400, str(e))
     for a in activities:
@@ -373,34 +517,199 @@ async def import_one(request: Request, activity_id: str):
             strava.build_hevy_workout, activity_id, hevy.user_id(), is_private
         )
         status = await asyncio.to_thread(hevy.submit_workout, payload, workout_id)
+    except StravaRateLimited as e:
+        metrics.IMPORTS.inc(source="dashboard", outcome="deferred")
+        state.log("WARN", f"Manual import {activity_id} deferred: {e}")
+        raise HTTPException(
+            429, str(e), headers={"Retry-After": str(e.retry_after)}
+        )
     except (StravaError, HevyError) as e:
+        metrics.IMPORTS.inc(source="dashboard", outcome="failed")
         state.log("ERROR", f"Manual import {activity_id} failed: {e}")
         raise HTTPException(502, str(e))
     if status in (200, 201):
         title = payload["workout"]["title"]
         atype = payload["workout"]["exercises"][0]["title"]
         state.mark_imported(activity_id, title, atype, workout_id)
+        metrics.IMPORTS.inc(source="dashboard", outcome="succeeded")
+        # Settles a retrying or dead-lettered job for the same activity.
+        state.complete_import_job(activity_id)
         state.log("INFO", f"Manual import {activity_id} → Hevy {workout_id}")
+        events: Broadcaster = request.app.state.events
+        events.publish(
+            "progress",
+            {
+                "stage": "submitted",
+                "activity_id": activity_id,
+                "name": title,
+                "type": atype,
+                "hevy_workout_id": workout_id,
+            },
+        )
+        events.publish("status")
         return {"ok": True, "status": status, "hevy_workout_id": workout_id}
+    metrics.IMPORTS.inc(source="dashboard", outcome="failed")
     state.log("ERROR", f"Manual import {activity_id} HTTP {status}")
     raise HTTPException(502, f"Hevy returned HTTP {status}")
 
 
+# ── Strava webhook ────────────────────────────────────────────────────────
+@app.get("/webhook/strava")
+async def strava_webhook_challenge(
+    request: Request,
+    hub_mode: str = Query("", alias="hub.mode"),
+    hub_verify_token: str = Query("", alias="hub.verify_token"),
+    hub_challenge: str = Query("", alias="hub.challenge"),
+):
+    """Subscription validation: echo the challenge iff the token is ours."""
+    strava: StravaClient = request.app.state.strava
+    if (
+        hub_mode != "subscribe"
+        or not hub_challenge
+        or not secrets.compare_digest(hub_verify_token, strava.webhook_verify_token())
+    ):
+        raise HTTPException(403, "Verify token mismatch")
+    return {"hub.challenge": hub_challenge}
+
+
+@app.post("/webhook/strava")
+async def strava_webhook_event(request: Request):
+    """Queue a push event and return immediately — Strava expects a 200
+    within two seconds and retries otherwise. Events for another
+    subscription, or while auto-import is off, are acknowledged and dropped
+    so Strava doesn't keep redelivering them."""
+    s: State = request.app.state.state
+    try:
+        event = await request.json()
+    except json.JSONDecodeError:
+        raise HTTPException(400, "Invalid JSON")
+    if (
+        not isinstance(event, dict)
+        or not event.get("object_type")
+        or event.get("object_id") is None
+        or not event.get("aspect_type")
+    ):
+        raise HTTPException(400, "Not a Strava webhook event")
+
+    sub_id = s.get("strava_subscription_id")
+    if not sub_id or str(event.get("subscription_id")) != sub_id:
+        log.warning(
+            "ignoring webhook event for subscription %s", event.get("subscription_id")
+        )
+        return {"ok": True, "queued": False}
+    if not (s.get_bool("webhook_enabled") and s.get_bool("polling_enabled")):
+        return {"ok": True, "queued": False}
+
+    s.enqueue_webhook_event(event)
+    request.app.state.poller.kick()
+    return {"ok": True, "queued": True}
+
+
 # ── Status / health ───────────────────────────────────────────────────────
 @app.get("/api/status")
 async def api_status(request: Request):
-    s: State = request.app.state.state
+    """ETag'd on the State version and budget, so a polling dashboard gets
+    304s until something actually changes."""
+    etag, status = _status(request.app)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(status, headers=headers)
+
+
+@app.get("/api/events")
+async def event_stream(request: Request):
+    """SSE stream for the dashboard. Opens with a status snapshot; after
+    that, every published event. A reconnecting EventSource sends
+    Last-Event-ID and gets what it missed, as far as the replay ring
+    reaches."""
+    events: Broadcaster = request.app.state.events
+    last_id = request.headers.get("last-event-id", "")
+    sub = events.subscribe(int(last_id) if last_id.isdigit() else None)
+
+    async def stream():
+        try:
+            yield "retry: 5000\n\n"
+            yield _sse("status", _status(request.app)[1])
+            while True:
+                try:
+                    event = await sub.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                data = _status(request.app)[1] if event.kind == "status" else event.data
+                yield _sse(event.kind, data, event.id)
+        finally:
+            events.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _status(app: FastAPI) -> tuple[str, dict]:
+    """(etag, /api/status body). Only the budget snapshot is recomputed per
+    call, for a current resets_in_seconds."""
+    etag, status = _cached(app, "status", lambda: _build_status(app))
+    return etag, {**status, "strava_budget": app.state.strava.budget.snapshot()}
+
+
+def _build_status(app: FastAPI) -> dict:
+    s: State = app.state.state
     return {
-        "strava_authorized": request.app.state.strava.is_authorized(),
-        "hevy_authorized": request.app.state.hevy.is_authorized(),
+        "strava_authorized": app.state.strava.is_authorized(),
+        "hevy_authorized": app.state.hevy.is_authorized(),
         "hevy_username": s.get("hevy_username"),
         "polling_enabled": s.get_bool("polling_enabled"),
         "poll_interval_seconds": s.get_int("poll_interval_seconds", 600),
         "last_poll_at": s.get("last_poll_at"),
+        "webhook_active": app.state.poller.webhook_active(),
+        "webhook_backlog": s.webhook_backlog(),
+        "import_jobs": s.import_job_counts(),
+        "hevy_mirror": {
+            "count": s.hevy_mirror_count(),
+            "synced_at": s.get("hevy_mirror_synced_at"),
+        },
         "counts": s.import_counts(),
     }
 
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [t.strip() for t in if_none_match.split(",")]
+    # Weak comparison (RFC 9110 §13.1.2): W/ prefixes are ignored.
+    return "*" in tags or etag.removeprefix("W/") in (
+        t.removeprefix("W/") for t in tags
+    )
+
+
+def _sse(kind: str, data: dict, event_id: int | None = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/metrics")
+async def metrics_endpoint(request: Request):
+    """Prometheus text exposition. Queue and budget gauges are read from
+    State / the budget at scrape time; the rest accumulate in-process."""
+    s: State = request.app.state.state
+    for queue, depth in s.import_job_counts().items():
+        metrics.QUEUE_DEPTH.set(depth, queue=f"import_jobs_{queue}")
+    metrics.QUEUE_DEPTH.set(s.webhook_backlog(), queue="webhook_events")
+    budget = request.app.state.strava.budget.snapshot()
+    for window in ("short", "daily"):
+        metrics.STRAVA_BUDGET_REMAINING.set(budget[window]["remaining"], window=window)
+    metrics.SSE_SUBSCRIBERS.set(request.app.state.events.subscriber_count())
+    return Response(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.get("/healthz")
 async def healthz():
     return {"ok": True}
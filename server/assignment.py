@@ -0,0 +1,224 @@
+"""Globally optimal Strava → Hevy auto-merge assignment.
+
+best_match() is greedy per activity, so two Strava activities close in time
+(a morning and evening run, or two runs logged against one Hevy session)
+can both name the same workout as their auto_merge. assign() instead solves
+the bipartite matching: the most auto-merges possible with each Hevy
+workout "slot" used at most once, and among those the highest total score.
+
+A slot is a workout plus the exercise templates one activity type would
+merge into. A Ride + Run brick therefore has two slots and still takes both
+legs — the case merged_workouts' composite key exists for — while two runs
+can no longer land on the same run.
+
+Only pairs at or above AUTO_MERGE_THRESHOLD are eligible; anything lower
+stays a review item for the user. Sticky 'user' rows from merged_workouts
+are pinned: their activity and slot are taken out of the pool first.
+
+The candidate graph comes from CandidateIndex, so each activity only has a
+handful of edges. It falls apart into small connected components (roughly
+one per training day), and each is solved exactly with the Hungarian
+algorithm — cheap enough to re-match a whole history in one call.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable
+
+from matcher import (
+    AUTO_MERGE_THRESHOLD,
+    CandidateIndex,
+    HevyWorkoutSummary,
+    MatchScore,
+    StravaSummary,
+    score,
+)
+from metrics import MATCHER_SECONDS
+
+
+@dataclass(frozen=True)
+class Assignment:
+    activity_id: str
+    workout_id: str
+    # None for pinned pairs: the user confirmed them, nothing was scored.
+    score: MatchScore | None
+    pinned: bool = False
+
+
+def assign(
+    stravas: Iterable[StravaSummary],
+    candidates: Iterable[HevyWorkoutSummary] | CandidateIndex,
+    pinned: Iterable[tuple[str, str]] = (),
+    type_map: dict[str, set[str]] | None = None,
+) -> list[Assignment]:
+    """Optimal one-to-one auto-merges, in the input order of `stravas`.
+
+    `pinned` is (strava_activity_id, hevy_workout_id) pairs, normally
+    State.user_merges(). Activities without an assignment are omitted.
+    """
+    with MATCHER_SECONDS.time(op="assign"):
+        return _assign(list(stravas), candidates, pinned, type_map)
+
+
+def _assign(
+    stravas: list[StravaSummary],
+    candidates: Iterable[HevyWorkoutSummary] | CandidateIndex,
+    pinned: Iterable[tuple[str, str]],
+    type_map: dict[str, set[str]] | None,
+) -> list[Assignment]:
+    index = (
+        candidates
+        if isinstance(candidates, CandidateIndex)
+        else CandidateIndex(candidates, type_map)
+    )
+    type_map = index.type_map
+    by_id = {s.activity_id: s for s in stravas}
+    workouts = {w.workout_id: w for w in index.workouts}
+
+    pinned_for: dict[str, str] = {}
+    taken: set[tuple[str, frozenset[str]]] = set()
+    blocked_workouts: set[str] = set()
+    for activity_id, workout_id in pinned:
+        activity_id, workout_id = str(activity_id), str(workout_id)
+        pinned_for.setdefault(activity_id, workout_id)
+        strava = by_id.get(activity_id)
+        if strava is not None and workout_id in workouts:
+            taken.add(_slot(strava, workouts[workout_id], type_map))
+        else:
+            # Can't tell which leg an out-of-batch pin used; keep the whole
+            # workout out of the pool rather than risk a double merge.
+            blocked_workouts.add(workout_id)
+
+    # Eligible edges: activity index → {slot: MatchScore}.
+    edges: dict[int, dict[tuple[str, frozenset[str]], MatchScore]] = {}
+    for i, s in enumerate(stravas):
+        if s.activity_id in pinned_for:
+            continue
+        for w in index.candidates_for(s):
+            if w.workout_id in blocked_workouts:
+                continue
+            slot = _slot(s, w, type_map)
+            if slot in taken:
+                continue
+            m = score(s, w, type_map=type_map)
+            if m.score >= AUTO_MERGE_THRESHOLD:
+                best = edges.setdefault(i, {}).get(slot)
+                if best is None or m.score > best.score:
+                    edges[i][slot] = m
+
+    chosen: dict[int, MatchScore] = {}
+    for rows, slots in _components(edges):
+        weights = [[edges[r].get(c) for c in slots] for r in rows]
+        for r, c in _max_weight_matching(weights):
+            chosen[rows[r]] = weights[r][c]
+
+    out: list[Assignment] = []
+    for i, s in enumerate(stravas):
+        if s.activity_id in pinned_for:
+            workout_id = pinned_for[s.activity_id]
+            out.append(Assignment(s.activity_id, workout_id, None, pinned=True))
+        elif i in chosen:
+            out.append(Assignment(s.activity_id, chosen[i].workout_id, chosen[i]))
+    return out
+
+
+def _slot(
+    strava: StravaSummary, workout: HevyWorkoutSummary, type_map: dict[str, set[str]]
+) -> tuple[str, frozenset[str]]:
+    expected = type_map.get(strava.activity_type) or set()
+    return workout.workout_id, frozenset(
+        t for t in workout.exercise_template_ids if t in expected
+    )
+
+
+def _components(edges: dict[int, dict]) -> list[tuple[list[int], list]]:
+    """Split the bipartite edge set into connected components, each as
+    (activity indices, slots) in a stable order."""
+    parent: dict = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for r, slots in edges.items():
+        for c in slots:
+            parent[find(("r", r))] = find(("c", c))
+
+    groups: dict = {}
+    for r, slots in edges.items():
+        rows, cols = groups.setdefault(find(("r", r)), ([], {}))
+        rows.append(r)
+        for c in slots:
+            cols.setdefault(c, None)
+    return [(rows, list(cols)) for rows, cols in groups.values()]
+
+
+def _max_weight_matching(
+    weights: list[list[MatchScore | None]],
+) -> list[tuple[int, int]]:
+    """Hungarian algorithm on a rectangular matrix of optional edges.
+
+    Returns (row, col) pairs of a maximum-cardinality matching over the
+    existing edges with the highest summed score. Missing edges cost more
+    than any set of real ones, so they only serve as padding and are
+    dropped from the result.
+    """
+    n_rows = len(weights)
+    n_cols = len(weights[0]) if weights else 0
+    transpose = n_rows > n_cols
+    if transpose:
+        weights = [list(col) for col in zip(*weights)]
+        n_rows, n_cols = n_cols, n_rows
+    # Cost of "no edge" exceeds the total of any set of real edges.
+    missing = float(n_rows + 1)
+    cost = [
+        [missing if w is None else 1.0 - w.score for w in row] for row in weights
+    ]
+
+    # Potentials formulation (rows 1..n, cols 1..m, column 0 is virtual).
+    inf = float("inf")
+    u = [0.0] * (n_rows + 1)
+    v = [0.0] * (n_cols + 1)
+    match_col = [0] * (n_cols + 1)  # column → row
+    way = [0] * (n_cols + 1)
+    for i in range(1, n_rows + 1):
+        match_col[0] = i
+        j0 = 0
+        minv = [inf] * (n_cols + 1)
+        used = [False] * (n_cols + 1)
+        while True:
+            used[j0] = True
+            i0 = match_col[j0]
+            delta, j1 = inf, 0
+            for j in range(1, n_cols + 1):
+                if used[j]:
+                    continue
+                cur = cost[i0 - 1][j - 1] - u[i0] - v[j]
+                if cur < minv[j]:
+                    minv[j], way[j] = cur, j0
+                if minv[j] < delta:
+                    delta, j1 = minv[j], j
+            for j in range(n_cols + 1):
+                if used[j]:
+                    u[match_col[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if match_col[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match_col[j0] = match_col[j1]
+            j0 = j1
+
+    pairs = []
+    for j in range(1, n_cols + 1):
+        i = match_col[j]
+        if i and weights[i - 1][j - 1] is not None:
+            pairs.append((j - 1, i - 1) if transpose else (i - 1, j - 1))
+    return pairs
@@ -0,0 +1,312 @@
+"""Load test / benchmark for the import service, fully offline.
+
+Starts the real FastAPI app under uvicorn against the fake Strava and Hevy
+servers in fake_upstreams.py, then for --duration seconds runs, at once:
+
+  - a poller driver: POST /api/sync every --poll-every seconds;
+  - --importers manual-import users: GET /api/activities, then POST
+    /api/import/{id} for something not yet imported;
+  - --dashboards dashboard viewers: GET /api/status with If-None-Match, and
+    every tenth request the /import page.
+
+It prints (or writes to --out) a JSON report: per-route request count,
+status codes and p50/p95/p99 latency, imports per minute, State write-lock
+wait, upstream request / injected-error / 429 counts and the final Strava
+budget. Compare reports across commits to catch regressions:
+
+    python bench.py --duration 30 --activities 300 --latency 0.05 \\
+        --error-rate 0.02 --out bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+
+import requests
+
+# stravalib nags about STRAVA_CLIENT_ID on every Client(); the service keeps
+# credentials in State, so the warning is noise here.
+os.environ.setdefault("SILENCE_TOKEN_WARNINGS", "true")
+
+from fake_upstreams import HEVY_HOST, STRAVA_HOST, FakeHevy, FakeStrava, route_to
+from state import State
+
+
+@dataclass
+class BenchConfig:
+    duration: float = 30.0
+    activities: int = 100
+    latency: float = 0.02
+    jitter: float = 0.01
+    error_rate: float = 0.0
+    rate_limit: tuple[int, int] = (200, 2000)
+    poll_every: float = 5.0
+    importers: int = 1
+    dashboards: int = 4
+    # Pause between one virtual user's requests.
+    think_time: float = 0.2
+    seed: int = 0
+
+
+def run(config: BenchConfig) -> dict:
+    """Run one benchmark and return the report."""
+    import uvicorn
+
+    strava = FakeStrava(
+        activities=config.activities,
+        rate_limit=config.rate_limit,
+        latency=config.latency,
+        jitter=config.jitter,
+        error_rate=config.error_rate,
+        seed=config.seed,
+    )
+    hevy = FakeHevy(
+        latency=config.latency,
+        jitter=config.jitter,
+        error_rate=config.error_rate,
+        seed=config.seed + 1,
+    )
+    strava.start()
+    hevy.start()
+
+    data_dir = tempfile.mkdtemp(prefix="utb-bench-")
+    saved_data_dir = os.environ.get("DATA_DIR")
+    os.environ["DATA_DIR"] = data_dir
+    _seed_state(State(os.path.join(data_dir, "state.db")), config)
+
+    import app as app_module
+
+    server = uvicorn.Server(
+        uvicorn.Config(app_module.app, host="127.0.0.1", port=0, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, name="bench-uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    # The lifespan has built State by now.
+    if saved_data_dir is None:
+        del os.environ["DATA_DIR"]
+    else:
+        os.environ["DATA_DIR"] = saved_data_dir
+    port = server.servers[0].sockets[0].getsockname()[1]
+    base = f"http://127.0.0.1:{port}"
+    app_state = app_module.app.state
+    route_to(app_state.strava._session, {STRAVA_HOST: strava.url})
+    route_to(app_state.hevy._session, {HEVY_HOST: hevy.url})
+
+    recorder = _Recorder()
+    stop = threading.Event()
+    workers = [
+        threading.Thread(target=_poll_driver, args=(base, recorder, stop, config))
+    ]
+    workers += [
+        threading.Thread(
+            target=_importer, args=(base, recorder, stop, config, random.Random(i))
+        )
+        for i in range(config.importers)
+    ]
+    workers += [
+        threading.Thread(target=_dashboard, args=(base, recorder, stop, config))
+        for _ in range(config.dashboards)
+    ]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    stop.wait(config.duration)
+    stop.set()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+
+    state: State = app_state.state
+    counts = state.import_counts()
+    report = {
+        "config": asdict(config),
+        "elapsed_seconds": round(elapsed, 2),
+        "routes": recorder.summary(),
+        "imports": {
+            "total": counts["total"],
+            "per_minute": round(counts["total"] / (elapsed / 60), 2),
+            "jobs": state.import_job_counts(),
+        },
+        "state_lock_wait": _lock_summary(state.lock_stats()),
+        "upstream": {"strava": dict(strava.stats), "hevy": dict(hevy.stats)},
+        "strava_budget": app_state.strava.budget.snapshot(),
+    }
+
+    server.should_exit = True
+    thread.join(timeout=10)
+    strava.stop()
+    hevy.stop()
+    return report
+
+
+def _seed_state(state: State, config: BenchConfig) -> None:
+    """Authorized, every type enabled, scheduled polling off (the driver
+    triggers polls), and the Hevy mirror marked fresh so the poller doesn't
+    sync it before the sessions are routed to the fakes."""
+    state.set_many(
+        {
+            "strava_client_id": "1",
+            "strava_client_secret": "bench",
+            "strava_refresh_token": "bench",
+            "hevy_refresh_token": "bench",
+            "enabled_types": json.dumps(list(FakeStrava.TYPES)),
+            "import_lookback_hours": str(config.activities + 2),
+            "polling_enabled": "0",
+            "last_hevy_sync_ts": str(int(time.time())),
+        }
+    )
+
+
+class _Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency: dict[str, list[float]] = defaultdict(list)
+        self._status: dict[str, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def request(self, session: requests.Session, route: str, method: str, url: str, **kw):
+        start = time.perf_counter()
+        try:
+            r = session.request(method, url, timeout=120, **kw)
+            status = r.status_code
+        except requests.RequestException:
+            r, status = None, 0
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._latency[route].append(elapsed)
+            self._status[route][status] += 1
+        return r
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                route: {
+                    "count": len(samples),
+                    "status": {str(k): v for k, v in sorted(self._status[route].items())},
+                    **_percentiles(samples),
+                }
+                for route, samples in sorted(self._latency.items())
+            }
+
+
+def _poll_driver(base, recorder: _Recorder, stop: threading.Event, config: BenchConfig):
+    s = requests.Session()
+    while not stop.is_set():
+        recorder.request(s, "POST /api/sync", "POST", f"{base}/api/sync")
+        stop.wait(config.poll_every)
+
+
+def _importer(base, recorder, stop, config: BenchConfig, rng: random.Random):
+    s = requests.Session()
+    while not stop.is_set():
+        r = recorder.request(
+            s, "GET /api/activities", "GET", f"{base}/api/activities?limit=10"
+        )
+        todo = []
+        if r is not None and r.status_code == 200:
+            todo = [a["id"] for a in r.json()["activities"] if not a["already_imported"]]
+        if todo:
+            recorder.request(
+                s, "POST /api/import/{id}", "POST", f"{base}/api/import/{rng.choice(todo)}"
+            )
+        stop.wait(config.think_time)
+
+
+def _dashboard(base, recorder, stop, config: BenchConfig):
+    s = requests.Session()
+    etag, n = "", 0
+    while not stop.is_set():
+        headers = {"If-None-Match": etag} if etag else {}
+        r = recorder.request(s, "GET /api/status", "GET", f"{base}/api/status", headers=headers)
+        if r is not None and r.status_code == 200:
+            etag = r.headers.get("ETag", "")
+        n += 1
+        if n % 10 == 0:
+            recorder.request(s, "GET /import", "GET", f"{base}/import")
+        stop.wait(config.think_time)
+
+
+def _percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        # Nearest-rank.
+        k = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+        return round(ordered[k] * 1000, 2)
+
+    return {
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(ordered[-1] * 1000, 2),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+    }
+
+
+def _lock_summary(stats: dict) -> dict:
+    n = stats["acquisitions"]
+    return {
+        "acquisitions": n,
+        "total_wait_ms": round(stats["wait_seconds"] * 1000, 2),
+        "mean_wait_ms": round(stats["wait_seconds"] / n * 1000, 4) if n else 0.0,
+        "max_wait_ms": round(stats["max_wait_seconds"] * 1000, 2),
+    }
+
+
+def _parse_args(argv: list[str]) -> tuple[BenchConfig, str | None]:
+    d = BenchConfig()
+    p = argparse.ArgumentParser(description="Offline load test for the import service.")
+    p.add_argument("--duration", type=float, default=d.duration)
+    p.add_argument("--activities", type=int, default=d.activities)
+    p.add_argument("--latency", type=float, default=d.latency, help="upstream latency, seconds")
+    p.add_argument("--jitter", type=float, default=d.jitter)
+    p.add_argument("--error-rate", type=float, default=d.error_rate)
+    p.add_argument(
+        "--rate-limit",
+        default=",".join(map(str, d.rate_limit)),
+        help="Strava short,daily quota reported by the fake",
+    )
+    p.add_argument("--poll-every", type=float, default=d.poll_every)
+    p.add_argument("--importers", type=int, default=d.importers)
+    p.add_argument("--dashboards", type=int, default=d.dashboards)
+    p.add_argument("--think-time", type=float, default=d.think_time)
+    p.add_argument("--seed", type=int, default=d.seed)
+    p.add_argument("--out", help="write the JSON report here instead of stdout")
+    a = p.parse_args(argv)
+    short, daily = (int(v) for v in a.rate_limit.split(","))
+    config = BenchConfig(
+        duration=a.duration,
+        activities=a.activities,
+        latency=a.latency,
+        jitter=a.jitter,
+        error_rate=a.error_rate,
+        rate_limit=(short, daily),
+        poll_every=a.poll_every,
+        importers=a.importers,
+        dashboards=a.dashboards,
+        think_time=a.think_time,
+        seed=a.seed,
+    )
+    return config, a.out
+
+
+if __name__ == "__main__":
+    config, out = _parse_args(sys.argv[1:])
+    report = json.dumps(run(config), indent=2)
+    if out:
+        with open(out, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
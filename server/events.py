@@ -0,0 +1,114 @@
+"""In-process event broadcaster behind the /api/events SSE stream.
+
+The poller, the import routes and State.log publish small JSON events here;
+every connected dashboard holds one subscription and gets them pushed, so
+the page no longer polls /api/status or reloads to see progress. Kinds:
+
+  progress  a poll or import step: {"stage": fetched | building | submitted
+            | deferred | error, ...}
+  log       a row just written to log_events
+  status    something behind /api/status changed; the stream sends a fresh
+            snapshot
+
+publish() may be called from any thread (most poller work runs in
+asyncio.to_thread workers); delivery hops onto each subscriber's event
+loop. A recent-events ring lets a reconnecting EventSource resume from
+Last-Event-ID without gaps. Subscribers that stop reading lose their
+oldest queued events rather than growing without bound.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+
+
+# Events kept for Last-Event-ID replay.
+REPLAY_EVENTS = 200
+# Per-subscriber backlog before the oldest queued events are dropped.
+QUEUE_EVENTS = 100
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    kind: str
+    data: dict = field(default_factory=dict)
+
+
+class Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.queue: asyncio.Queue[Event | None] = asyncio.Queue(QUEUE_EVENTS)
+
+    def _put(self, event: Event | None) -> None:
+        # Runs on self.loop.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float | None = None) -> Event | None:
+        """Next event; None once the broadcaster closes. Raises
+        asyncio.TimeoutError if nothing arrives within `timeout`."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class Broadcaster:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._recent: deque[Event] = deque(maxlen=REPLAY_EVENTS)
+        self._subs: set[Subscription] = set()
+        self._closed = False
+
+    def publish(self, kind: str, data: dict | None = None) -> Event:
+        """Queue an event for every subscriber. Thread-safe, never blocks."""
+        with self._lock:
+            event = Event(next(self._ids), kind, data or {})
+            self._recent.append(event)
+            subs = list(self._subs)
+        for sub in subs:
+            _deliver(sub, event)
+        return event
+
+    def subscribe(self, last_event_id: int | None = None) -> Subscription:
+        """Register a subscriber on the running loop. With `last_event_id`,
+        events after it that are still in the replay ring come first."""
+        sub = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            if self._closed:
+                sub._put(None)
+                return sub
+            if last_event_id is not None:
+                for event in self._recent:
+                    if event.id > last_event_id:
+                        sub._put(event)
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subs.discard(sub)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subs)
+
+    def close(self) -> None:
+        """End every open stream (app shutdown)."""
+        with self._lock:
+            self._closed = True
+            subs, self._subs = list(self._subs), set()
+        for sub in subs:
+            _deliver(sub, None)
+
+
+def _deliver(sub: Subscription, event: Event | None) -> None:
+    try:
+        sub.loop.call_soon_threadsafe(sub._put, event)
+    except RuntimeError:
+        # Loop already closed; the subscriber is gone with it.
+        pass
@@ -0,0 +1,111 @@
+"""Local stand-in for Strava's webhook delivery.
+
+Builds events in the exact shape Strava POSTs to a push-subscription
+callback, and can replay the subscription challenge. Used by the tests to
+feed the inbound queue, and by hand against a dev server:
+
+    python fake_strava_events.py http://localhost:8000 12345678901
+    python fake_strava_events.py http://localhost:8000 12345678901 --aspect update
+    python fake_strava_events.py http://localhost:8000 --challenge <verify_token>
+
+The subscription id must match the one stored in State
+(`strava_subscription_id`) or the service acknowledges and drops the event.
+"""
+
+from __future__ import annotations
+
+import argparse
+import secrets
+import time
+
+
+def activity_event(
+    activity_id: int | str,
+    aspect_type: str = "create",
+    subscription_id: int | str = 1,
+    owner_id: int | str = 1,
+    updates: dict | None = None,
+    event_time: int | None = None,
+) -> dict:
+    """An `activity` event as Strava sends it."""
+    return {
+        "aspect_type": aspect_type,
+        "event_time": event_time or int(time.time()),
+        "object_id": int(activity_id),
+        "object_type": "activity",
+        "owner_id": int(owner_id),
+        "subscription_id": int(subscription_id),
+        "updates": updates or {},
+    }
+
+
+def deauthorize_event(
+    subscription_id: int | str = 1, owner_id: int | str = 1
+) -> dict:
+    """The `athlete` update Strava sends when the user revokes access."""
+    return {
+        "aspect_type": "update",
+        "event_time": int(time.time()),
+        "object_id": int(owner_id),
+        "object_type": "athlete",
+        "owner_id": int(owner_id),
+        "subscription_id": int(subscription_id),
+        "updates": {"authorized": "false"},
+    }
+
+
+def send(base_url: str, event: dict, timeout: float = 5.0) -> int:
+    """POST one event to the service. Returns the HTTP status."""
+    import requests
+
+    r = requests.post(
+        f"{base_url.rstrip('/')}/webhook/strava", json=event, timeout=timeout
+    )
+    return r.status_code
+
+
+def challenge(base_url: str, verify_token: str, timeout: float = 5.0) -> bool:
+    """Replay the subscription-creation challenge. True iff echoed back."""
+    import requests
+
+    token = secrets.token_hex(8)
+    r = requests.get(
+        f"{base_url.rstrip('/')}/webhook/strava",
+        params={
+            "hub.mode": "subscribe",
+            "hub.verify_token": verify_token,
+            "hub.challenge": token,
+        },
+        timeout=timeout,
+    )
+    return r.status_code == 200 and r.json().get("hub.challenge") == token
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("base_url")
+    p.add_argument("activity_id", nargs="?")
+    p.add_argument("--aspect", default="create", choices=["create", "update", "delete"])
+    p.add_argument("--subscription-id", default="1")
+    p.add_argument("--owner-id", default="1")
+    p.add_argument("--challenge", metavar="VERIFY_TOKEN")
+    p.add_argument("--deauthorize", action="store_true")
+    args = p.parse_args()
+
+    if args.challenge:
+        ok = challenge(args.base_url, args.challenge)
+        print("challenge", "ok" if ok else "FAILED")
+        return
+    if args.deauthorize:
+        event = deauthorize_event(args.subscription_id, args.owner_id)
+    elif args.activity_id:
+        event = activity_event(
+            args.activity_id, args.aspect, args.subscription_id, args.owner_id
+        )
+    else:
+        p.error("activity_id, --challenge or --deauthorize required")
+    print(send(args.base_url, event))
+
+
+if __name__ == "__main__":
+    main()
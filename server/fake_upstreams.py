@@ -0,0 +1,354 @@
+"""Local stand-ins for the Strava and Hevy HTTP APIs.
+
+Each fake is a small threaded HTTP server that answers the endpoints the
+service calls, in the shapes the real APIs use, with knobs for what a load
+test wants to vary:
+
+  latency / jitter   seconds added to every response (uniform ± jitter)
+  error_rate         fraction of data requests answered with a 500
+  rate limit         (Strava) X-RateLimit-* headers counted from the
+                     requests served, and 429s once the short window is
+                     spent
+
+route_to() points a requests.Session at them, so StravaClient and
+HevyClient run unmodified — stravalib included. Used by bench.py, and by
+hand:
+
+    python fake_upstreams.py --activities 200 --latency 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+STRAVA_HOST = "www.strava.com"
+HEVY_HOST = "api.hevyapp.com"
+
+# Strava's published default quotas (short window, daily).
+DEFAULT_RATE_LIMIT = (200, 2000)
+
+
+class FakeUpstream:
+    """Threaded HTTP server with latency, error injection and counters.
+
+    Subclasses implement handle(method, path, query, body) returning
+    (status, json_body, extra_headers) or None for a 404.
+    """
+
+    name = "upstream"
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors_injected": 0, "rate_limited": 0}
+        self._server: ThreadingHTTPServer | None = None
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────
+    def start(self, port: int = 0) -> str:
+        """Serve on 127.0.0.1:`port` (0 = any free port); returns the base URL."""
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _handler_for(self))
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, name=f"fake-{self.name}", daemon=True
+        ).start()
+        return self.url
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # ── Request plumbing ──────────────────────────────────────────────────
+    def respond(
+        self, method: str, path: str, query: dict, body: dict | None
+    ) -> tuple[int, object, dict]:
+        with self._lock:
+            self.stats["requests"] += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            fail = self._injectable(path) and self._rng.random() < self.error_rate
+            if fail:
+                self.stats["errors_injected"] += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return 500, {"message": "injected error"}, {}
+        out = self.handle(method, path, query, body)
+        if out is None:
+            return 404, {"message": "Record Not Found"}, {}
+        return out
+
+    def _injectable(self, path: str) -> bool:
+        """Token endpoints are exempt so a run doesn't stall on auth."""
+        return "token" not in path
+
+    def handle(self, method, path, query, body):
+        raise NotImplementedError
+
+
+class FakeStrava(FakeUpstream):
+    """Strava API v3 subset: activity list, detail, streams, token refresh.
+
+    `activities` synthetic activities start an hour apart, the newest
+    `newest_age` seconds ago; every one has a heart-rate stream of one
+    sample per second.
+    """
+
+    name = "strava"
+    TYPES = ("Run", "Ride", "Walk")
+
+    def __init__(
+        self,
+        activities: int = 50,
+        newest_age: int = 3600,
+        rate_limit: tuple[int, int] = DEFAULT_RATE_LIMIT,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.rate_limit = rate_limit
+        self._usage = [0, 0]
+        newest = int(time.time()) - newest_age
+        self.activities = {
+            1000 + i: self._activity(1000 + i, newest - i * 3600)
+            for i in range(activities)
+        }
+
+    def _activity(self, aid: int, start_ts: int) -> dict:
+        atype = self.TYPES[aid % len(self.TYPES)]
+        moving = 1800 + (aid % 7) * 300
+        return {
+            "id": aid,
+            "resource_state": 3,
+            "name": f"{atype} {aid}",
+            "type": atype,
+            "sport_type": atype,
+            "start_date": _iso(start_ts),
+            "start_date_local": _iso(start_ts),
+            "timezone": "(GMT+00:00) Europe/London",
+            "distance": moving * (2.8 if atype == "Run" else 7.5 if atype == "Ride" else 1.4),
+            "moving_time": moving,
+            "elapsed_time": moving + 60,
+            "total_elevation_gain": 12.0,
+            "private": False,
+            "has_heartrate": True,
+            "average_heartrate": 142.0,
+            "max_heartrate": 171.0,
+            "calories": 420.0,
+            "device_name": "Fake Watch",
+            "description": None,
+        }
+
+    def respond(self, method, path, query, body):
+        # Token exchange isn't metered by Strava.
+        if path.startswith("/oauth/"):
+            return super().respond(method, path, query, body)
+        with self._lock:
+            short_limit, daily_limit = self.rate_limit
+            over = self._usage[0] >= short_limit or self._usage[1] >= daily_limit
+            if over:
+                self.stats["rate_limited"] += 1
+            else:
+                self._usage[0] += 1
+                self._usage[1] += 1
+            headers = {
+                "X-RateLimit-Limit": f"{short_limit},{daily_limit}",
+                "X-RateLimit-Usage": f"{self._usage[0]},{self._usage[1]}",
+            }
+        if over:
+            return 429, {"message": "Rate Limit Exceeded"}, headers
+        status, payload, extra = super().respond(method, path, query, body)
+        return status, payload, {**headers, **extra}
+
+    def handle(self, method, path, query, body):
+        if method == "POST" and path == "/oauth/token":
+            return 200, {
+                "token_type": "Bearer",
+                "access_token": _token("strava-access"),
+                "refresh_token": _token("strava-refresh"),
+                "expires_at": int(time.time()) + 6 * 3600,
+                "expires_in": 6 * 3600,
+            }, {}
+        if method != "GET":
+            return None
+        if path == "/api/v3/athlete/activities":
+            after = int(query.get("after", ["0"])[0])
+            per_page = int(query.get("per_page", ["30"])[0])
+            page = int(query.get("page", ["1"])[0])
+            rows = sorted(
+                (a for a in self.activities.values() if _epoch(a["start_date"]) > after),
+                key=lambda a: a["start_date"],
+            )
+            rows = rows[(page - 1) * per_page : page * per_page]
+            return 200, [_summary_fields(a) for a in rows], {}
+        m = re.fullmatch(r"/api/v3/activities/(\d+)(/streams)?", path)
+        if not m or int(m.group(1)) not in self.activities:
+            return None
+        activity = self.activities[int(m.group(1))]
+        if not m.group(2):
+            return 200, activity, {}
+        n = activity["moving_time"]
+        hr = [int(130 + 25 * ((t // 60) % 5) / 4 + (t % 7)) for t in range(n)]
+        stream = {"series_type": "time", "original_size": n, "resolution": "high"}
+        return 200, {
+            "time": {"data": list(range(n)), **stream},
+            "heartrate": {"data": hr, **stream},
+        }, {}
+
+
+class FakeHevy(FakeUpstream):
+    """Hevy private API subset: token refresh, account, workout POST/PUT
+    (409 on a repeat POST, like the real one) and workouts_sync_batch."""
+
+    name = "hevy"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.workouts: dict[str, dict] = {}
+
+    def handle(self, method, path, query, body):
+        if method == "POST" and path == "/auth/refresh_token":
+            expires = datetime.now(timezone.utc) + timedelta(minutes=15)
+            return 200, {
+                "access_token": _token("hevy-access"),
+                "refresh_token": _token("hevy-refresh"),
+                "expires_at": expires.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+            }, {}
+        if method == "GET" and path == "/account":
+            return 200, {"id": "bench-user", "username": "bench"}, {}
+        if method == "POST" and path == "/v2/workout":
+            workout = body["workout"]
+            with self._lock:
+                if workout["workout_id"] in self.workouts:
+                    return 409, {"error": "exists"}, {}
+                self.workouts[workout["workout_id"]] = workout
+            return 200, {"id": workout["workout_id"]}, {}
+        m = re.fullmatch(r"/v2/workout/([\w-]+)", path)
+        if method == "PUT" and m:
+            with self._lock:
+                self.workouts[m.group(1)] = body["workout"]
+            return 200, {"id": m.group(1)}, {}
+        if method == "POST" and path == "/workouts_sync_batch":
+            return 200, {"updated": [], "deleted": [], "isMore": False}, {}
+        return None
+
+
+def route_to(session: requests.Session, hosts: dict[str, str]) -> None:
+    """Send `session`'s requests for each host in `hosts` (e.g.
+    {"www.strava.com": fake.url}) to the mapped base URL instead."""
+    session.mount("https://", _RedirectAdapter(hosts))
+    session.mount("http://", _RedirectAdapter(hosts))
+
+
+class _RedirectAdapter(HTTPAdapter):
+    def __init__(self, hosts: dict[str, str]):
+        super().__init__(pool_maxsize=16)
+        self._hosts = {h: urlsplit(u) for h, u in hosts.items()}
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        target = self._hosts.get(parts.hostname or "")
+        if target is not None:
+            request.url = urlunsplit(
+                (target.scheme, target.netloc, parts.path, parts.query, "")
+            )
+        return super().send(request, **kwargs)
+
+
+def _handler_for(upstream: FakeUpstream):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _serve(self):
+            parts = urlsplit(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                body = json.loads(raw) if raw else None
+            except json.JSONDecodeError:
+                body = None
+            status, payload, headers = upstream.respond(
+                self.command, parts.path, parse_qs(parts.query), body
+            )
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_DELETE = _serve
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def _summary_fields(activity: dict) -> dict:
+    keep = (
+        "id", "name", "type", "sport_type", "start_date", "start_date_local",
+        "timezone", "distance", "moving_time", "elapsed_time", "private",
+        "has_heartrate", "average_heartrate", "max_heartrate",
+    )
+    return {k: activity[k] for k in keep} | {"resource_state": 2}
+
+
+def _iso(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _epoch(iso: str) -> int:
+    dt = datetime.strptime(iso, "%Y-%m-%dT%H:%M:%SZ")
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+
+def _token(prefix: str) -> str:
+    return f"{prefix}-{random.getrandbits(64):016x}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--strava-port", type=int, default=8701)
+    parser.add_argument("--hevy-port", type=int, default=8702)
+    parser.add_argument("--activities", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    knobs = {"latency": args.latency, "error_rate": args.error_rate}
+    strava = FakeStrava(activities=args.activities, **knobs)
+    hevy = FakeHevy(**knobs)
+    print("strava:", strava.start(args.strava_port))
+    print("hevy:  ", hevy.start(args.hevy_port))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        strava.stop()
+        hevy.stop()
@@ -8,10 +8,13 @@ on every refresh — we persist the new one each time.
 from __future__ import annotations
 
 import json
-from datetime import datetime, timezone
+import threading
+from datetime import datetime, timedelta, timezone
 
 import requests
+from requests.adapters import HTTPAdapter
 
+from metrics import TOKEN_REFRESHES, requests_hook
 from state import State
 
 
@@ -21,6 +24,12 @@ BASIC_HEADERS = {
     "accept-encoding": "gzip",
 }
 
+# Refresh this long before `expires_at`, so a token never lapses mid-request
+# and a slow clock doesn't cost a 401 round trip.
+REFRESH_AHEAD_SECONDS = 300
+# Keep-alive connections held open to api.hevyapp.com.
+POOL_SIZE = 4
+
 
 class HevyError(Exception):
     pass
@@ -29,6 +38,15 @@ class HevyError(Exception):
 class HevyClient:
     def __init__(self, state: State):
         self.state = state
+        # One pooled session for every request; only the bearer changes.
+        self._session = requests.Session()
+        self._session.headers.update(BASIC_HEADERS)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self._session.mount("https://", adapter)
+        self._session.hooks["response"].append(requests_hook("hevy"))
+        # Hevy rotates the refresh token, so two refreshes racing would leave
+        # one of them holding a dead token. Serialise them.
+        self._refresh_lock = threading.Lock()
 
     def is_authorized(self) -> bool:
         return bool(self.state.get("hevy_refresh_token"))
@@ -60,27 +78,44 @@ class HevyClient:
         )
 
     def _refresh_if_needed(self) -> str:
-        """Return a valid access token, refreshing first if needed."""
+        """Return a valid access token, refreshing first if needed.
+
+        Single-flight: concurrent callers that find the token stale queue on
+        the lock, and all but the first see the fresh token on re-read.
+        """
+        token = self._current_token()
+        if token:
+            return token
+        with self._refresh_lock:
+            token = self._current_token()
+            if token:
+                return token
+            return self._refresh(self.state.get("hevy_refresh_token"))
+
+    def _current_token(self) -> str | None:
+        """The stored access token, or None if it is due for refresh."""
+        if not self.state.get("hevy_refresh_token"):
+            raise HevyError("Hevy not authorized — paste tokens first")
         access_token = self.state.get("hevy_access_token")
-        refresh_token = self.state.get("hevy_refresh_token")
         expires_at = self.state.get("hevy_token_expires_at")
-        if not refresh_token:
-            raise HevyError("Hevy not authorized — paste tokens first")
-
-        if access_token and expires_at and not _is_expired(expires_at):
+        if access_token and expires_at and not _is_expired(
+            expires_at, REFRESH_AHEAD_SECONDS
+        ):
             return access_token
-        return self._refresh(refresh_token)
+        return None
 
     def _refresh(self, refresh_token: str) -> str:
-        s = requests.Session()
-        s.headers.update(BASIC_HEADERS)
-        r = s.post(
+        r = self._session.post(
             "https://api.hevyapp.com/auth/refresh_token",
             json={"refresh_token": refresh_token},
+            # Don't send the stale bearer along with the refresh.
+            headers={"Authorization": None},
             timeout=15,
         )
         if r.status_code != 200:
+            TOKEN_REFRESHES.inc(upstream="hevy", outcome="failed")
             raise HevyError(f"Token refresh failed: {r.status_code} {r.text[:200]}")
+        TOKEN_REFRESHES.inc(upstream="hevy", outcome="succeeded")
         data = r.json()
         # Hevy rotates refresh tokens — persist the new pair atomically.
         self.state.set_many(
@@ -94,10 +129,8 @@ class HevyClient:
 
     def _auth_session(self) -> requests.Session:
         token = self._refresh_if_needed()
-        s = requests.Session()
-        s.headers.update(BASIC_HEADERS)
-        s.headers["Authorization"] = f"Bearer {token}"
-        return s
+        self._session.headers["Authorization"] = f"Bearer {token}"
+        return self._session
 
     def account(self) -> dict:
         s = self._auth_session()
@@ -123,10 +156,50 @@ class HevyClient:
         except HevyError:
             return None
 
+    def sync_workouts(self, max_rounds: int = 50) -> dict:
+        """Bring State's workout mirror up to date.
+
+        Same protocol as hevy_api.workouts_sync_batch: post {id: updated_at}
+        for everything we hold, get back the workouts that changed or are
+        new plus the ids deleted, and repeat while Hevy says isMore. Only
+        changed workouts cross the wire.
+        """
+        s = self._auth_session()
+        updated = deleted = rounds = 0
+        more = True
+        while more and rounds < max_rounds:
+            r = s.post(
+                "https://api.hevyapp.com/workouts_sync_batch",
+                data=json.dumps(
+                    self.state.hevy_workout_versions(), separators=(",", ":")
+                ),
+                timeout=60,
+            )
+            if r.status_code != 200:
+                raise HevyError(f"workouts_sync_batch failed: {r.status_code}")
+            data = r.json()
+            self.state.apply_hevy_sync(
+                data.get("updated") or [], data.get("deleted") or []
+            )
+            updated += len(data.get("updated") or [])
+            deleted += len(data.get("deleted") or [])
+            rounds += 1
+            more = bool(data.get("isMore"))
+        self.state.set(
+            "hevy_mirror_synced_at",
+            datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        )
+        return {
+            "updated": updated,
+            "deleted": deleted,
+            "rounds": rounds,
+            "complete": not more,
+        }
+
     def submit_workout(self, payload: dict, workout_id: str) -> int:
         """POST then PUT-on-409 mirror of strava_api.import_activity:335-346."""
         s = self._auth_session()
-        body = json.dumps(payload)
+        body = json.dumps(payload, separators=(",", ":"))
         r = s.post("https://api.hevyapp.com/v2/workout", data=body, timeout=30)
         if r.status_code == 409:
             r = s.put(
@@ -137,10 +210,12 @@ class HevyClient:
         return r.status_code
 
 
-def _is_expired(expires_at: str) -> bool:
-    """Hevy stores `expires_at` as ISO 8601 UTC string (e.g. 2026-05-12T13:00:00.123Z)."""
+def _is_expired(expires_at: str, margin_seconds: int = 0) -> bool:
+    """Hevy stores `expires_at` as ISO 8601 UTC string (e.g. 2026-05-12T13:00:00.123Z).
+
+    True if the token expires within `margin_seconds` from now.
+    """
     if not expires_at:
         return True
-    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
-    # 30s skew margin.
-    return expires_at <= now
+    soon = datetime.now(timezone.utc) + timedelta(seconds=margin_seconds)
+    return expires_at <= soon.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
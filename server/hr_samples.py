@@ -0,0 +1,156 @@
+"""Heart-rate stream downsampling for Hevy workout payloads.
+
+Strava's `time` / `heartrate` streams carry one sample per recorded second
+or so, which for a 3-hour ride is 10k+ points. Hevy only draws them as a
+chart, so build_hevy_workout sends a reduced series chosen by the
+`hr_downsample` setting:
+
+  none      every sample (the desktop client's behaviour)
+  interval  first sample in each INTERVAL_SECONDS bucket
+  lttb      largest-triangle-three-buckets down to LTTB_POINTS — keeps the
+            visual shape of the curve, spikes included
+  change    a sample whenever HR moves into a different CHANGE_BPM band,
+            i.e. a step function that only records changes
+
+Every method also keeps the first and last samples and the global min and
+max, so the min/max Hevy derives from the series always match Strava's.
+
+Run as a script for a size report on a synthetic ride, or on a streams dump
+(`{"time": [...], "heartrate": [...]}`):
+
+    python hr_samples.py [streams.json]
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+
+import numpy as np
+
+
+METHODS = ("none", "interval", "lttb", "change")
+DEFAULT_METHOD = "lttb"
+
+INTERVAL_SECONDS = 5
+LTTB_POINTS = 720
+CHANGE_BPM = 4
+
+
+def downsample(t: np.ndarray, bpm: np.ndarray, method: str = DEFAULT_METHOD) -> np.ndarray:
+    """Return the sorted indices of the samples to keep."""
+    n = len(t)
+    if method not in METHODS:
+        raise ValueError(f"unknown downsample method {method!r}")
+    if method == "none" or n <= 2:
+        return np.arange(n)
+    if method == "interval":
+        bucket = (t - t[0]) // INTERVAL_SECONDS
+        keep = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    elif method == "lttb":
+        keep = _lttb(t, bpm, LTTB_POINTS)
+    else:
+        band = bpm // CHANGE_BPM
+        keep = np.flatnonzero(np.r_[True, band[1:] != band[:-1]])
+    anchors = [0, n - 1, int(np.argmin(bpm)), int(np.argmax(bpm))]
+    return np.union1d(keep, anchors)
+
+
+def heart_rate_samples(
+    start_ts: float, time_s, bpm, method: str = DEFAULT_METHOD
+) -> list[dict]:
+    """Hevy `heart_rate_samples` entries for a Strava time/heartrate stream
+    pair, downsampled with `method`."""
+    t, hr = _as_arrays(time_s, bpm)
+    keep = downsample(t, hr, method)
+    timestamps_ms = ((start_ts + t[keep]) * 1000).astype(np.int64)
+    return [
+        {"timestamp_ms": ts, "bpm": b}
+        for ts, b in zip(timestamps_ms.tolist(), hr[keep].tolist())
+    ]
+
+
+def stats(t: np.ndarray, bpm: np.ndarray) -> dict:
+    """min / max / time-weighted mean of a series drawn as a step function."""
+    dt = np.diff(t)
+    if len(t) >= 2 and dt.sum() > 0:
+        avg = float(np.average(bpm[:-1], weights=dt))
+    else:
+        avg = float(bpm.mean())
+    return {"min": int(bpm.min()), "max": int(bpm.max()), "avg": round(avg, 1)}
+
+
+def report(time_s, bpm, start_ts: float = 0) -> list[dict]:
+    """Samples, encoded bytes and HR stats per method, for comparing them."""
+    t, hr = _as_arrays(time_s, bpm)
+    rows = []
+    for method in METHODS:
+        keep = downsample(t, hr, method)
+        body = json.dumps(
+            heart_rate_samples(start_ts, t, hr, method), separators=(",", ":")
+        )
+        rows.append(
+            {"method": method, "samples": len(keep), "bytes": len(body)}
+            | stats(t[keep], hr[keep])
+        )
+    return rows
+
+
+def _as_arrays(time_s, bpm) -> tuple[np.ndarray, np.ndarray]:
+    # Strava occasionally returns streams of unequal length; the desktop
+    # client indexed by the time stream, so trim to the shorter one. Samples
+    # with a gap (None) in either stream are dropped with their timestamp.
+    n = min(len(time_s), len(bpm))
+    t = np.asarray(time_s[:n], dtype=object)
+    b = np.asarray(bpm[:n], dtype=object)
+    keep = (t != None) & (b != None)  # noqa: E711 (elementwise)
+    return t[keep].astype(np.float64), b[keep].astype(np.int64)
+
+
+def _lttb(t: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    n = len(t)
+    if points >= n or points < 3:
+        return np.arange(n)
+    y = y.astype(np.float64)
+    # Interior samples split into points - 2 buckets; first and last fixed.
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    keep = np.empty(points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        # Average of the next bucket is the third triangle vertex.
+        nlo, nhi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        if nhi <= nlo:
+            nlo, nhi = n - 1, n
+        ct, cy = t[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs(
+            (t[a] - ct) * (y[lo:hi] - y[a]) - (t[a] - t[lo:hi]) * (cy - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def _synthetic_ride(hours: float = 3.0, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    t = np.arange(0, int(hours * 3600), 1)
+    base = 135 + 20 * np.sin(t / 900.0) + 10 * np.sin(t / 97.0)
+    return t, np.round(base + rng.normal(0, 2, len(t))).astype(np.int64)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            streams = json.load(f)
+        time_s, bpm = streams["time"], streams["heartrate"]
+    else:
+        time_s, bpm = _synthetic_ride()
+    rows = report(time_s, bpm)
+    full = rows[0]["bytes"]
+    print(f"{'method':<9} {'samples':>8} {'bytes':>9} {'size':>6}  min  max    avg")
+    for r in rows:
+        print(
+            f"{r['method']:<9} {r['samples']:>8} {r['bytes']:>9} "
+            f"{r['bytes'] / full:>6.1%}  {r['min']:>3}  {r['max']:>3}  {r['avg']:>5}"
+        )
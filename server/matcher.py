@@ -29,10 +29,20 @@ distance  Σ(set.distance_meters) vs activity.distance. Same shape as
 
 Skipped dimensions are dropped from the weighted average rather than counted
 as 1.0, so we don't artificially inflate the score when data is missing.
+
+Batch matching
+--------------
+match_many() matches a whole backfill at once. A CandidateIndex keeps the
+Hevy workouts sorted by start time plus an inverted template-id → workout
+index, so each Strava activity only scores candidates that pass the type
+gate and could clear REVIEW_THRESHOLD. With the weights above a score of
+0.60 needs time >= 1/3, i.e. |Δstart| within TIME_CUTOFF_SECONDS or
+overlapping intervals; everything else is provably a rejection.
 """
 
 from __future__ import annotations
 
+import bisect
 import math
 from dataclasses import dataclass
 from datetime import datetime, timezone
@@ -68,7 +78,7 @@ DEFAULT_TYPE_TEMPLATE_IDS: dict[str, set[str]] = {
 
 # Time scoring: linear decay over a 30-minute window centered on Δstart=0.
 # Anything beyond this is considered a different workout.
-_TIME_CUTOFF_SECONDS = 30 * 60
+TIME_CUTOFF_SECONDS = 30 * 60
 
 
 @dataclass(frozen=True)
@@ -151,7 +161,7 @@ class MatchResult:
     rejected: tuple[MatchScore, ...]
 
 
-def _to_epoch(value: Any) -> int:
+def to_epoch(value: Any) -> int:
     """Coerce int / float / ISO-8601 string to UTC epoch seconds.
 
     Hevy's internal app API returns Unix seconds for `start_time`/`end_time`
@@ -225,10 +235,12 @@ def summarize_hevy(workout_json: dict) -> HevyWorkoutSummary:
         )
 
     total_dur = sum(e.duration_seconds for e in exercises)
-    start_ts = _to_epoch(w.get("start_time"))
-    end_ts = _to_epoch(w.get("end_time")) or (start_ts + total_dur)
+    start_ts = to_epoch(w.get("start_time"))
+    end_ts = to_epoch(w.get("end_time")) or (start_ts + total_dur)
 
-    workout_id = str(w.get("workout_id") or "")
+    # Submit payloads carry `workout_id`; workouts read back from Hevy
+    # (workouts_sync_batch, feeds) carry the same value as `id`.
+    workout_id = str(w.get("workout_id") or w.get("id") or "")
     if not workout_id:
         raise ValueError("Hevy workout payload is missing workout_id")
 
@@ -282,7 +294,7 @@ def _type_score(
 
 def _time_score(strava: StravaSummary, hevy: HevyWorkoutSummary) -> float:
     start_diff = abs(strava.start_ts - hevy.start_ts)
-    start_score = max(0.0, 1.0 - start_diff / _TIME_CUTOFF_SECONDS)
+    start_score = max(0.0, 1.0 - start_diff / TIME_CUTOFF_SECONDS)
 
     strava_end = strava.start_ts + max(strava.moving_seconds, 0)
     interval_start = max(strava.start_ts, hevy.start_ts)
@@ -391,11 +403,89 @@ def best_match(
     REVIEW_THRESHOLD, sorted desc. Rejected holds anything else that at
     least passed the type gate.
     """
+    return _bucket(score(strava, hevy, type_map=type_map) for hevy in candidates)
+
+
+class CandidateIndex:
+    """Hevy workouts indexed for repeated matching.
+
+    Build once per backfill and query per Strava activity. candidates_for()
+    returns, in input order, the workouts that share an exercise template
+    with the activity's type and whose start lies in the window where a
+    non-zero time score is possible — so best_match() over that subset has
+    the same auto_merge and review buckets as over the full list.
+    """
+
+    def __init__(
+        self,
+        candidates: Iterable[HevyWorkoutSummary],
+        type_map: dict[str, set[str]] | None = None,
+    ):
+        self.type_map = type_map or DEFAULT_TYPE_TEMPLATE_IDS
+        self.workouts = list(candidates)
+        self._order = sorted(
+            range(len(self.workouts)), key=lambda i: self.workouts[i].start_ts
+        )
+        self._starts = [self.workouts[i].start_ts for i in self._order]
+        # Longest workout bounds how far back an overlapping one can start.
+        self._max_span = max(
+            (max(0, w.end_ts - w.start_ts) for w in self.workouts), default=0
+        )
+        self._by_template: dict[str, set[int]] = {}
+        for i, w in enumerate(self.workouts):
+            for tid in w.exercise_template_ids:
+                self._by_template.setdefault(tid, set()).add(i)
+
+    def candidates_for(self, strava: StravaSummary) -> list[HevyWorkoutSummary]:
+        typed = self._typed(strava)
+        if not typed:
+            return []
+        strava_end = strava.start_ts + max(strava.moving_seconds, 0)
+        lo = bisect.bisect_left(
+            self._starts,
+            strava.start_ts - max(TIME_CUTOFF_SECONDS, self._max_span),
+        )
+        hi = bisect.bisect_right(
+            self._starts, max(strava.start_ts + TIME_CUTOFF_SECONDS, strava_end)
+        )
+        hits = sorted(i for i in self._order[lo:hi] if i in typed)
+        return [self.workouts[i] for i in hits]
+
+    def _typed(self, strava: StravaSummary) -> set[int]:
+        typed: set[int] = set()
+        for tid in self.type_map.get(strava.activity_type) or ():
+            typed |= self._by_template.get(tid, set())
+        return typed
+
+
+def match_many(
+    stravas: Iterable[StravaSummary],
+    candidates: Iterable[HevyWorkoutSummary] | CandidateIndex,
+    type_map: dict[str, set[str]] | None = None,
+) -> dict[str, MatchResult]:
+    """best_match() for many Strava activities, keyed by activity_id.
+
+    Each activity is scored only against CandidateIndex.candidates_for(),
+    so auto_merge and review are identical to calling best_match() with the
+    full candidate list. rejected is limited to that window: workouts of the
+    activity's type starting too far away to match are not listed.
+    """
+    index = (
+        candidates
+        if isinstance(candidates, CandidateIndex)
+        else CandidateIndex(candidates, type_map)
+    )
+    return {
+        s.activity_id: best_match(s, index.candidates_for(s), index.type_map)
+        for s in stravas
+    }
+
+
+def _bucket(scores: Iterable[MatchScore]) -> MatchResult:
     scored: list[MatchScore] = []
     rejected: list[MatchScore] = []
 
-    for hevy in candidates:
-        s = score(strava, hevy, type_map=type_map)
+    for s in scores:
         if s.type_score == 0.0:
             # Type-gated out; not interesting even for debugging callers.
             continue
@@ -0,0 +1,243 @@
+"""Prometheus-style metrics for the import service, served at /metrics.
+
+A deliberately small in-process registry (counters, gauges, histograms with
+labels, text exposition format 0.0.4) rather than a prometheus_client
+dependency: the service is one process with one registry, and everything
+here is a few dict updates under a lock.
+
+Metrics are module-level so the code that records them just imports them:
+
+    from metrics import IMPORTS
+    IMPORTS.inc(source="poller", outcome="succeeded")
+
+    with POLL_SECONDS.time(trigger="schedule"):
+        ...
+
+Gauges whose value lives elsewhere (queue depth, budget) are refreshed by
+app.py right before each scrape.
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Sequence
+from urllib.parse import urlsplit
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# SQLite calls and lock waits are sub-millisecond when healthy.
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+SLOW_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_registry: list[_Metric] = []
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[k]) for k in self.labels)
+
+    def _series(self, key: tuple, suffix: str = "", extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return f"{self.name}{suffix}" + (f"{{{','.join(pairs)}}}" if pairs else "")
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return super().render() + [f"{self._series(k)} {_num(v)}" for k, v in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key → ([count per bucket..., +Inf], sum)
+        self._values: dict[tuple, tuple[list[int], float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe the wall time of the with-block, exceptions included."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels)) or ([0], 0.0)
+            return sum(counts)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted((k, (list(c), s)) for k, (c, s) in self._values.items())
+        lines = super().render()
+        for key, (counts, total) in values:
+            running = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                running += n
+                le = "+Inf" if bound == math.inf else _num(bound)
+                series = self._series(key, "_bucket", 'le="%s"' % le)
+                lines.append(f"{series} {running}")
+            lines.append(f"{self._series(key, '_sum')} {_num(total)}")
+            lines.append(f"{self._series(key, '_count')} {running}")
+        return lines
+
+
+def render() -> str:
+    """Every registered metric in Prometheus text format."""
+    lines: list[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def requests_hook(upstream: str):
+    """A requests response hook recording latency and status for `upstream`:
+    session.hooks["response"].append(requests_hook("strava"))."""
+
+    def hook(response, *args, **kwargs):
+        method = response.request.method
+        UPSTREAM_SECONDS.observe(
+            response.elapsed.total_seconds(),
+            upstream=upstream,
+            method=method,
+            endpoint=endpoint(urlsplit(response.url).path),
+        )
+        UPSTREAM_REQUESTS.inc(
+            upstream=upstream, method=method, status=response.status_code
+        )
+
+    return hook
+
+
+def endpoint(path: str) -> str:
+    """Low-cardinality label for an upstream URL path: ids become {id}."""
+    return _ID_SEGMENT.sub("/{id}", path) or "/"
+
+
+_ID_SEGMENT = re.compile(r"/(?:\d+|[0-9a-fA-F]{8}-[0-9a-fA-F-]{27})(?=/|$)")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _num(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# ── Service metrics ───────────────────────────────────────────────────────
+POLL_SECONDS = Histogram(
+    "utb_poll_duration_seconds",
+    "Wall time of one poll cycle (list + enqueue + drain).",
+    ["trigger"],
+    SLOW_BUCKETS,
+)
+UPSTREAM_SECONDS = Histogram(
+    "utb_upstream_request_duration_seconds",
+    "Upstream HTTP latency to response headers.",
+    ["upstream", "method", "endpoint"],
+)
+UPSTREAM_REQUESTS = Counter(
+    "utb_upstream_requests_total",
+    "Upstream HTTP responses by status code.",
+    ["upstream", "method", "status"],
+)
+TOKEN_REFRESHES = Counter(
+    "utb_token_refreshes_total",
+    "OAuth token refreshes performed.",
+    ["upstream", "outcome"],
+)
+IMPORTS = Counter(
+    "utb_imports_total",
+    "Import attempts by how they ended.",
+    ["source", "outcome"],
+)
+MATCHER_SECONDS = Histogram(
+    "utb_matcher_seconds",
+    "Batch match scoring time.",
+    ["op"],
+)
+SQLITE_SECONDS = Histogram(
+    "utb_sqlite_call_seconds",
+    "State connection time per call, lock wait excluded.",
+    ["kind"],
+    FAST_BUCKETS,
+)
+SQLITE_LOCK_WAIT = Histogram(
+    "utb_sqlite_lock_wait_seconds",
+    "Time writers queued on State's write lock.",
+    [],
+    FAST_BUCKETS,
+)
+QUEUE_DEPTH = Gauge(
+    "utb_queue_depth",
+    "Rows waiting in State's queues.",
+    ["queue"],
+)
+STRAVA_BUDGET_REMAINING = Gauge(
+    "utb_strava_budget_remaining",
+    "Strava requests left in each rate-limit window.",
+    ["window"],
+)
+SSE_SUBSCRIBERS = Gauge(
+    "utb_sse_subscribers",
+    "Open /api/events streams.",
+)
@@ -1,15 +1,50 @@
-"""Background polling loop for Strava → Hevy auto-import."""
+"""Background polling loop for Strava → Hevy auto-import.
+
+Two ways activities arrive:
+  - push: Strava webhook events queued in State by app.py, drained on every
+    tick (the route kicks the loop so that's within seconds of upload);
+  - poll: lists only activities newer than a persisted cursor (start time
+    and id of the newest activity seen), so a quiet poll is one request
+    however long the lookback is. With an active webhook subscription this
+    drops to a low-frequency pass that only catches events Strava failed to
+    deliver.
+
+The cursor can't see an activity uploaded late with an old start time, or
+an edit to one already imported, so once a day (and on every manual sync)
+a deep pass re-lists the whole lookback window instead and re-imports
+activities whose title or type changed since import.
+
+Either way the activity becomes a row in State's import_jobs table, and the
+actual build + submit happens when that table is drained. A failed attempt
+is rescheduled with exponential backoff and full jitter, and dead-lettered
+after MAX_ATTEMPTS, so a flaky upstream neither loses imports nor gets
+hammered in lockstep.
+
+Progress (fetched, building, submitted, deferred, error) and status
+changes are published to an events.Broadcaster for the dashboard's SSE
+stream.
+"""
 
 from __future__ import annotations
 
 import asyncio
 import logging
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
+from events import Broadcaster
 from hevy_client import HevyClient, HevyError
+from metrics import IMPORTS, POLL_SECONDS
+from rate_limit import BACKGROUND, URGENT
 from state import State
-from strava_client import StravaClient, StravaError
+from strava_client import (
+    ActivityTypeFiltered,
+    StravaClient,
+    StravaError,
+    StravaRateLimited,
+)
 
 
 log = logging.getLogger("poller")
@@ -24,17 +59,45 @@ class Poller:
     """
 
     TICK_SECONDS = 10
+    # Poll interval floor while a webhook subscription is active.
+    RECONCILE_SECONDS = 6 * 3600
+    DEEP_RECONCILE_SECONDS = 24 * 3600
+    # List pages per poll. After long downtime the cursor catches up over
+    # several polls rather than spending a burst of requests at once.
+    POLL_MAX_PAGES = 5
+    # Hevy workout mirror refresh (see HevyClient.sync_workouts).
+    HEVY_SYNC_SECONDS = 30 * 60
+    # Import jobs in flight at once. Small on purpose: each one holds two
+    # Strava requests and a Hevy POST.
+    JOB_CONCURRENCY = 2
+    JOBS_PER_DRAIN = 10
+    MAX_ATTEMPTS = 8
+    BACKOFF_BASE_SECONDS = 60
+    BACKOFF_CAP_SECONDS = 6 * 3600
 
-    def __init__(self, state: State, strava: StravaClient, hevy: HevyClient):
+    def __init__(
+        self,
+        state: State,
+        strava: StravaClient,
+        hevy: HevyClient,
+        events: Broadcaster | None = None,
+    ):
         self.state = state
         self.strava = strava
         self.hevy = hevy
+        self.events = events or Broadcaster()
         self._task: asyncio.Task | None = None
         self._wake = asyncio.Event()
         self._lock = asyncio.Lock()
+        self._hevy_lock = asyncio.Lock()
         self._stop = False
 
     def start(self):
+        requeued = self.state.requeue_running_jobs()
+        if requeued:
+            self.state.log(
+                "WARN", f"Requeued {requeued} import job(s) interrupted by restart"
+            )
         if self._task is None or self._task.done():
             self._task = asyncio.create_task(self._run(), name="strava-poller")
 
@@ -53,7 +116,10 @@ class Poller:
         self.state.log("INFO", "Poller started")
         while not self._stop:
             try:
+                await self.drain_webhooks()
+                await self.drain_jobs()
                 await self._maybe_poll()
+                await self._maybe_sync_hevy()
             except Exception as e:
                 log.exception("poll iteration failed")
                 self.state.log("ERROR", f"Poll iteration failed: {e}")
@@ -69,27 +135,66 @@ class Poller:
         if not self.state.get_bool("polling_enabled"):
             return
         interval = max(60, self.state.get_int("poll_interval_seconds", 600))
+        if self.webhook_active():
+            interval = max(interval, self.RECONCILE_SECONDS)
         last = self.state.get("last_poll_at_ts")
         now_ts = int(time.time())
         if last and (now_ts - int(last)) < interval:
             return
+        if self.strava.budget.would_defer(BACKGROUND):
+            # Near quota: leave last_poll_at_ts alone so we retry on a later
+            # tick once the window resets, without spending anything now.
+            log.debug("scheduled poll deferred — Strava budget low")
+            return
         await self.poll_once(triggered_by="schedule")
         self.state.set("last_poll_at_ts", str(now_ts))
 
+    async def _maybe_sync_hevy(self):
+        if not self.hevy.is_authorized():
+            return
+        last = self.state.get_int("last_hevy_sync_ts", 0)
+        if int(time.time()) - last < self.HEVY_SYNC_SECONDS:
+            return
+        await self.sync_hevy()
+
+    async def sync_hevy(self) -> dict:
+        """Refresh the Hevy workout mirror. Errors are logged, not raised."""
+        async with self._hevy_lock:
+            self.state.set("last_hevy_sync_ts", str(int(time.time())))
+            try:
+                result = await asyncio.to_thread(self.hevy.sync_workouts)
+            except Exception as e:
+                # HevyError, but also a payload the mirror can't take or a
+                # database error — none of these may stop the poller loop.
+                self.state.log("ERROR", f"Hevy workout sync failed: {e}")
+                return {"error": str(e)}
+            if result["updated"] or result["deleted"]:
+                self.state.log(
+                    "INFO",
+                    f"Hevy mirror: {result['updated']} updated, "
+                    f"{result['deleted']} deleted",
+                )
+            self.events.publish("status")
+            return result
+
+    def webhook_active(self) -> bool:
+        return self.state.get_bool("webhook_enabled") and bool(
+            self.state.get("strava_subscription_id")
+        )
+
     async def poll_once(self, triggered_by: str = "manual") -> dict:
         """Run a single fetch+import cycle. Safe to call from a route handler."""
         async with self._lock:
-            return await asyncio.to_thread(self._poll_sync, triggered_by)
+            with POLL_SECONDS.time(trigger=triggered_by):
+                return await asyncio.to_thread(self._poll_sync, triggered_by)
 
     def _poll_sync(self, triggered_by: str) -> dict:
-        result = {
-            "triggered_by": triggered_by,
-            "ran_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
-            "imported": [],
-            "skipped": [],
-            "errors": [],
-        }
+        result = _empty_result()
+        result["triggered_by"] = triggered_by
+        result["ran_at"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
         self.state.set("last_poll_at", result["ran_at"])
+        # Manual "Sync now" may spend the reserve; scheduled polls may not.
+        priority = URGENT if triggered_by == "manual" else BACKGROUND
 
         if not self.strava.is_authorized():
             msg = "Strava not authorized — skipping poll"
@@ -102,47 +207,252 @@ class Poller:
             result["errors"].append(msg)
             return result
 
+        now_ts = int(time.time())
+        window_start = now_ts - 3600 * self.state.get_int("import_lookback_hours", 24)
+        stored = self.state.get_json("strava_poll_cursor", None)
+        cursor = tuple(stored) if stored else (window_start, 0)
+        last_deep = self.state.get_int("last_deep_reconcile_ts", 0)
+        deep = (
+            triggered_by == "manual"
+            or now_ts - last_deep >= self.DEEP_RECONCILE_SECONDS
+        )
         try:
             hevy_user_id = self.hevy.user_id()
-            lookback = self.state.get_int("import_lookback_hours", 24)
-            activities = self.strava.recent_activities(
-                hevy_user_id=hevy_user_id, limit=10, lookback_hours=lookback
+            activities, reached, caught_up = self.strava.activities_after(
+                hevy_user_id,
+                (window_start, 0) if deep else cursor,
+                priority=priority,
+                max_pages=self.POLL_MAX_PAGES,
             )
         except (StravaError, HevyError) as e:
             self.state.log("ERROR", f"Fetch failed: {e}")
+            self.events.publish("progress", {"stage": "error", "message": str(e)})
             result["errors"].append(str(e))
             return result
+        self.events.publish(
+            "progress",
+            {
+                "stage": "fetched",
+                "triggered_by": triggered_by,
+                "activities": len(activities),
+                "caught_up": caught_up,
+            },
+        )
+        self.state.set_json("strava_poll_cursor", list(max(cursor, reached)))
+        if deep and caught_up:
+            self.state.set("last_deep_reconcile_ts", str(now_ts))
+        if not caught_up:
+            self.state.log(
+                "INFO",
+                f"Poll ({triggered_by}) stopped partway (page cap or budget); "
+                "resuming from the cursor next poll",
+            )
 
-        is_private = self.state.get_bool("import_private")
+        imported = self.state.imported_names([a["id"] for a in activities])
         for a in activities:
-            if self.state.is_imported(a["id"]):
-                result["skipped"].append(a["id"])
-                continue
-            try:
-                payload, hevy_workout_id = self.strava.build_hevy_workout(
-                    a["id"], hevy_user_id=hevy_user_id, is_private=is_private
-                )
-                status = self.hevy.submit_workout(payload, hevy_workout_id)
-                if status in (200, 201):
-                    self.state.mark_imported(
-                        a["id"], a["name"], a["type"], hevy_workout_id
-                    )
-                    self.state.log(
-                        "INFO",
-                        f"Imported {a['type']} '{a['name']}' ({a['id']}) → Hevy {hevy_workout_id}",
-                    )
-                    result["imported"].append(a)
-                else:
-                    msg = f"Import {a['id']} failed: HTTP {status}"
-                    self.state.log("ERROR", msg)
-                    result["errors"].append(msg)
-            except (StravaError, HevyError) as e:
-                msg = f"Import {a['id']} failed: {e}"
-                self.state.log("ERROR", msg)
-                result["errors"].append(msg)
-
-        if not result["imported"] and not result["errors"]:
+            force = False
+            if a["id"] in imported:
+                name, atype = imported[a["id"]]
+                force = name != a["name"] or atype not in (a["type"], a["type_title"])
+                if not force:
+                    result["skipped"].append(a["id"])
+                    continue
+            self.state.enqueue_import(
+                a["id"],
+                source=triggered_by,
+                name=a["name"],
+                activity_type=a["type"],
+                priority=1 if priority == URGENT else 0,
+                force=force,
+            )
+
+        drained = self._drain_jobs_sync()
+        for k in ("imported", "skipped", "errors", "deferred"):
+            result[k].extend(drained[k])
+
+        if not (result["imported"] or result["errors"] or result["deferred"]):
             self.state.log(
                 "INFO", f"Poll ({triggered_by}) — no new activities"
             )
+        self.events.publish("status")
+        return result
+
+    async def drain_webhooks(self) -> dict:
+        """Turn queued webhook events into import jobs."""
+        async with self._lock:
+            return await asyncio.to_thread(self._drain_webhooks_sync)
+
+    def _drain_webhooks_sync(self) -> dict:
+        result = _empty_result()
+        for ev in self.state.pending_webhook_events():
+            aid = ev["object_id"]
+            if ev["object_type"] == "athlete":
+                updates = ev["payload"].get("updates") or {}
+                if str(updates.get("authorized", "")).lower() == "false":
+                    self.state.log(
+                        "WARN", "Strava access revoked by athlete — re-authorize on the Auth page"
+                    )
+            # Deletes are ignored: Hevy stays the authority for what it holds.
+            elif ev["object_type"] != "activity" or ev["aspect_type"] == "delete":
+                result["skipped"].append(aid)
+            # Updates (title, type, privacy edits) re-import; the deterministic
+            # workout id turns that into a PUT on Hevy's side.
+            elif ev["aspect_type"] == "update" or not self.state.is_imported(aid):
+                self.state.enqueue_import(
+                    aid, source="webhook", force=ev["aspect_type"] == "update"
+                )
+            else:
+                result["skipped"].append(aid)
+            self.state.mark_webhook_processed(ev["id"])
+        return result
+
+    async def drain_jobs(self) -> dict:
+        """Run due import jobs."""
+        async with self._lock:
+            return await asyncio.to_thread(self._drain_jobs_sync)
+
+    def _drain_jobs_sync(self) -> dict:
+        result = _empty_result()
+        if not (self.strava.is_authorized() and self.hevy.is_authorized()):
+            # Leave jobs pending; they'll run once auth is fixed.
+            return result
+        jobs = self.state.claim_import_jobs(self.JOBS_PER_DRAIN)
+        if not jobs:
+            return result
+        try:
+            hevy_user_id = self.hevy.user_id()
+        except HevyError as e:
+            self.state.log("ERROR", f"Import drain failed: {e}")
+            self.state.requeue_running_jobs()
+            return result
+        is_private = self.state.get_bool("import_private")
+
+        with ThreadPoolExecutor(
+            max_workers=self.JOB_CONCURRENCY, thread_name_prefix="import-job"
+        ) as pool:
+            outcomes = pool.map(
+                lambda job: self._run_job(job, hevy_user_id, is_private), jobs
+            )
+            for bucket, item in outcomes:
+                result[bucket].append(item)
+        self.events.publish("status")
         return result
+
+    def _run_job(
+        self, job: dict, hevy_user_id: str | None, is_private: bool
+    ) -> tuple[str, object]:
+        """Attempt one claimed job and settle its row. Returns the result
+        bucket and entry; never raises, so a job can't be left 'running'."""
+        bucket, item = self._attempt_job(job, hevy_user_id, is_private)
+        outcome = {"imported": "succeeded", "errors": "failed"}.get(bucket, bucket)
+        IMPORTS.inc(source=job["source"], outcome=outcome)
+        return bucket, item
+
+    def _attempt_job(
+        self, job: dict, hevy_user_id: str | None, is_private: bool
+    ) -> tuple[str, object]:
+        aid = job["strava_activity_id"]
+        if not job["force"] and self.state.is_imported(aid):
+            # Imported meanwhile, e.g. by a manual import.
+            self.state.complete_import_job(aid)
+            return "skipped", aid
+        self.events.publish("progress", {"stage": "building", "activity_id": aid})
+        try:
+            summary = self._import_activity(
+                aid,
+                hevy_user_id,
+                is_private,
+                URGENT if job["priority"] > 0 else BACKGROUND,
+                job["activity_name"],
+                job["activity_type"],
+            )
+        except StravaRateLimited as e:
+            self.state.defer_import_job(aid, int(time.time()) + e.retry_after)
+            self.events.publish(
+                "progress",
+                {"stage": "deferred", "activity_id": aid, "retry_after": e.retry_after},
+            )
+            return "deferred", aid
+        except ActivityTypeFiltered:
+            self.state.complete_import_job(aid)
+            return "skipped", aid
+        except Exception as e:
+            attempts = job["attempts"] + 1
+            if attempts >= self.MAX_ATTEMPTS:
+                self.state.fail_import_job(aid, str(e), None)
+                msg = f"Import {aid} failed permanently after {attempts} attempts: {e}"
+            else:
+                delay = backoff_seconds(
+                    attempts, self.BACKOFF_BASE_SECONDS, self.BACKOFF_CAP_SECONDS
+                )
+                self.state.fail_import_job(aid, str(e), int(time.time()) + delay)
+                msg = f"Import {aid} failed (attempt {attempts}), retrying in {delay}s: {e}"
+            if not isinstance(e, (StravaError, HevyError)):
+                log.exception("import job %s crashed", aid)
+            self.state.log("ERROR", msg)
+            self.events.publish(
+                "progress", {"stage": "error", "activity_id": aid, "message": msg}
+            )
+            return "errors", msg
+        self.state.complete_import_job(aid)
+        self.events.publish(
+            "progress",
+            {
+                "stage": "submitted",
+                "activity_id": aid,
+                "name": summary["name"],
+                "type": summary["type"],
+                "hevy_workout_id": summary["hevy_workout_id"],
+            },
+        )
+        return "imported", summary
+
+    def _import_activity(
+        self,
+        activity_id: str,
+        hevy_user_id: str | None,
+        is_private: bool,
+        priority: str,
+        name: str | None = None,
+        activity_type: str | None = None,
+    ) -> dict:
+        """Build, submit and record one activity. Raises StravaError or
+        HevyError (including on a non-2xx submit) without recording it."""
+        payload, hevy_workout_id = self.strava.build_hevy_workout(
+            activity_id,
+            hevy_user_id=hevy_user_id,
+            is_private=is_private,
+            priority=priority,
+        )
+        status = self.hevy.submit_workout(payload, hevy_workout_id)
+        if status not in (200, 201):
+            raise HevyError(f"HTTP {status}")
+        name = name or payload["workout"]["title"]
+        activity_type = activity_type or payload["workout"]["exercises"][0]["title"]
+        self.state.mark_imported(activity_id, name, activity_type, hevy_workout_id)
+        self.state.log(
+            "INFO",
+            f"Imported {activity_type} '{name}' ({activity_id}) → Hevy {hevy_workout_id}",
+        )
+        return {
+            "id": str(activity_id),
+            "name": name,
+            "type": activity_type,
+            "hevy_workout_id": hevy_workout_id,
+        }
+
+
+def backoff_seconds(
+    attempts: int, base: int, cap: int, rng: random.Random | None = None
+) -> int:
+    """Exponential backoff with full jitter: uniform over
+    [base, min(cap, base * 2^(attempts-1))]. The jitter spreads retries of
+    jobs that failed together (an upstream outage) so they don't all come
+    back in the same tick."""
+    rng = rng or random
+    ceiling = min(cap, base * (2 ** max(0, attempts - 1)))
+    return int(rng.uniform(base, max(base, ceiling)))
+
+
+def _empty_result() -> dict:
+    return {"imported": [], "skipped": [], "errors": [], "deferred": []}
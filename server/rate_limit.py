@@ -0,0 +1,207 @@
+"""Strava API request budget for the import service.
+
+Strava meters every application with two windows: a 15-minute quota that
+resets on the quarter hour and a daily quota that resets at UTC midnight.
+The current usage of both comes back on every API response as
+
+    X-RateLimit-Limit: 200,2000
+    X-RateLimit-Usage: 37,412
+
+(plus X-ReadRateLimit-* variants for GET requests on newer apps, which are
+the tighter of the two and preferred when present).
+
+StravaBudget is a token bucket per window, re-synced from those headers on
+every response and debited locally before each request so we don't have to
+wait for the next response to learn we're close. Callers ask for tokens with
+a priority:
+
+  URGENT      user-initiated work (manual import, activity picker). Allowed
+              to spend the budget down to zero.
+  BACKGROUND  scheduled polls. Deferred while remaining budget in either
+              window is below a reserve, so a busy day always leaves room
+              for the user to import by hand.
+
+The budget is in-memory only. After a restart the first response re-syncs
+it, which costs at most one request against a stale view.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Mapping
+
+
+URGENT = "urgent"
+BACKGROUND = "background"
+
+# Strava's published defaults, used until the first response tells us the
+# real per-app numbers.
+DEFAULT_SHORT_LIMIT = 200
+DEFAULT_DAILY_LIMIT = 2000
+
+# Fraction of each window held back from BACKGROUND work.
+RESERVE_FRACTION = 0.2
+
+_SHORT_WINDOW_SECONDS = 15 * 60
+_DAY_SECONDS = 24 * 3600
+
+
+class BudgetExhausted(Exception):
+    """Raised by acquire() when a request may not be spent right now."""
+
+    def __init__(self, priority: str, retry_after: int):
+        self.priority = priority
+        self.retry_after = retry_after
+        super().__init__(
+            f"Strava rate budget low for {priority} work; "
+            f"retry in {retry_after}s"
+        )
+
+
+@dataclass
+class _Window:
+    limit: int
+    usage: int = 0
+    resets_at: int = 0
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.limit - self.usage)
+
+
+class StravaBudget:
+    """Thread-safe two-window token bucket fed by Strava's rate headers.
+
+    Instances are callable with (headers, method) so they can be handed
+    straight to stravalib.Client(rate_limiter=...), which invokes the limiter
+    after every response.
+    """
+
+    def __init__(
+        self,
+        reserve_fraction: float = RESERVE_FRACTION,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.reserve_fraction = reserve_fraction
+        self._clock = clock
+        self._lock = threading.Lock()
+        now = int(clock())
+        self._short = _Window(DEFAULT_SHORT_LIMIT, 0, _next_quarter(now))
+        self._daily = _Window(DEFAULT_DAILY_LIMIT, 0, _next_midnight(now))
+
+    # ── stravalib rate_limiter hook ───────────────────────────────────────
+    def __call__(self, headers: Mapping[str, str], method: str = "GET") -> None:
+        self.observe(headers, method)
+
+    def observe(self, headers: Mapping[str, str], method: str = "GET") -> None:
+        """Re-sync both windows from a response's rate-limit headers."""
+        rates = _parse_headers(headers, method)
+        if rates is None:
+            return
+        short_usage, daily_usage, short_limit, daily_limit = rates
+        with self._lock:
+            self._roll()
+            self._short.limit, self._short.usage = short_limit, short_usage
+            self._daily.limit, self._daily.usage = daily_limit, daily_usage
+
+    # ── Spending ──────────────────────────────────────────────────────────
+    def acquire(self, cost: int = 1, priority: str = URGENT) -> None:
+        """Debit `cost` requests or raise BudgetExhausted without debiting."""
+        with self._lock:
+            self._roll()
+            retry_after = self._blocked(cost, priority)
+            if retry_after is not None:
+                raise BudgetExhausted(priority, retry_after)
+            self._short.usage += cost
+            self._daily.usage += cost
+
+    def would_defer(self, priority: str = BACKGROUND, cost: int = 1) -> bool:
+        with self._lock:
+            self._roll()
+            return self._blocked(cost, priority) is not None
+
+    def snapshot(self) -> dict:
+        """Remaining budget for /api/status."""
+        with self._lock:
+            self._roll()
+            now = int(self._clock())
+            out = {}
+            for name, window in (("short", self._short), ("daily", self._daily)):
+                out[name] = {
+                    "limit": window.limit,
+                    "usage": window.usage,
+                    "remaining": window.remaining,
+                    "resets_in_seconds": max(0, window.resets_at - now),
+                }
+        out["deferring_background"] = self.would_defer(BACKGROUND)
+        return out
+
+    def fingerprint(self) -> tuple:
+        """Changes whenever snapshot()'s limits, usage or deferral do
+        (resets_in_seconds aside), for caching views that embed it."""
+        with self._lock:
+            self._roll()
+            return (
+                self._short.limit,
+                self._short.usage,
+                self._short.resets_at,
+                self._daily.limit,
+                self._daily.usage,
+                self._daily.resets_at,
+            )
+
+    def _blocked(self, cost: int, priority: str) -> int | None:
+        """Seconds until `cost` fits for `priority`, or None if it fits now.
+        Caller holds the lock."""
+        floor = 0.0 if priority == URGENT else self.reserve_fraction
+        now = int(self._clock())
+        for window in (self._short, self._daily):
+            if window.remaining - cost < int(window.limit * floor):
+                return max(1, window.resets_at - now)
+        return None
+
+    def _roll(self) -> None:
+        """Zero any window whose reset boundary has passed. Caller holds lock."""
+        now = int(self._clock())
+        if now >= self._short.resets_at:
+            self._short.usage = 0
+            self._short.resets_at = _next_quarter(now)
+        if now >= self._daily.resets_at:
+            self._daily.usage = 0
+            self._daily.resets_at = _next_midnight(now)
+
+
+def _parse_headers(
+    headers: Mapping[str, str], method: str
+) -> tuple[int, int, int, int] | None:
+    """Return (short_usage, daily_usage, short_limit, daily_limit) or None.
+
+    Header lookup is case-insensitive in requests' CaseInsensitiveDict but
+    not in a plain dict, so normalise first.
+    """
+    lowered = {str(k).lower(): v for k, v in headers.items()}
+    for prefix in (
+        ("x-readratelimit",) if method.upper() == "GET" else ()
+    ) + ("x-ratelimit",):
+        usage = lowered.get(f"{prefix}-usage")
+        limit = lowered.get(f"{prefix}-limit")
+        if not usage or not limit:
+            continue
+        try:
+            su, du = (int(v) for v in str(usage).split(",")[:2])
+            sl, dl = (int(v) for v in str(limit).split(",")[:2])
+        except ValueError:
+            continue
+        return su, du, sl, dl
+    return None
+
+
+def _next_quarter(now: int) -> int:
+    return now - (now % _SHORT_WINDOW_SECONDS) + _SHORT_WINDOW_SECONDS
+
+
+def _next_midnight(now: int) -> int:
+    return now - (now % _DAY_SECONDS) + _DAY_SECONDS
+
@@ -0,0 +1,147 @@
+"""Vectorized matcher.score() over every (Strava, Hevy) pair at once.
+
+matcher.py scores one pair per call in pure Python, which is what the
+import path needs. Backfills and dry-run reports want the whole S×H score
+matrix; this module computes it with NumPy broadcasting using exactly the
+same rules:
+
+  - type gate: 0 wherever the workout has no exercise template for the
+    activity's type (or the type is unknown);
+  - time: max(start-offset decay, interval IoU);
+  - duration / distance: ratio scores against the type-matching exercises
+    only, dropped from the weighted average when either side is missing,
+    non-positive or non-finite;
+  - final score renormalised over present dimensions and clamped to [0, 1].
+
+Operations are ordered as in score() so results agree to the last bit in
+practice; test_score_kernel checks them against the scalar version.
+
+NumPy is only needed here, not by matcher.py.
+"""
+
+from __future__ import annotations
+
+from typing import Sequence
+
+import numpy as np
+
+from matcher import (
+    DEFAULT_TYPE_TEMPLATE_IDS,
+    TIME_CUTOFF_SECONDS,
+    _WEIGHTS,
+    HevyWorkoutSummary,
+    StravaSummary,
+)
+from metrics import MATCHER_SECONDS
+
+
+class HevyArrays:
+    """Column arrays for a fixed list of Hevy workouts.
+
+    Per-type duration/distance totals are computed lazily, once per Strava
+    activity type, so repeated score() calls against the same workouts only
+    pay for the broadcasting.
+    """
+
+    def __init__(
+        self,
+        workouts: Sequence[HevyWorkoutSummary],
+        type_map: dict[str, set[str]] | None = None,
+    ):
+        self.workouts = list(workouts)
+        self.type_map = type_map or DEFAULT_TYPE_TEMPLATE_IDS
+        self.start = np.array([w.start_ts for w in self.workouts], dtype=np.float64)
+        self.end = np.array([w.end_ts for w in self.workouts], dtype=np.float64)
+        self._by_type: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    def for_type(
+        self, activity_type: str
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(type_ok, duration, distance) columns for `activity_type`."""
+        cached = self._by_type.get(activity_type)
+        if cached is not None:
+            return cached
+        expected = self.type_map.get(activity_type) or set()
+        n = len(self.workouts)
+        ok = np.zeros(n, dtype=bool)
+        dur = np.zeros(n, dtype=np.float64)
+        dist = np.zeros(n, dtype=np.float64)
+        for i, w in enumerate(self.workouts if expected else ()):
+            ok[i] = any(t in expected for t in w.exercise_template_ids)
+            # Summed in exercise order, like score(), so float totals agree.
+            matching = [e for e in w.exercises if e.template_id in expected]
+            dur[i] = sum(e.duration_seconds for e in matching)
+            dist[i] = sum(e.distance_meters for e in matching)
+        self._by_type[activity_type] = (ok, dur, dist)
+        return ok, dur, dist
+
+    def score(self, stravas: Sequence[StravaSummary]) -> np.ndarray:
+        """Score matrix of shape (len(stravas), len(workouts))."""
+        with MATCHER_SECONDS.time(op="score_matrix"):
+            return self._score(stravas)
+
+    def _score(self, stravas: Sequence[StravaSummary]) -> np.ndarray:
+        out = np.zeros((len(stravas), len(self.workouts)), dtype=np.float64)
+        if not len(stravas) or not self.workouts:
+            return out
+        types = [s.activity_type for s in stravas]
+        for activity_type in dict.fromkeys(types):
+            rows = np.array([i for i, t in enumerate(types) if t == activity_type])
+            ok, dur, dist = self.for_type(activity_type)
+            if not ok.any():
+                continue
+            group = [stravas[i] for i in rows]
+            out[rows] = np.where(ok, self._score_rows(group, dur, dist), 0.0)
+        return out
+
+    def _score_rows(
+        self, stravas: Sequence[StravaSummary], dur: np.ndarray, dist: np.ndarray
+    ) -> np.ndarray:
+        def column(attr: str) -> np.ndarray:
+            values = [getattr(s, attr) for s in stravas]
+            return np.array(values, dtype=np.float64)[:, None]
+
+        s_start = column("start_ts")
+        s_moving = column("moving_seconds")
+        s_dist = column("distance_meters")
+
+        start_score = np.maximum(
+            0.0, 1.0 - np.abs(s_start - self.start) / TIME_CUTOFF_SECONDS
+        )
+        s_end = s_start + np.maximum(s_moving, 0)
+        overlap = np.maximum(
+            0.0, np.minimum(s_end, self.end) - np.maximum(s_start, self.start)
+        )
+        union = np.maximum(
+            1.0, np.maximum(s_end, self.end) - np.minimum(s_start, self.start)
+        )
+        time_s = np.maximum(start_score, overlap / union)
+
+        dur_s, dur_ok = _ratio(s_moving, dur)
+        dist_s, dist_ok = _ratio(s_dist, dist)
+
+        weighted = time_s * _WEIGHTS["time"]
+        weighted = weighted + np.where(dur_ok, dur_s * _WEIGHTS["duration"], 0.0)
+        weighted = weighted + np.where(dist_ok, dist_s * _WEIGHTS["distance"], 0.0)
+        total = _WEIGHTS["time"] + np.where(dur_ok, _WEIGHTS["duration"], 0.0)
+        total = total + np.where(dist_ok, _WEIGHTS["distance"], 0.0)
+        return np.clip(weighted / total, 0.0, 1.0)
+
+
+def score_matrix(
+    stravas: Sequence[StravaSummary],
+    workouts: Sequence[HevyWorkoutSummary],
+    type_map: dict[str, set[str]] | None = None,
+) -> np.ndarray:
+    """matcher.score(s, w).score for every pair, shape (S, H)."""
+    return HevyArrays(workouts, type_map).score(stravas)
+
+
+def _ratio(a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Broadcast _ratio_score: (score, present) with present False where
+    the scalar version returns None."""
+    a, b = np.broadcast_arrays(a, b)
+    ok = np.isfinite(a) & np.isfinite(b) & (a > 0) & (b > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.minimum(a, b) / np.maximum(a, b)
+    return np.where(ok, np.maximum(0.0, (ratio - 0.5) * 2.0), 0.0), ok
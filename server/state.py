@@ -1,8 +1,11 @@
 """SQLite-backed persistent state for the Strava import service.
 
-Holds rotating tokens, user-configured settings, imported activity IDs, and a
-ring-buffered event log. All access goes through this module so the schema
-and write semantics stay in one place.
+Holds rotating tokens, user-configured settings, imported activity IDs, a
+durable queue of inbound Strava webhook events, the import job table the
+poller drains with retries, a mirror of the user's Hevy workouts with
+compact summaries of them for matching, and a ring-buffered event log. All
+access goes through this module so the schema and write semantics stay in
+one place.
 """
 
 from __future__ import annotations
@@ -11,10 +14,21 @@ import json
 import os
 import sqlite3
 import threading
+import time
 from contextlib import contextmanager
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Iterable
+from typing import Any, Callable, Iterable
+
+import metrics
+from matcher import (
+    TIME_CUTOFF_SECONDS,
+    HevyExerciseSummary,
+    HevyWorkoutSummary,
+    StravaSummary,
+    summarize_hevy,
+    to_epoch,
+)
 
 
 DEFAULTS = {
@@ -23,9 +37,13 @@ DEFAULTS = {
     "polling_enabled": "0",
     "poll_interval_seconds": "600",
     "import_lookback_hours": "24",
+    "webhook_enabled": "0",
+    "hr_downsample": "lttb",
 }
 
 LOG_RETAIN_ROWS = 500
+# Processed webhook events are kept for debugging; pending ones never expire.
+WEBHOOK_RETAIN_PROCESSED_ROWS = 500
 
 
 class State:
@@ -33,11 +51,31 @@ class State:
         self.db_path = db_path
         Path(db_path).parent.mkdir(parents=True, exist_ok=True)
         self._lock = threading.Lock()
+        # Called as listener(kind, data) after writes others may want pushed
+        # (currently log events); see events.Broadcaster.publish.
+        self._listeners: list[Callable[[str, dict], None]] = []
+        self._version = 0
+        self._lock_stats = {
+            "acquisitions": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
         self._init_schema()
         self._seed_defaults()
+        self._backfill_import_counters()
+
+    def add_listener(self, listener: Callable[[str, dict], None]) -> None:
+        self._listeners.append(listener)
+
+    @property
+    def version(self) -> int:
+        """Bumped by every write that changes a row. Views derived from
+        State (the /api/status body, dashboard context) cache against it."""
+        return self._version
 
     @contextmanager
-    def _conn(self):
+    def _conn(self, kind: str = "read"):
+        start = time.perf_counter()
         conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=10)
         conn.execute("PRAGMA journal_mode=WAL")
         conn.execute("PRAGMA foreign_keys=ON")
@@ -45,9 +83,31 @@ class State:
             yield conn
         finally:
             conn.close()
+            metrics.SQLITE_SECONDS.observe(time.perf_counter() - start, kind=kind)
+
+    @contextmanager
+    def _write(self):
+        """Connection for a write, serialised with other writers."""
+        start = time.perf_counter()
+        with self._lock:
+            waited = time.perf_counter() - start
+            stats = self._lock_stats
+            stats["acquisitions"] += 1
+            stats["wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+            metrics.SQLITE_LOCK_WAIT.observe(waited)
+            with self._conn("write") as c:
+                yield c
+                if c.total_changes:
+                    self._version += 1
+
+    def lock_stats(self) -> dict:
+        """Time writers spent queued on the write lock, since startup."""
+        with self._lock:
+            return dict(self._lock_stats)
 
     def _init_schema(self):
-        with self._lock, self._conn() as c:
+        with self._write() as c:
             c.executescript(
                 """
                 CREATE TABLE IF NOT EXISTS config (
@@ -61,6 +121,14 @@ class State:
                     imported_at TEXT NOT NULL,
                     hevy_workout_id TEXT
                 );
+                CREATE INDEX IF NOT EXISTS idx_imported_at
+                    ON imported_activities(imported_at);
+                -- Materialised import_counts(), maintained by mark_imported:
+                -- 'total', and 'day:YYYY-MM-DD' = rows last imported that day.
+                CREATE TABLE IF NOT EXISTS import_counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
                 CREATE TABLE IF NOT EXISTS merged_workouts (
                     strava_activity_id TEXT NOT NULL,
                     hevy_workout_id TEXT NOT NULL,
@@ -79,16 +147,86 @@ class State:
                     message TEXT NOT NULL
                 );
                 CREATE INDEX IF NOT EXISTS idx_log_events_ts ON log_events(ts DESC);
+                CREATE TABLE IF NOT EXISTS webhook_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    received_at TEXT NOT NULL,
+                    object_type TEXT NOT NULL,
+                    object_id TEXT NOT NULL,
+                    aspect_type TEXT NOT NULL,
+                    owner_id TEXT,
+                    event_time INTEGER,
+                    payload TEXT NOT NULL,
+                    processed_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_webhook_events_pending
+                    ON webhook_events(processed_at, id);
+                CREATE TABLE IF NOT EXISTS import_jobs (
+                    strava_activity_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL DEFAULT 'pending'
+                        CHECK (state IN ('pending', 'running', 'done', 'failed')),
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    force INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at INTEGER NOT NULL,
+                    last_error TEXT,
+                    activity_name TEXT,
+                    activity_type TEXT,
+                    source TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_import_jobs_due
+                    ON import_jobs(state, priority DESC, next_attempt_at);
+                CREATE TABLE IF NOT EXISTS hevy_workout_summaries (
+                    workout_id TEXT PRIMARY KEY,
+                    updated_at TEXT NOT NULL,
+                    start_ts INTEGER NOT NULL,
+                    end_ts INTEGER NOT NULL,
+                    span_seconds INTEGER NOT NULL,
+                    -- [[template_id, duration_seconds, distance_meters], ...]
+                    exercises TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_hevy_summaries_start
+                    ON hevy_workout_summaries(start_ts);
+                CREATE INDEX IF NOT EXISTS idx_hevy_summaries_span
+                    ON hevy_workout_summaries(span_seconds);
+                CREATE TABLE IF NOT EXISTS hevy_workouts (
+                    workout_id TEXT PRIMARY KEY,
+                    updated_at TEXT NOT NULL,
+                    start_ts INTEGER NOT NULL,
+                    name TEXT,
+                    payload TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_hevy_workouts_start
+                    ON hevy_workouts(start_ts DESC);
                 """
             )
 
     def _seed_defaults(self):
-        with self._lock, self._conn() as c:
+        with self._write() as c:
             for k, v in DEFAULTS.items():
                 c.execute(
                     "INSERT OR IGNORE INTO config(key, value) VALUES(?, ?)", (k, v)
                 )
 
+    def _backfill_import_counters(self):
+        """Seed import_counters from imported_activities (databases created
+        before the counters existed). No-op once 'total' is present."""
+        with self._write() as c:
+            if c.execute(
+                "SELECT 1 FROM import_counters WHERE name='total'"
+            ).fetchone():
+                return
+            c.execute(
+                "INSERT INTO import_counters(name, value) "
+                "SELECT 'total', COUNT(*) FROM imported_activities"
+            )
+            c.execute(
+                "INSERT INTO import_counters(name, value) "
+                "SELECT 'day:' || substr(imported_at, 1, 10), COUNT(*) "
+                "FROM imported_activities GROUP BY substr(imported_at, 1, 10)"
+            )
+
     # ── Config primitives ─────────────────────────────────────────────────
     def get(self, key: str, default: str | None = None) -> str | None:
         with self._conn() as c:
@@ -98,7 +236,7 @@ class State:
             return row[0] if row else default
 
     def set(self, key: str, value: str | None):
-        with self._lock, self._conn() as c:
+        with self._write() as c:
             if value is None:
                 c.execute("DELETE FROM config WHERE key=?", (key,))
             else:
@@ -109,7 +247,7 @@ class State:
                 )
 
     def set_many(self, items: dict[str, str | None]):
-        with self._lock, self._conn() as c:
+        with self._write() as c:
             for k, v in items.items():
                 if v is None:
                     c.execute("DELETE FROM config WHERE key=?", (k,))
@@ -164,7 +302,12 @@ class State:
         activity_type: str,
         hevy_workout_id: str | None = None,
     ):
-        with self._lock, self._conn() as c:
+        now = _now_iso()
+        with self._write() as c:
+            prev = c.execute(
+                "SELECT imported_at FROM imported_activities WHERE strava_activity_id=?",
+                (str(activity_id),),
+            ).fetchone()
             c.execute(
                 "INSERT OR REPLACE INTO imported_activities "
                 "(strava_activity_id, activity_name, activity_type, imported_at, hevy_workout_id) "
@@ -173,10 +316,40 @@ class State:
                     str(activity_id),
                     name,
                     activity_type,
-                    _now_iso(),
+                    now,
                     hevy_workout_id,
                 ),
             )
+            # A re-import moves the row to today; it only adds to the total
+            # the first time.
+            deltas = {}
+            if prev is None:
+                deltas["total"] = 1
+            if prev is None or prev[0][:10] != now[:10]:
+                deltas[f"day:{now[:10]}"] = 1
+                if prev is not None:
+                    deltas[f"day:{prev[0][:10]}"] = -1
+            for counter, delta in deltas.items():
+                c.execute(
+                    "INSERT INTO import_counters(name, value) VALUES(?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value=value + excluded.value",
+                    (counter, delta),
+                )
+
+    def imported_names(self, activity_ids: list[str]) -> dict[str, tuple[str, str]]:
+        """(activity_name, activity_type) for each of `activity_ids` that
+        has been imported."""
+        ids = [str(i) for i in activity_ids]
+        if not ids:
+            return {}
+        with self._conn() as c:
+            rows = c.execute(
+                "SELECT strava_activity_id, activity_name, activity_type "
+                "FROM imported_activities WHERE strava_activity_id IN "
+                f"({','.join('?' * len(ids))})",
+                ids,
+            ).fetchall()
+        return {r[0]: (r[1], r[2]) for r in rows}
 
     def recent_imports(self, limit: int = 20) -> list[dict]:
         with self._conn() as c:
@@ -197,15 +370,17 @@ class State:
         ]
 
     def import_counts(self) -> dict:
+        """Imports in total and today (UTC), from the materialised
+        counters, so the cost doesn't grow with imported_activities."""
+        today = f"day:{_now_iso()[:10]}"
         with self._conn() as c:
-            total = c.execute(
-                "SELECT COUNT(*) FROM imported_activities"
-            ).fetchone()[0]
-            today = c.execute(
-                "SELECT COUNT(*) FROM imported_activities WHERE imported_at >= ?",
-                (_today_iso(),),
-            ).fetchone()[0]
-        return {"total": total, "today": today}
+            rows = dict(
+                c.execute(
+                    "SELECT name, value FROM import_counters WHERE name IN ('total', ?)",
+                    (today,),
+                ).fetchall()
+            )
+        return {"total": rows.get("total", 0), "today": rows.get(today, 0)}
 
     # ── Merged workout tracking ───────────────────────────────────────────
     def is_merged(self, strava_activity_id: str, hevy_workout_id: str) -> bool:
@@ -228,7 +403,7 @@ class State:
         has explicitly confirmed a merge, a later automated rematch cannot
         silently downgrade it back to 'auto'. The auto path can still update
         confidence on an existing auto row."""
-        with self._lock, self._conn() as c:
+        with self._write() as c:
             c.execute(
                 "INSERT INTO merged_workouts "
                 "(strava_activity_id, hevy_workout_id, merged_at, confidence, source) "
@@ -251,7 +426,7 @@ class State:
 
     def unmerge(self, strava_activity_id: str, hevy_workout_id: str) -> int:
         """Remove a merge record. Returns the number of rows deleted."""
-        with self._lock, self._conn() as c:
+        with self._write() as c:
             cursor = c.execute(
                 "DELETE FROM merged_workouts "
                 "WHERE strava_activity_id=? AND hevy_workout_id=?",
@@ -293,6 +468,16 @@ class State:
             for r in rows
         ]
 
+    def user_merges(self) -> list[tuple[str, str]]:
+        """(strava_activity_id, hevy_workout_id) of every user-confirmed
+        merge — the pairs an automated rematch must keep."""
+        with self._conn() as c:
+            rows = c.execute(
+                "SELECT strava_activity_id, hevy_workout_id FROM merged_workouts "
+                "WHERE source='user'"
+            ).fetchall()
+        return [(r[0], r[1]) for r in rows]
+
     def recent_merges(self, limit: int = 20) -> list[dict]:
         with self._conn() as c:
             rows = c.execute(
@@ -311,18 +496,459 @@ class State:
             for r in rows
         ]
 
+    # ── Hevy workout summaries (matching) ─────────────────────────────────
+    def store_hevy_workouts(self, workouts: Iterable[dict]) -> int:
+        """Summarise and persist raw Hevy workout payloads for matching.
+
+        Payloads whose `updated_at` matches the stored row are skipped
+        without being parsed, so feeding the same list repeatedly is cheap.
+        Payloads that can't be summarised are logged and dropped from the
+        summaries. Returns the number of rows written.
+        """
+        rows, bad = self._hevy_summary_rows(workouts)
+        with self._write() as c:
+            self._write_hevy_summaries(c, rows, bad)
+        self._log_bad_hevy_summaries(bad)
+        return len(rows)
+
+    def _hevy_summary_rows(
+        self, workouts: Iterable[dict]
+    ) -> tuple[list[tuple], list[str]]:
+        """Summary rows to write, and the ids of payloads summarize_hevy
+        rejected."""
+        pending: list[tuple[str, dict]] = []
+        for raw in workouts:
+            if not isinstance(raw, dict):
+                continue
+            w = raw.get("workout") if "workout" in raw else raw
+            wid = isinstance(w, dict) and (w.get("workout_id") or w.get("id"))
+            if wid:
+                pending.append((str(wid), raw))
+        if not pending:
+            return [], []
+        known = self._hevy_summary_versions([wid for wid, _ in pending])
+        rows, bad = [], []
+        for wid, raw in pending:
+            w = raw.get("workout") if "workout" in raw else raw
+            updated_at = str(w.get("updated_at") or raw.get("updated_at") or "")
+            if updated_at and known.get(wid) == updated_at:
+                continue
+            try:
+                summary = summarize_hevy(raw)
+            except (ValueError, TypeError, AttributeError):
+                bad.append(wid)
+                continue
+            rows.append(
+                (
+                    summary.workout_id,
+                    updated_at,
+                    summary.start_ts,
+                    summary.end_ts,
+                    max(0, summary.end_ts - summary.start_ts),
+                    json.dumps(
+                        [
+                            [e.template_id, e.duration_seconds, e.distance_meters]
+                            for e in summary.exercises
+                        ],
+                        separators=(",", ":"),
+                    ),
+                )
+            )
+        return rows, bad
+
+    @staticmethod
+    def _write_hevy_summaries(c, rows: list[tuple], drop: Iterable[str]) -> None:
+        c.executemany(
+            "INSERT OR REPLACE INTO hevy_workout_summaries "
+            "(workout_id, updated_at, start_ts, end_ts, span_seconds, exercises) "
+            "VALUES(?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        c.executemany(
+            "DELETE FROM hevy_workout_summaries WHERE workout_id=?",
+            [(str(d),) for d in drop],
+        )
+
+    def _log_bad_hevy_summaries(self, bad: list[str]) -> None:
+        if bad:
+            self.log(
+                "WARN",
+                f"Skipped {len(bad)} unreadable Hevy workout(s): "
+                + ", ".join(bad[:5]),
+            )
+
+    # ── Hevy workout mirror ───────────────────────────────────────────────
+    def hevy_workout_versions(self) -> dict[str, str]:
+        """{workout id: updated_at} for every mirrored workout — the body of
+        a workouts_sync_batch request."""
+        with self._conn() as c:
+            rows = c.execute(
+                "SELECT workout_id, updated_at FROM hevy_workouts"
+            ).fetchall()
+        return {r[0]: r[1] for r in rows}
+
+    def apply_hevy_sync(self, updated: list[dict], deleted: list[str]) -> None:
+        """Apply one workouts_sync_batch response to the mirror and to the
+        matching summaries."""
+        summaries, bad = self._hevy_summary_rows(updated)
+        rows = [
+            (
+                str(w["id"]),
+                str(w.get("updated_at") or ""),
+                to_epoch(w.get("start_time")),
+                w.get("name"),
+                json.dumps(w, separators=(",", ":")),
+            )
+            for w in updated
+            if isinstance(w, dict) and w.get("id")
+        ]
+        # Mirror and summaries change together, so matching never sees a
+        # summary older than the mirrored workout.
+        with self._write() as c:
+            c.executemany(
+                "INSERT OR REPLACE INTO hevy_workouts "
+                "(workout_id, updated_at, start_ts, name, payload) VALUES(?, ?, ?, ?, ?)",
+                rows,
+            )
+            c.executemany(
+                "DELETE FROM hevy_workouts WHERE workout_id=?",
+                [(str(d),) for d in deleted],
+            )
+            self._write_hevy_summaries(c, summaries, [*bad, *deleted])
+        self._log_bad_hevy_summaries(bad)
+
+    def recent_hevy_workouts(self, limit: int = 20) -> list[dict]:
+        """Newest mirrored workouts for the web UI, payload parsed."""
+        with self._conn() as c:
+            rows = c.execute(
+                "SELECT workout_id, name, start_ts, updated_at, payload "
+                "FROM hevy_workouts ORDER BY start_ts DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {
+                "workout_id": r[0],
+                "name": r[1],
+                "start_ts": r[2],
+                "updated_at": r[3],
+                "workout": json.loads(r[4]),
+            }
+            for r in rows
+        ]
+
+    def hevy_mirror_count(self) -> int:
+        with self._conn() as c:
+            return c.execute("SELECT COUNT(*) FROM hevy_workouts").fetchone()[0]
+
+    def delete_hevy_summary(self, workout_id: str) -> int:
+        with self._write() as c:
+            return c.execute(
+                "DELETE FROM hevy_workout_summaries WHERE workout_id=?",
+                (str(workout_id),),
+            ).rowcount
+
+    def hevy_summaries_between(
+        self, start_ts: int, end_ts: int
+    ) -> list[HevyWorkoutSummary]:
+        """Stored summaries whose start lies in [start_ts, end_ts]."""
+        with self._conn() as c:
+            rows = c.execute(
+                "SELECT workout_id, start_ts, end_ts, exercises "
+                "FROM hevy_workout_summaries WHERE start_ts BETWEEN ? AND ? "
+                "ORDER BY start_ts, workout_id",
+                (int(start_ts), int(end_ts)),
+            ).fetchall()
+        return [_summary_from_row(r) for r in rows]
+
+    def hevy_candidates(self, strava: StravaSummary) -> list[HevyWorkoutSummary]:
+        """Stored workouts that could score above zero on time against
+        `strava`: same window as matcher.CandidateIndex, as a range scan on
+        idx_hevy_summaries_start."""
+        with self._conn() as c:
+            max_span = c.execute(
+                "SELECT COALESCE(MAX(span_seconds), 0) FROM hevy_workout_summaries"
+            ).fetchone()[0]
+        strava_end = strava.start_ts + max(strava.moving_seconds, 0)
+        return self.hevy_summaries_between(
+            strava.start_ts - max(TIME_CUTOFF_SECONDS, max_span),
+            max(strava.start_ts + TIME_CUTOFF_SECONDS, strava_end),
+        )
+
+    def _hevy_summary_versions(self, workout_ids: list[str]) -> dict[str, str]:
+        versions: dict[str, str] = {}
+        with self._conn() as c:
+            # Chunked to stay under SQLite's bound-parameter limit.
+            for i in range(0, len(workout_ids), 500):
+                chunk = workout_ids[i : i + 500]
+                rows = c.execute(
+                    "SELECT workout_id, updated_at FROM hevy_workout_summaries "
+                    f"WHERE workout_id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                versions.update({r[0]: r[1] for r in rows})
+        return versions
+
+    # ── Inbound webhook queue ─────────────────────────────────────────────
+    def enqueue_webhook_event(self, event: dict) -> int:
+        """Persist a raw Strava push event before acknowledging it, so a
+        crash between receipt and import can't lose the activity."""
+        with self._write() as c:
+            cursor = c.execute(
+                "INSERT INTO webhook_events "
+                "(received_at, object_type, object_id, aspect_type, owner_id, event_time, payload) "
+                "VALUES(?, ?, ?, ?, ?, ?, ?)",
+                (
+                    _now_iso(),
+                    str(event.get("object_type") or ""),
+                    str(event.get("object_id") or ""),
+                    str(event.get("aspect_type") or ""),
+                    str(event["owner_id"]) if event.get("owner_id") is not None else None,
+                    int(event.get("event_time") or 0),
+                    json.dumps(event),
+                ),
+            )
+            return cursor.lastrowid
+
+    def pending_webhook_events(self, limit: int = 50) -> list[dict]:
+        """Oldest-first unprocessed events."""
+        with self._conn() as c:
+            rows = c.execute(
+                "SELECT id, received_at, object_type, object_id, aspect_type, owner_id, payload "
+                "FROM webhook_events WHERE processed_at IS NULL ORDER BY id LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {
+                "id": r[0],
+                "received_at": r[1],
+                "object_type": r[2],
+                "object_id": r[3],
+                "aspect_type": r[4],
+                "owner_id": r[5],
+                "payload": json.loads(r[6]),
+            }
+            for r in rows
+        ]
+
+    def webhook_backlog(self) -> int:
+        with self._conn() as c:
+            return c.execute(
+                "SELECT COUNT(*) FROM webhook_events WHERE processed_at IS NULL"
+            ).fetchone()[0]
+
+    def mark_webhook_processed(self, event_id: int):
+        with self._write() as c:
+            c.execute(
+                "UPDATE webhook_events SET processed_at=? WHERE id=?",
+                (_now_iso(), int(event_id)),
+            )
+            c.execute(
+                "DELETE FROM webhook_events WHERE processed_at IS NOT NULL AND id NOT IN ("
+                "SELECT id FROM webhook_events WHERE processed_at IS NOT NULL "
+                "ORDER BY id DESC LIMIT ?)",
+                (WEBHOOK_RETAIN_PROCESSED_ROWS,),
+            )
+
+    # ── Import jobs ───────────────────────────────────────────────────────
+    def enqueue_import(
+        self,
+        activity_id: str,
+        source: str,
+        name: str | None = None,
+        activity_type: str | None = None,
+        priority: int = 0,
+        force: bool = False,
+    ) -> bool:
+        """Add an import job. Returns True if a job is now pending.
+
+        An existing pending/running job is left alone (only its priority can
+        rise). Finished and dead-lettered jobs are revived only with
+        `force` — a webhook update or an explicit retry — so a reconciliation
+        pass never resurrects an activity we already gave up on.
+        """
+        now = _now_iso()
+        with self._write() as c:
+            row = c.execute(
+                "SELECT state FROM import_jobs WHERE strava_activity_id=?",
+                (str(activity_id),),
+            ).fetchone()
+            if row is None:
+                c.execute(
+                    "INSERT INTO import_jobs "
+                    "(strava_activity_id, state, priority, force, attempts, next_attempt_at, "
+                    " activity_name, activity_type, source, created_at, updated_at) "
+                    "VALUES(?, 'pending', ?, ?, 0, ?, ?, ?, ?, ?, ?)",
+                    (
+                        str(activity_id),
+                        int(priority),
+                        int(force),
+                        int(time.time()),
+                        name,
+                        activity_type,
+                        source,
+                        now,
+                        now,
+                    ),
+                )
+                return True
+            if row[0] in ("pending", "running"):
+                c.execute(
+                    "UPDATE import_jobs SET priority=MAX(priority, ?), "
+                    "force=MAX(force, ?), updated_at=? WHERE strava_activity_id=?",
+                    (int(priority), int(force), now, str(activity_id)),
+                )
+                return True
+            if not force:
+                return False
+            c.execute(
+                "UPDATE import_jobs SET state='pending', priority=?, force=1, "
+                "attempts=0, next_attempt_at=?, last_error=NULL, source=?, "
+                "activity_name=COALESCE(?, activity_name), "
+                "activity_type=COALESCE(?, activity_type), updated_at=? "
+                "WHERE strava_activity_id=?",
+                (
+                    int(priority),
+                    int(time.time()),
+                    source,
+                    name,
+                    activity_type,
+                    now,
+                    str(activity_id),
+                ),
+            )
+            return True
+
+    def claim_import_jobs(self, limit: int, now: int | None = None) -> list[dict]:
+        """Move up to `limit` due jobs to 'running' and return them,
+        highest priority first, then oldest due."""
+        now = int(time.time()) if now is None else now
+        with self._write() as c:
+            rows = c.execute(
+                "SELECT strava_activity_id, priority, force, attempts, activity_name, "
+                "activity_type, source FROM import_jobs "
+                "WHERE state='pending' AND next_attempt_at <= ? "
+                "ORDER BY priority DESC, next_attempt_at LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            c.executemany(
+                "UPDATE import_jobs SET state='running', updated_at=? "
+                "WHERE strava_activity_id=?",
+                [(_now_iso(), r[0]) for r in rows],
+            )
+        return [
+            {
+                "strava_activity_id": r[0],
+                "priority": r[1],
+                "force": bool(r[2]),
+                "attempts": r[3],
+                "activity_name": r[4],
+                "activity_type": r[5],
+                "source": r[6],
+            }
+            for r in rows
+        ]
+
+    def complete_import_job(self, activity_id: str):
+        self._set_job(activity_id, "state='done', force=0, last_error=NULL")
+
+    def defer_import_job(self, activity_id: str, next_attempt_at: int):
+        """Back to pending without spending an attempt (rate-limit deferral)."""
+        self._set_job(
+            activity_id, "state='pending', next_attempt_at=?", (int(next_attempt_at),)
+        )
+
+    def fail_import_job(
+        self, activity_id: str, error: str, next_attempt_at: int | None
+    ):
+        """Record a failed attempt. `next_attempt_at=None` dead-letters it."""
+        if next_attempt_at is None:
+            self._set_job(
+                activity_id,
+                "state='failed', attempts=attempts+1, last_error=?",
+                (error,),
+            )
+        else:
+            self._set_job(
+                activity_id,
+                "state='pending', attempts=attempts+1, last_error=?, next_attempt_at=?",
+                (error, int(next_attempt_at)),
+            )
+
+    def requeue_running_jobs(self) -> int:
+        """Crash recovery: a job left 'running' by a dead process is retried."""
+        with self._write() as c:
+            return c.execute(
+                "UPDATE import_jobs SET state='pending' WHERE state='running'"
+            ).rowcount
+
+    def import_job(self, activity_id: str) -> dict | None:
+        with self._conn() as c:
+            r = c.execute(
+                "SELECT state, attempts, next_attempt_at, last_error, priority, force "
+                "FROM import_jobs WHERE strava_activity_id=?",
+                (str(activity_id),),
+            ).fetchone()
+        if r is None:
+            return None
+        return {
+            "state": r[0],
+            "attempts": r[1],
+            "next_attempt_at": r[2],
+            "last_error": r[3],
+            "priority": r[4],
+            "force": bool(r[5]),
+        }
+
+    def import_job_counts(self) -> dict:
+        with self._conn() as c:
+            rows = c.execute(
+                "SELECT state, COUNT(*) FROM import_jobs GROUP BY state"
+            ).fetchall()
+        counts = {"pending": 0, "running": 0, "done": 0, "failed": 0}
+        counts.update({r[0]: r[1] for r in rows})
+        return counts
+
+    def failed_import_jobs(self, limit: int = 20) -> list[dict]:
+        with self._conn() as c:
+            rows = c.execute(
+                "SELECT strava_activity_id, activity_name, attempts, last_error, updated_at "
+                "FROM import_jobs WHERE state='failed' ORDER BY updated_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {
+                "strava_activity_id": r[0],
+                "activity_name": r[1],
+                "attempts": r[2],
+                "last_error": r[3],
+                "updated_at": r[4],
+            }
+            for r in rows
+        ]
+
+    def _set_job(self, activity_id: str, assignments: str, params: tuple = ()):
+        with self._write() as c:
+            c.execute(
+                f"UPDATE import_jobs SET {assignments}, updated_at=? "
+                "WHERE strava_activity_id=?",
+                (*params, _now_iso(), str(activity_id)),
+            )
+
     # ── Event log ─────────────────────────────────────────────────────────
     def log(self, level: str, message: str):
-        with self._lock, self._conn() as c:
+        entry = {"ts": _now_iso(), "level": level, "message": message}
+        with self._write() as c:
             c.execute(
                 "INSERT INTO log_events(ts, level, message) VALUES(?, ?, ?)",
-                (_now_iso(), level, message),
+                (entry["ts"], level, message),
             )
             c.execute(
                 "DELETE FROM log_events WHERE id NOT IN ("
                 "SELECT id FROM log_events ORDER BY id DESC LIMIT ?)",
                 (LOG_RETAIN_ROWS,),
             )
+        for listener in self._listeners:
+            listener("log", entry)
 
     def recent_logs(self, limit: int = 100) -> list[dict]:
         with self._conn() as c:
@@ -333,13 +959,20 @@ class State:
         return [{"ts": r[0], "level": r[1], "message": r[2]} for r in rows]
 
 
-def _now_iso() -> str:
-    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+def _summary_from_row(row) -> HevyWorkoutSummary:
+    return HevyWorkoutSummary(
+        workout_id=row[0],
+        start_ts=row[1],
+        end_ts=row[2],
+        exercises=tuple(
+            HevyExerciseSummary(template_id=t, duration_seconds=d, distance_meters=x)
+            for t, d, x in json.loads(row[3])
+        ),
+    )
 
 
-def _today_iso() -> str:
-    now = datetime.now(timezone.utc)
-    return now.strftime("%Y-%m-%dT00:00:00Z")
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
 def build_state() -> State:
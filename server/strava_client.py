@@ -7,17 +7,26 @@ flowing through the State object. Token rotation is persisted on every refresh.
 from __future__ import annotations
 
 import copy
+import logging
 import random
+import secrets
+import threading
 import uuid
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
 import requests
+from requests.adapters import HTTPAdapter
 from stravalib import Client
 
+import hr_samples
+from metrics import TOKEN_REFRESHES, requests_hook
+from rate_limit import BACKGROUND, URGENT, BudgetExhausted, StravaBudget
 from state import State
 
+log = logging.getLogger("strava_client")
+
 
 # Mirrors strava_api.ALL_ACTIVITY_TYPES — Hevy exercise template IDs.
 @dataclass(frozen=True)
@@ -49,13 +58,42 @@ class StravaError(Exception):
     pass
 
 
+class ActivityTypeFiltered(StravaError):
+    """The activity exists but its type isn't enabled for import."""
+
+
+class StravaRateLimited(StravaError):
+    """The request budget can't cover this call at the caller's priority."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
 class StravaClient:
     """Strava operations wrapped around a State for persistent tokens."""
 
     SCOPES = ["activity:read"]
-
-    def __init__(self, state: State):
+    # Strava's maximum per_page; one list request either way.
+    PAGE_SIZE = 200
+    # Refresh this long before expiry so a long backfill never runs into a
+    # token that lapses between pages.
+    REFRESH_AHEAD_SECONDS = 300
+    # Keep-alive connections held open to www.strava.com.
+    POOL_SIZE = 4
+
+    def __init__(self, state: State, budget: StravaBudget | None = None):
         self.state = state
+        self.budget = budget or StravaBudget()
+        # Every authenticated Client shares this session's connection pool.
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.POOL_SIZE)
+        self._session.mount("https://", adapter)
+        self._session.hooks["response"].append(requests_hook("strava"))
+        # Strava rotates refresh tokens too: the poller and a manual import
+        # refreshing at once would invalidate one another. Serialise them.
+        self._refresh_lock = threading.Lock()
+        self._cached_client: tuple[str, Client] | None = None
 
     # ── Credentials ───────────────────────────────────────────────────────
     def has_credentials(self) -> bool:
@@ -88,7 +126,33 @@ class StravaClient:
 
     # ── Authenticated client ──────────────────────────────────────────────
     def _refresh_if_needed(self) -> str:
-        """Ensure a non-expired access token is cached; return it."""
+        """Ensure a non-expired access token is cached; return it.
+
+        Single-flight: callers that find the token stale queue on the lock,
+        and all but the first see the fresh token on re-read.
+        """
+        token = self._current_token()
+        if token:
+            return token
+        with self._refresh_lock:
+            token = self._current_token()
+            if token:
+                return token
+            try:
+                resp = Client(requests_session=self._session).refresh_access_token(
+                    client_id=int(self.state.get("strava_client_id")),
+                    client_secret=self.state.get("strava_client_secret"),
+                    refresh_token=self.state.get("strava_refresh_token"),
+                )
+            except Exception:
+                TOKEN_REFRESHES.inc(upstream="strava", outcome="failed")
+                raise
+            TOKEN_REFRESHES.inc(upstream="strava", outcome="succeeded")
+            self._store_token(resp)
+            return resp["access_token"]
+
+    def _current_token(self) -> str | None:
+        """The stored access token, or None if it is due for refresh."""
         client_id = self.state.get("strava_client_id")
         client_secret = self.state.get("strava_client_secret")
         refresh_token = self.state.get("strava_refresh_token")
@@ -98,16 +162,13 @@ class StravaClient:
         access_token = self.state.get("strava_access_token")
         expires_at = self.state.get("strava_token_expires_at")
         now = int(datetime.now(timezone.utc).timestamp())
-        # Refresh if missing, expired, or within 60 seconds of expiry.
-        if not access_token or not expires_at or int(expires_at) - now < 60:
-            resp = Client().refresh_access_token(
-                client_id=int(client_id),
-                client_secret=client_secret,
-                refresh_token=refresh_token,
-            )
-            self._store_token(resp)
-            access_token = resp["access_token"]
-        return access_token
+        if (
+            access_token
+            and expires_at
+            and int(expires_at) - now >= self.REFRESH_AHEAD_SECONDS
+        ):
+            return access_token
+        return None
 
     def _store_token(self, resp: dict) -> None:
         self.state.set_many(
@@ -119,11 +180,81 @@ class StravaClient:
         )
 
     def _client(self) -> Client:
-        return Client(access_token=self._refresh_if_needed())
+        # The budget doubles as stravalib's rate_limiter so every response
+        # re-syncs it from X-RateLimit-* headers. The Client is reused until
+        # the token rotates.
+        token = self._refresh_if_needed()
+        cached = self._cached_client
+        if cached is None or cached[0] != token:
+            client = Client(
+                access_token=token,
+                rate_limiter=self.budget,
+                requests_session=self._session,
+            )
+            cached = self._cached_client = (token, client)
+        return cached[1]
+
+    def _spend(self, cost: int, priority: str) -> None:
+        try:
+            self.budget.acquire(cost, priority)
+        except BudgetExhausted as e:
+            raise StravaRateLimited(str(e), e.retry_after) from e
 
     def is_authorized(self) -> bool:
         return bool(self.state.get("strava_refresh_token"))
 
+    # ── Push subscription (webhooks) ──────────────────────────────────────
+    def webhook_verify_token(self) -> str:
+        """Shared secret echoed back by Strava during the callback challenge.
+        Generated on first use and kept for the life of the subscription."""
+        token = self.state.get("strava_webhook_verify_token")
+        if not token:
+            token = secrets.token_urlsafe(24)
+            self.state.set("strava_webhook_verify_token", token)
+        return token
+
+    def create_subscription(self, callback_url: str) -> str:
+        """Register `callback_url` with Strava. Strava calls the URL's GET
+        challenge synchronously before answering, so the route must already
+        be reachable. Returns the subscription id."""
+        client_id = self.state.get("strava_client_id")
+        client_secret = self.state.get("strava_client_secret")
+        if not client_id or not client_secret:
+            raise StravaError("Strava client ID/secret not configured")
+        try:
+            sub = Client().create_subscription(
+                client_id=int(client_id),
+                client_secret=client_secret,
+                callback_url=callback_url,
+                verify_token=self.webhook_verify_token(),
+            )
+        except Exception as e:
+            raise StravaError(f"Subscription create failed: {e}") from e
+        sub_id = str(sub.id)
+        self.state.set("strava_subscription_id", sub_id)
+        self.state.log("INFO", f"Strava webhook subscription {sub_id} created")
+        return sub_id
+
+    def delete_subscription(self) -> None:
+        sub_id = self.state.get("strava_subscription_id")
+        client_id = self.state.get("strava_client_id")
+        client_secret = self.state.get("strava_client_secret")
+        if not sub_id:
+            return
+        if client_id and client_secret:
+            try:
+                Client().delete_subscription(
+                    subscription_id=int(sub_id),
+                    client_id=int(client_id),
+                    client_secret=client_secret,
+                )
+            except Exception as e:
+                # Still forget it locally — a dangling subscription only
+                # means events we'll ignore.
+                self.state.log("WARN", f"Subscription delete failed: {e}")
+        self.state.set("strava_subscription_id", None)
+        self.state.log("INFO", f"Strava webhook subscription {sub_id} removed")
+
     # ── Activity discovery / import ───────────────────────────────────────
     def submittable_types(self, hevy_user_id: str | None) -> list[ActivityType]:
         enabled = set(self.state.get_json("enabled_types", []))
@@ -136,13 +267,19 @@ class StravaClient:
         return types
 
     def recent_activities(
-        self, hevy_user_id: str | None, limit: int = 5, lookback_hours: int = 168
+        self,
+        hevy_user_id: str | None,
+        limit: int = 5,
+        lookback_hours: int = 168,
+        priority: str = URGENT,
     ) -> list[dict]:
         """Return up to `limit` recent activities matching enabled types."""
-        client = self._client()
         submittable = self.submittable_types(hevy_user_id)
         if not submittable:
             return []
+        # One list page (limit=20 fits in a single request).
+        self._spend(1, priority)
+        client = self._client()
 
         # `after` ts trims pagination cost on the polling path.
         after = datetime.now(timezone.utc) - timedelta(hours=lookback_hours)
@@ -153,36 +290,85 @@ class StravaClient:
 
         matching: list[dict] = []
         for activity in activities:
-            for at in submittable:
-                if at.matches(activity.type):
-                    matching.append(
-                        {
-                            "id": str(activity.id),
-                            "name": activity.name,
-                            "type": at.type,
-                            "type_title": at.title,
-                            "start_date": _iso(activity.start_date),
-                            "distance": float(activity.distance) if activity.distance else 0,
-                            "moving_time": int(activity.moving_time) if activity.moving_time else 0,
-                        }
-                    )
-                    break
+            at = _matching_type(activity, submittable)
+            if at is not None:
+                matching.append(_summary(activity, at))
             if len(matching) >= limit:
                 break
         return matching
 
+    def activities_after(
+        self,
+        hevy_user_id: str | None,
+        cursor: tuple[int, int],
+        priority: str = BACKGROUND,
+        max_pages: int = 5,
+    ) -> tuple[list[dict], tuple[int, int], bool]:
+        """Walk activities that started after `cursor`, oldest first.
+
+        `cursor` is the (start epoch, activity id) of the newest activity
+        already seen. Returns (matching activities, advanced cursor, caught_up).
+        The cursor moves past every activity listed, enabled type or not, so
+        the caller can persist it and the next call only lists newer ones.
+        caught_up is False when `max_pages` or the budget ran out first; the
+        returned cursor is still valid to resume from.
+
+        Pages are keyed on the cursor rather than a page number. Strava
+        returns `after` queries in ascending start order, so asking again
+        from the last start time can't skip an activity that lands between
+        requests. The query starts one second early and drops anything at or
+        below the cursor, so siblings sharing a start second aren't lost at
+        a page boundary.
+        """
+        submittable = self.submittable_types(hevy_user_id)
+        matching: list[dict] = []
+        for _ in range(max_pages):
+            try:
+                self._spend(1, priority)
+            except StravaRateLimited:
+                return matching, cursor, False
+            page = list(
+                self._client().get_activities(
+                    after=datetime.fromtimestamp(cursor[0] - 1, timezone.utc),
+                    limit=self.PAGE_SIZE,
+                )
+            )
+            fresh = sorted(
+                (
+                    a
+                    for a in page
+                    if (_epoch(a.start_date), int(a.id)) > cursor
+                ),
+                key=lambda a: (_epoch(a.start_date), int(a.id)),
+            )
+            for activity in fresh:
+                at = _matching_type(activity, submittable)
+                if at is not None:
+                    matching.append(_summary(activity, at))
+            if fresh:
+                last = fresh[-1]
+                cursor = (_epoch(last.start_date), int(last.id))
+            if len(page) < self.PAGE_SIZE or not fresh:
+                return matching, cursor, True
+        return matching, cursor, False
+
     def build_hevy_workout(
         self,
         activity_id: str,
         hevy_user_id: str | None,
         is_private: bool,
+        priority: str = URGENT,
     ) -> tuple[dict, str]:
         """Return (workout_payload, hevy_workout_id) for a Strava activity.
 
         Mirrors strava_api.import_activity:225-308 but does not POST to Hevy —
         the caller submits the payload via HevyClient. Raises StravaError if
-        the activity does not match an enabled type.
+        the activity does not match an enabled type, StravaRateLimited if the
+        budget can't cover the detail + streams requests at `priority`.
         """
+        # Reserve both requests up front so a half-built import never
+        # strands the stream fetch behind a deferral.
+        self._spend(2, priority)
         client = self._client()
         submittable = self.submittable_types(hevy_user_id)
         activity = client.get_activity(activity_id)
@@ -191,7 +377,7 @@ class StravaClient:
             (at for at in submittable if at.matches(activity.type)), None
         )
         if matched is None:
-            raise StravaError(
+            raise ActivityTypeFiltered(
                 f"Activity type {activity.type} is not in enabled types"
             )
 
@@ -232,16 +418,17 @@ class StravaClient:
                 streams = client.get_activity_streams(
                     activity.id, types=["time", "heartrate"]
                 )
-                samples = []
-                for i in range(len(streams["time"].data)):
-                    samples.append(
-                        {
-                            "timestamp_ms": int(
-                                (activity.start_date.timestamp() + streams["time"].data[i])
-                                * 1000
-                            ),
-                            "bpm": streams["heartrate"].data[i],
-                        }
+                method = self.state.get("hr_downsample") or hr_samples.DEFAULT_METHOD
+                samples = hr_samples.heart_rate_samples(
+                    activity.start_date.timestamp(),
+                    streams["time"].data,
+                    streams["heartrate"].data,
+                    method,
+                )
+                if method != "none":
+                    log.debug(
+                        "HR samples for %s: %d → %d (%s)",
+                        activity_id, len(streams["time"].data), len(samples), method,
                     )
                 payload["workout"]["biometrics"] = {
                     "total_calories": activity.calories,
@@ -266,6 +453,28 @@ class StravaClient:
         return payload, local_id
 
 
+def _matching_type(activity, submittable: list[ActivityType]) -> ActivityType | None:
+    return next((at for at in submittable if at.matches(activity.type)), None)
+
+
+def _summary(activity, at: ActivityType) -> dict:
+    return {
+        "id": str(activity.id),
+        "name": activity.name,
+        "type": at.type,
+        "type_title": at.title,
+        "start_date": _iso(activity.start_date),
+        "distance": float(activity.distance) if activity.distance else 0,
+        "moving_time": int(activity.moving_time) if activity.moving_time else 0,
+    }
+
+
+def _epoch(dt) -> int:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
 def _iso(dt) -> str:
     if dt is None:
         return ""
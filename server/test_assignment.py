@@ -0,0 +1,131 @@
+"""Unit tests for assignment.py.
+
+Run from the server/ directory:
+    python -m unittest test_assignment
+"""
+
+from __future__ import annotations
+
+import itertools
+import random
+import unittest
+
+from assignment import _max_weight_matching, assign
+from matcher import AUTO_MERGE_THRESHOLD, MatchScore, best_match
+from test_matcher import T0, _brick_hevy, _hevy, _random_backfill, _strava
+
+
+def _edge(value: float) -> MatchScore:
+    return MatchScore("w", value, 1.0, value, None, None)
+
+
+class AssignTests(unittest.TestCase):
+    def test_resolves_greedy_conflict_optimally(self):
+        s1 = _strava(activity_id="s1", start=T0)
+        s2 = _strava(activity_id="s2", start=T0 + 600)
+        w1 = _hevy(workout_id="w1", start=T0 + 250)
+        w2 = _hevy(workout_id="w2", start=T0 - 300)
+        # Greedy: both activities want w1.
+        self.assertEqual(best_match(s1, [w1, w2]).auto_merge.workout_id, "w1")
+        self.assertEqual(best_match(s2, [w1, w2]).auto_merge.workout_id, "w1")
+
+        result = {a.activity_id: a.workout_id for a in assign([s1, s2], [w1, w2])}
+        self.assertEqual(result, {"s1": "w2", "s2": "w1"})
+
+    def test_workout_used_once(self):
+        runs = [_strava(activity_id=f"s{i}", start=T0 + 60 * i) for i in range(3)]
+        result = assign(runs, [_hevy(workout_id="only")])
+        self.assertEqual([a.activity_id for a in result], ["s0"])
+
+    def test_brick_takes_both_legs(self):
+        brick = _brick_hevy(
+            start=T0,
+            exercises=(("D8F7F851", 3600, 30000.0), ("AC1BB830", 1800, 5000.0)),
+        )
+        ride = _strava(
+            "Ride", start=T0, moving=3600, distance=30000.0, activity_id="ride"
+        )
+        # Recorded as one multisport session, so both legs start close by.
+        run = _strava(
+            "Run", start=T0 + 300, moving=1800, distance=5000.0, activity_id="run"
+        )
+        result = {a.activity_id: a.workout_id for a in assign([ride, run], [brick])}
+        self.assertEqual(result, {"ride": "brick", "run": "brick"})
+
+    def test_below_threshold_is_left_for_review(self):
+        s = _strava(start=T0)
+        self.assertEqual(assign([s], [_hevy(start=T0 + 20 * 60)]), [])
+
+    def test_pinned_user_merge_wins_and_frees_nothing_else(self):
+        s1 = _strava(activity_id="s1", start=T0)
+        s2 = _strava(activity_id="s2", start=T0 + 60)
+        w = _hevy(workout_id="w", start=T0)
+        result = assign([s1, s2], [w], pinned=[("s2", "w")])
+        self.assertEqual(len(result), 1)
+        self.assertEqual((result[0].activity_id, result[0].pinned), ("s2", True))
+        self.assertIsNone(result[0].score)
+
+    def test_pin_outside_batch_blocks_workout(self):
+        s = _strava(activity_id="s1")
+        result = assign([s], [_hevy(workout_id="w")], pinned=[("old", "w")])
+        self.assertEqual(result, [])
+
+    def test_random_history_invariants(self):
+        stravas, hevys = _random_backfill(11, 400, 600, days=120)
+        result = assign(stravas, hevys)
+        self.assertTrue(result)
+        used = [(a.workout_id, a.activity_id) for a in result]
+        by_id = {s.activity_id: s for s in stravas}
+        for a in result:
+            self.assertGreaterEqual(a.score.score, AUTO_MERGE_THRESHOLD)
+        # No two activities of the same type share a workout.
+        seen = set()
+        for workout_id, activity_id in used:
+            key = (workout_id, by_id[activity_id].activity_type)
+            self.assertNotIn(key, seen)
+            seen.add(key)
+        # At least as many merges as greedy leaves conflict-free.
+        greedy = {}
+        for s in stravas:
+            m = best_match(s, hevys).auto_merge
+            if m is not None:
+                greedy.setdefault((m.workout_id, s.activity_type), s.activity_id)
+        self.assertGreaterEqual(len(result), len(greedy))
+
+
+class HungarianTests(unittest.TestCase):
+    def _brute_force(self, weights):
+        rows, cols = len(weights), len(weights[0])
+        best = (0, 0.0)
+        for k in range(min(rows, cols), 0, -1):
+            for rs in itertools.combinations(range(rows), k):
+                for cs in itertools.permutations(range(cols), k):
+                    if all(weights[r][c] is not None for r, c in zip(rs, cs)):
+                        total = sum(weights[r][c].score for r, c in zip(rs, cs))
+                        best = max(best, (k, total))
+            if best[0]:
+                break
+        return best
+
+    def test_matches_brute_force(self):
+        rng = random.Random(3)
+        for _ in range(300):
+            rows, cols = rng.randint(1, 4), rng.randint(1, 5)
+            weights = [
+                [
+                    _edge(rng.uniform(0.85, 1.0)) if rng.random() < 0.5 else None
+                    for _ in range(cols)
+                ]
+                for _ in range(rows)
+            ]
+            pairs = _max_weight_matching(weights)
+            self.assertEqual(len({r for r, _ in pairs}), len(pairs))
+            self.assertEqual(len({c for _, c in pairs}), len(pairs))
+            got = (len(pairs), sum(weights[r][c].score for r, c in pairs))
+            want = self._brute_force(weights)
+            self.assertEqual(got[0], want[0])
+            self.assertAlmostEqual(got[1], want[1], places=9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+"""Smoke test for bench.py and the fake upstreams it runs against.
+
+Run from the server/ directory:
+    python -m unittest test_bench
+
+A two-second run with a handful of activities: checks the harness drives
+every workload end to end, not the numbers themselves.
+"""
+
+from __future__ import annotations
+
+import unittest
+
+try:
+    import uvicorn  # noqa: F401
+
+    from bench import BenchConfig, run
+    _BENCH_AVAILABLE = True
+except ImportError:
+    _BENCH_AVAILABLE = False
+
+
+@unittest.skipUnless(_BENCH_AVAILABLE, "uvicorn / stravalib not importable")
+class BenchSmokeTests(unittest.TestCase):
+    def test_short_run_imports_and_reports(self):
+        report = run(
+            BenchConfig(
+                duration=2.0, activities=6, latency=0.0, jitter=0.0,
+                poll_every=1.0, dashboards=2, think_time=0.05,
+            )
+        )
+        self.assertEqual(report["imports"]["total"], 6)
+        self.assertGreater(report["imports"]["per_minute"], 0)
+        for route in ("POST /api/sync", "GET /api/status", "GET /api/activities"):
+            self.assertIn("p99_ms", report["routes"][route])
+        self.assertIn("304", report["routes"]["GET /api/status"]["status"])
+        self.assertGreater(report["state_lock_wait"]["acquisitions"], 0)
+        self.assertGreater(report["upstream"]["strava"]["requests"], 0)
+        self.assertGreater(report["upstream"]["hevy"]["requests"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Unit tests for the SSE broadcaster in events.py.
+
+Run from the server/ directory:
+    python -m unittest test_events
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+
+from events import QUEUE_EVENTS, Broadcaster
+from state import State
+
+
+class BroadcasterTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.events = Broadcaster()
+
+    async def test_publish_reaches_every_subscriber(self):
+        a, b = self.events.subscribe(), self.events.subscribe()
+        self.events.publish("progress", {"stage": "fetched"})
+        for sub in (a, b):
+            event = await sub.get(timeout=1)
+            self.assertEqual((event.kind, event.data), ("progress", {"stage": "fetched"}))
+
+    async def test_publish_from_worker_thread(self):
+        sub = self.events.subscribe()
+        worker = threading.Thread(target=self.events.publish, args=("status",))
+        worker.start()
+        worker.join()
+        self.assertEqual((await sub.get(timeout=1)).kind, "status")
+
+    async def test_last_event_id_replays_missed_events(self):
+        first = self.events.publish("log", {"message": "one"})
+        self.events.publish("log", {"message": "two"})
+        sub = self.events.subscribe(last_event_id=first.id)
+        self.assertEqual((await sub.get(timeout=1)).data, {"message": "two"})
+        with self.assertRaises(asyncio.TimeoutError):
+            await sub.get(timeout=0.05)
+
+    async def test_slow_subscriber_drops_oldest(self):
+        sub = self.events.subscribe()
+        for i in range(QUEUE_EVENTS + 5):
+            self.events.publish("log", {"n": i})
+        await asyncio.sleep(0)
+        self.assertEqual((await sub.get(timeout=1)).data, {"n": 5})
+
+    async def test_unsubscribed_gets_nothing(self):
+        sub = self.events.subscribe()
+        self.events.unsubscribe(sub)
+        self.events.publish("status")
+        self.assertEqual(self.events.subscriber_count(), 0)
+        with self.assertRaises(asyncio.TimeoutError):
+            await sub.get(timeout=0.05)
+
+    async def test_close_ends_streams(self):
+        sub = self.events.subscribe()
+        self.events.close()
+        self.assertIsNone(await sub.get(timeout=1))
+        self.assertIsNone(await self.events.subscribe().get(timeout=1))
+
+
+class StateLogListenerTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+
+    def tearDown(self):
+        for p in (self.db_path, self.db_path + "-wal", self.db_path + "-shm"):
+            if os.path.exists(p):
+                os.unlink(p)
+
+    async def test_log_rows_are_published(self):
+        state = State(self.db_path)
+        events = Broadcaster()
+        state.add_listener(events.publish)
+        sub = events.subscribe()
+        state.log("WARN", "budget low")
+        event = await sub.get(timeout=1)
+        self.assertEqual(event.kind, "log")
+        self.assertEqual(event.data["message"], "budget low")
+        self.assertEqual(event.data["ts"], state.recent_logs(1)[0]["ts"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,224 @@
+"""Unit tests for the workout mirror and token refresh in hevy_client.py.
+
+Run from the server/ directory:
+    python -m unittest test_hevy_client
+
+Hevy's workouts_sync_batch endpoint is replaced by an in-process fake that
+answers the way the real one does: changed/new workouts in batches, ids the
+client holds that no longer exist, and isMore while batches remain. The
+refresh endpoint is faked the same way, rotating the refresh token on
+every call like Hevy does.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from matcher import StravaSummary
+from state import State
+
+try:
+    from hevy_client import HevyClient
+    _CLIENT_AVAILABLE = True
+except ImportError:
+    _CLIENT_AVAILABLE = False
+
+
+T0 = 1755906339
+
+
+def _workout(wid: str, start: int, updated_at: str = "2025-08-23T00:00:00.000Z") -> dict:
+    return {
+        "id": wid,
+        "short_id": wid[-4:],
+        "name": f"Workout {wid}",
+        "start_time": start,
+        "end_time": start + 3600,
+        "updated_at": updated_at,
+        "exercises": [
+            {
+                "exercise_template_id": "AC1BB830",
+                "sets": [{"duration_seconds": 3600, "distance_meters": 10000}],
+            }
+        ],
+    }
+
+
+class _Response:
+    def __init__(self, status_code: int, body: dict):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class FakeSyncSession:
+    BATCH = 2
+
+    def __init__(self, workouts: list[dict]):
+        self.server = {w["id"]: w for w in workouts}
+        self.transferred: list[str] = []
+        self.calls = 0
+
+    def post(self, url, data=None, timeout=None):
+        assert url.endswith("/workouts_sync_batch")
+        self.calls += 1
+        held = json.loads(data)
+        changed = [
+            w for wid, w in sorted(self.server.items()) if held.get(wid) != w["updated_at"]
+        ]
+        deleted = [wid for wid in held if wid not in self.server]
+        batch = changed[: self.BATCH]
+        self.transferred.extend(w["id"] for w in batch)
+        return _Response(
+            200,
+            {"updated": batch, "deleted": deleted, "isMore": len(changed) > self.BATCH},
+        )
+
+
+@unittest.skipUnless(_CLIENT_AVAILABLE, "requests not importable")
+class WorkoutMirrorTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.state = State(self.db_path)
+        self.client = HevyClient(self.state)
+        self.session = FakeSyncSession(
+            [_workout(f"w{i}", T0 + i * 86400) for i in range(5)]
+        )
+        self.client._auth_session = lambda: self.session
+
+    def tearDown(self):
+        for p in (self.db_path, self.db_path + "-wal", self.db_path + "-shm"):
+            if os.path.exists(p):
+                os.unlink(p)
+
+    def test_initial_sync_follows_is_more(self):
+        result = self.client.sync_workouts()
+        self.assertEqual(result["updated"], 5)
+        self.assertEqual(result["rounds"], 3)
+        self.assertTrue(result["complete"])
+        self.assertEqual(self.state.hevy_mirror_count(), 5)
+        self.assertIsNotNone(self.state.get("hevy_mirror_synced_at"))
+
+    def test_only_changed_workouts_are_transferred(self):
+        self.client.sync_workouts()
+        self.session.transferred.clear()
+        self.assertEqual(self.client.sync_workouts()["updated"], 0)
+
+        self.session.server["w3"] = _workout(
+            "w3", T0 + 3 * 86400 + 600, updated_at="2025-09-01T00:00:00.000Z"
+        )
+        self.client.sync_workouts()
+        self.assertEqual(self.session.transferred, ["w3"])
+
+    def test_deletes_remove_mirror_and_summary(self):
+        self.client.sync_workouts()
+        del self.session.server["w1"]
+        self.assertEqual(self.client.sync_workouts()["deleted"], 1)
+        self.assertNotIn("w1", self.state.hevy_workout_versions())
+        ids = {h.workout_id for h in self.state.hevy_summaries_between(0, 2**40)}
+        self.assertNotIn("w1", ids)
+
+    def test_mirror_feeds_matcher_candidates(self):
+        self.client.sync_workouts()
+        run = StravaSummary("s1", "Run", T0 + 2 * 86400 + 120, 3600, 10000.0)
+        self.assertEqual(
+            [h.workout_id for h in self.state.hevy_candidates(run)], ["w2"]
+        )
+
+    def test_round_cap_reports_incomplete(self):
+        result = self.client.sync_workouts(max_rounds=1)
+        self.assertFalse(result["complete"])
+        self.assertEqual(self.state.hevy_mirror_count(), 2)
+
+
+def _iso(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+class FakeRefreshSession:
+    """Stands in for the pooled session's POST to /auth/refresh_token."""
+
+    def __init__(self):
+        self.refreshes: list[str] = []
+        self._n = 0
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        assert url.endswith("/auth/refresh_token")
+        time.sleep(0.05)  # wide window for a racing caller
+        self.refreshes.append(json["refresh_token"])
+        self._n += 1
+        expires = datetime.now(timezone.utc) + timedelta(minutes=15)
+        return _Response(
+            200,
+            {
+                "access_token": f"access-{self._n}",
+                "refresh_token": f"refresh-{self._n}",
+                "expires_at": _iso(expires),
+            },
+        )
+
+
+@unittest.skipUnless(_CLIENT_AVAILABLE, "requests not importable")
+class TokenRefreshTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.state = State(self.db_path)
+        self.client = HevyClient(self.state)
+        self.fake = FakeRefreshSession()
+        self.client._session.post = self.fake.post
+
+    def tearDown(self):
+        for p in (self.db_path, self.db_path + "-wal", self.db_path + "-shm"):
+            if os.path.exists(p):
+                os.unlink(p)
+
+    def _store(self, expires_in: timedelta):
+        self.client.set_tokens(
+            "access-0", "refresh-0", _iso(datetime.now(timezone.utc) + expires_in)
+        )
+
+    def test_valid_token_is_reused(self):
+        self._store(timedelta(hours=1))
+        self.assertEqual(self.client._refresh_if_needed(), "access-0")
+        self.assertEqual(self.fake.refreshes, [])
+
+    def test_refreshes_ahead_of_expiry(self):
+        self._store(timedelta(seconds=60))
+        self.assertEqual(self.client._refresh_if_needed(), "access-1")
+        self.assertEqual(self.state.get("hevy_refresh_token"), "refresh-1")
+
+    def test_concurrent_callers_share_one_refresh(self):
+        self._store(timedelta(seconds=-1))
+        tokens = []
+        threads = [
+            threading.Thread(
+                target=lambda: tokens.append(self.client._refresh_if_needed())
+            )
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.fake.refreshes, ["refresh-0"])
+        self.assertEqual(tokens, ["access-1"] * 8)
+
+    def test_auth_session_is_shared(self):
+        self._store(timedelta(hours=1))
+        first = self.client._auth_session()
+        self.assertIs(self.client._auth_session(), first)
+        self.assertEqual(first.headers["Authorization"], "Bearer access-0")
+
+
+if __name__ == "__main__":
+    unittest.main()
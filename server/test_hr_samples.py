@@ -0,0 +1,100 @@
+"""Unit tests for hr_samples.py.
+
+Run from the server/ directory:
+    python -m unittest test_hr_samples
+"""
+
+from __future__ import annotations
+
+import unittest
+
+try:
+    import numpy as np
+
+    import hr_samples
+    _NUMPY_AVAILABLE = True
+except ImportError:
+    _NUMPY_AVAILABLE = False
+
+
+@unittest.skipUnless(_NUMPY_AVAILABLE, "numpy not importable")
+class DownsampleTests(unittest.TestCase):
+    def setUp(self):
+        self.t, self.bpm = hr_samples._synthetic_ride(hours=3)
+        # A lone spike the averaging methods would otherwise smooth over.
+        self.bpm[5000] = 199
+
+    def test_every_method_preserves_endpoints_min_and_max(self):
+        for method in hr_samples.METHODS:
+            with self.subTest(method=method):
+                keep = hr_samples.downsample(self.t, self.bpm, method)
+                self.assertTrue(np.all(np.diff(keep) > 0))
+                self.assertEqual(keep[0], 0)
+                self.assertEqual(keep[-1], len(self.t) - 1)
+                self.assertEqual(self.bpm[keep].max(), 199)
+                self.assertEqual(self.bpm[keep].min(), self.bpm.min())
+
+    def test_average_stays_close(self):
+        full = hr_samples.stats(self.t, self.bpm)["avg"]
+        for method in hr_samples.METHODS:
+            with self.subTest(method=method):
+                keep = hr_samples.downsample(self.t, self.bpm, method)
+                avg = hr_samples.stats(self.t[keep], self.bpm[keep])["avg"]
+                self.assertAlmostEqual(avg, full, delta=1.0)
+
+    def test_sizes(self):
+        n = len(self.t)
+        sizes = {
+            m: len(hr_samples.downsample(self.t, self.bpm, m))
+            for m in hr_samples.METHODS
+        }
+        self.assertEqual(sizes["none"], n)
+        self.assertLessEqual(sizes["lttb"], hr_samples.LTTB_POINTS + 2)
+        self.assertLessEqual(
+            sizes["interval"], n // hr_samples.INTERVAL_SECONDS + 3
+        )
+        self.assertLess(sizes["change"], n)
+
+    def test_short_streams_pass_through(self):
+        keep = hr_samples.downsample(np.array([0.0, 1.0]), np.array([90, 91]), "lttb")
+        self.assertEqual(keep.tolist(), [0, 1])
+
+    def test_unknown_method_rejected(self):
+        with self.assertRaises(ValueError):
+            hr_samples.downsample(self.t, self.bpm, "median")
+
+
+@unittest.skipUnless(_NUMPY_AVAILABLE, "numpy not importable")
+class HeartRateSamplesTests(unittest.TestCase):
+    def test_payload_shape_matches_desktop_encoding(self):
+        samples = hr_samples.heart_rate_samples(
+            1755907500.0, [0, 1, 2], [120, 121, 122], "none"
+        )
+        self.assertEqual(
+            samples[1], {"timestamp_ms": 1755907501000, "bpm": 121}
+        )
+        self.assertIs(type(samples[1]["timestamp_ms"]), int)
+        self.assertIs(type(samples[1]["bpm"]), int)
+
+    def test_unequal_stream_lengths_are_trimmed(self):
+        samples = hr_samples.heart_rate_samples(0, [0, 1, 2, 3], [100, 101], "none")
+        self.assertEqual(len(samples), 2)
+
+    def test_missing_samples_are_dropped(self):
+        samples = hr_samples.heart_rate_samples(
+            0, [0, 1, 2, None, 4], [100, None, 102, 103, 104], "none"
+        )
+        self.assertEqual(
+            [(s["timestamp_ms"], s["bpm"]) for s in samples],
+            [(0, 100), (2000, 102), (4000, 104)],
+        )
+
+    def test_report_shows_reduction(self):
+        t, bpm = hr_samples._synthetic_ride(hours=1)
+        rows = {r["method"]: r for r in hr_samples.report(t, bpm)}
+        self.assertLess(rows["lttb"]["bytes"], rows["none"]["bytes"] / 3)
+        self.assertEqual(rows["lttb"]["max"], rows["none"]["max"])
+
+
+if __name__ == "__main__":
+    unittest.main()
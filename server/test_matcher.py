@@ -8,15 +8,18 @@ No external dependencies; uses stdlib unittest only.
 
 from __future__ import annotations
 
+import random
 import unittest
 
 from matcher import (
     AUTO_MERGE_THRESHOLD,
     REVIEW_THRESHOLD,
+    CandidateIndex,
     HevyExerciseSummary,
     HevyWorkoutSummary,
     StravaSummary,
     best_match,
+    match_many,
     score,
     summarize_hevy,
 )
@@ -314,6 +317,102 @@ class BestMatchTests(unittest.TestCase):
         self.assertEqual(ordered, ["c10", "c15", "c20"])
 
 
+def _random_backfill(seed: int, n_strava: int, n_hevy: int, days: int = 30):
+    """A month of mixed activities with clustered start times, so ties,
+    near-misses, bricks and long workouts all turn up."""
+    rng = random.Random(seed)
+    types = ["Run", "Ride", "Walk", "VirtualRide", "Yoga"]
+    templates = ["AC1BB830", "D8F7F851", "33EDD7DB", "SQUAT"]
+    span = days * 86400
+    stravas = [
+        _strava(
+            activity_type=rng.choice(types),
+            start=T0 + rng.randrange(0, span, 300),
+            moving=rng.choice([0, 1800, 3600, 4101]),
+            distance=rng.choice([0.0, 5000.0, 10030.0]),
+            activity_id=f"s{i}",
+        )
+        for i in range(n_strava)
+    ]
+    hevys = []
+    for i in range(n_hevy):
+        start = T0 + rng.randrange(0, span, 300)
+        if i % 2:
+            # Logged alongside a Strava activity, a few minutes apart.
+            start = rng.choice(stravas).start_ts + rng.randrange(-900, 900, 60)
+        n_ex = rng.choice([1, 1, 2])
+        exercises = tuple(
+            HevyExerciseSummary(
+                template_id=rng.choice(templates),
+                duration_seconds=rng.choice([0, 1800, 3600]),
+                distance_meters=rng.choice([0.0, 5000.0]),
+            )
+            for _ in range(n_ex)
+        )
+        hevys.append(
+            HevyWorkoutSummary(
+                workout_id=f"h{i}",
+                start_ts=start,
+                end_ts=start + rng.choice([0, 1800, 4 * 3600]),
+                exercises=exercises,
+            )
+        )
+    return stravas, hevys
+
+
+class MatchManyTests(unittest.TestCase):
+    def test_buckets_identical_to_best_match(self):
+        for seed in range(5):
+            stravas, hevys = _random_backfill(seed, 120, 400)
+            batch = match_many(stravas, hevys)
+            self.assertEqual(list(batch), [s.activity_id for s in stravas])
+            for s in stravas:
+                with self.subTest(seed=seed, activity=s.activity_id):
+                    full = best_match(s, hevys)
+                    self.assertEqual(batch[s.activity_id].auto_merge, full.auto_merge)
+                    self.assertEqual(batch[s.activity_id].review, full.review)
+                    # rejected is the windowed subset of the full list's
+                    self.assertTrue(
+                        set(batch[s.activity_id].rejected) <= set(full.rejected)
+                    )
+
+    def test_rejected_is_limited_to_the_window(self):
+        hevys = [
+            _hevy(workout_id="close", start=T0 + 60),
+            _hevy(workout_id="late-short", start=T0 + 25 * 60, duration=60),
+            _hevy(workout_id="next-day", start=T0 + 86400),
+        ]
+        result = match_many([_strava()], hevys)["12345"]
+        self.assertEqual(result.auto_merge.workout_id, "close")
+        self.assertEqual([m.workout_id for m in result.rejected], ["late-short"])
+        self.assertIn(
+            "next-day", [m.workout_id for m in best_match(_strava(), hevys).rejected]
+        )
+
+    def test_index_prunes_by_time_and_type(self):
+        hevys = [
+            _hevy(workout_id="near-run", start=T0 + 60),
+            _hevy(workout_id="near-lift", start=T0 + 60, template_ids=("SQUAT",)),
+            _hevy(workout_id="next-day", start=T0 + 86400),
+        ]
+        index = CandidateIndex(hevys)
+        self.assertEqual(
+            [w.workout_id for w in index.candidates_for(_strava())], ["near-run"]
+        )
+        self.assertEqual(index.candidates_for(_strava("Yoga")), [])
+
+    def test_long_overlapping_workout_is_not_pruned(self):
+        # Hevy session started 3 h before the Strava run and is still open.
+        long = _hevy(workout_id="long", start=T0 - 3 * 3600, end=T0 + 3600)
+        index = CandidateIndex([long])
+        self.assertEqual(index.candidates_for(_strava())[0].workout_id, "long")
+
+    def test_reuses_a_prebuilt_index(self):
+        index = CandidateIndex([_hevy(workout_id="close", start=T0 + 60)])
+        result = match_many([_strava()], index)
+        self.assertEqual(result["12345"].auto_merge.workout_id, "close")
+
+
 class SummarizeHevyTests(unittest.TestCase):
     """Verifies summarize_hevy handles the real payload shape."""
 
@@ -0,0 +1,150 @@
+"""Unit tests for the metrics registry in metrics.py.
+
+Run from the server/ directory:
+    python -m unittest test_metrics
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+import unittest
+
+import metrics
+from metrics import Counter, Gauge, Histogram, endpoint
+
+try:
+    from fake_upstreams import HEVY_HOST, FakeHevy, route_to
+    from hevy_client import HevyClient
+
+    _CLIENT_AVAILABLE = True
+except ImportError:  # pragma: no cover - requests missing
+    _CLIENT_AVAILABLE = False
+
+from state import State
+
+
+class _RegistryCase(unittest.TestCase):
+    def metric(self, cls, *args, **kwargs):
+        """A throwaway metric, dropped from the global registry afterwards."""
+        m = cls(*args, **kwargs)
+        self.addCleanup(metrics._registry.remove, m)
+        return m
+
+
+class RegistryTests(_RegistryCase):
+    def test_counter_exposition(self):
+        c = self.metric(Counter, "t_jobs_total", "Jobs.", ["outcome"])
+        c.inc(outcome="ok")
+        c.inc(2, outcome="ok")
+        c.inc(outcome='a "b"')
+        self.assertEqual(
+            c.render(),
+            [
+                "# HELP t_jobs_total Jobs.",
+                "# TYPE t_jobs_total counter",
+                't_jobs_total{outcome="a \\"b\\""} 1',
+                't_jobs_total{outcome="ok"} 3',
+            ],
+        )
+        self.assertEqual(c.value(outcome="ok"), 3)
+
+    def test_gauge_without_labels(self):
+        g = self.metric(Gauge, "t_depth", "Depth.")
+        g.set(4)
+        g.set(2.5)
+        self.assertEqual(g.render()[-1], "t_depth 2.5")
+
+    def test_histogram_buckets_are_cumulative(self):
+        h = self.metric(Histogram, "t_seconds", "Time.", ["op"], buckets=(0.1, 1.0))
+        for v in (0.05, 0.1, 0.5, 3.0):
+            h.observe(v, op="x")
+        self.assertEqual(
+            h.render()[2:],
+            [
+                't_seconds_bucket{op="x",le="0.1"} 2',
+                't_seconds_bucket{op="x",le="1"} 3',
+                't_seconds_bucket{op="x",le="+Inf"} 4',
+                't_seconds_sum{op="x"} 3.65',
+                't_seconds_count{op="x"} 4',
+            ],
+        )
+        self.assertEqual(h.count(op="x"), 4)
+        self.assertEqual(h.count(op="y"), 0)
+
+    def test_time_observes_even_on_error(self):
+        h = self.metric(Histogram, "t_block_seconds", "Time.")
+        with self.assertRaises(RuntimeError):
+            with h.time():
+                raise RuntimeError
+        self.assertEqual(h.count(), 1)
+
+    def test_labels_must_match(self):
+        c = self.metric(Counter, "t_labelled_total", "Labelled.", ["a"])
+        with self.assertRaises(ValueError):
+            c.inc()
+        with self.assertRaises(ValueError):
+            c.inc(a="1", b="2")
+
+    def test_render_includes_service_metrics(self):
+        text = metrics.render()
+        self.assertTrue(text.endswith("\n"))
+        for name in ("utb_imports_total", "utb_poll_duration_seconds", "utb_queue_depth"):
+            self.assertIn(f"# TYPE {name} ", text)
+
+
+class EndpointTests(unittest.TestCase):
+    def test_ids_collapse(self):
+        cases = {
+            "/api/v3/activities/123456/streams": "/api/v3/activities/{id}/streams",
+            "/v2/workout/3f2b1c9e-4a5d-4e6f-8a7b-9c0d1e2f3a4b": "/v2/workout/{id}",
+            "/api/v3/athlete/activities": "/api/v3/athlete/activities",
+            "": "/",
+        }
+        for path, want in cases.items():
+            with self.subTest(path=path):
+                self.assertEqual(endpoint(path), want)
+
+
+@unittest.skipUnless(_CLIENT_AVAILABLE, "requests not importable")
+class UpstreamHookTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.fake = FakeHevy()
+        self.fake.start()
+        self.addCleanup(self.fake.stop)
+        self.client = HevyClient(State(self.db_path))
+        route_to(self.client._session, {HEVY_HOST: self.fake.url})
+
+    def tearDown(self):
+        for p in (self.db_path, self.db_path + "-wal", self.db_path + "-shm"):
+            if os.path.exists(p):
+                os.unlink(p)
+
+    def test_refresh_and_request_are_recorded(self):
+        refreshes = metrics.TOKEN_REFRESHES.value(upstream="hevy", outcome="succeeded")
+        ok = metrics.UPSTREAM_REQUESTS.value(upstream="hevy", method="POST", status="200")
+        calls = metrics.UPSTREAM_SECONDS.count(
+            upstream="hevy", method="POST", endpoint="/auth/refresh_token"
+        )
+        self.client.set_tokens("expired", "refresh-0", "2000-01-01T00:00:00.000Z")
+        self.client._refresh_if_needed()
+        self.assertEqual(
+            metrics.TOKEN_REFRESHES.value(upstream="hevy", outcome="succeeded"),
+            refreshes + 1,
+        )
+        self.assertEqual(
+            metrics.UPSTREAM_REQUESTS.value(upstream="hevy", method="POST", status="200"),
+            ok + 1,
+        )
+        self.assertEqual(
+            metrics.UPSTREAM_SECONDS.count(
+                upstream="hevy", method="POST", endpoint="/auth/refresh_token"
+            ),
+            calls + 1,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,347 @@
+"""Unit tests for the import paths in poller.py.
+
+Run from the server/ directory:
+    python -m unittest test_poller
+
+Strava and Hevy are replaced by in-process fakes; State is real, on a
+tempfile, so queue semantics are exercised end to end.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from fake_strava_events import activity_event, deauthorize_event
+from state import State
+
+try:
+    from poller import Poller, backoff_seconds
+    from rate_limit import StravaBudget
+    from strava_client import ActivityTypeFiltered, StravaError, StravaRateLimited
+    _POLLER_AVAILABLE = True
+except ImportError:
+    _POLLER_AVAILABLE = False
+
+
+class FakeStrava:
+    """Builds a minimal payload per activity id; behaviour is scripted via
+    `filtered`, `rate_limited` and `fail` sets of activity ids."""
+
+    def __init__(self):
+        self.budget = StravaBudget()
+        self.built: list[str] = []
+        self.filtered: set[str] = set()
+        self.rate_limited: set[str] = set()
+        self.fail: set[str] = set()
+        # Activity summaries returned by activities_after, each with a
+        # "start_ts"; `listed_from` records the cursor of every call.
+        self.feed: list[dict] = []
+        self.listed_from: list[tuple[int, int]] = []
+        self.caught_up = True
+
+    def is_authorized(self) -> bool:
+        return True
+
+    def build_hevy_workout(self, activity_id, hevy_user_id, is_private, priority="urgent"):
+        aid = str(activity_id)
+        if aid in self.rate_limited:
+            raise StravaRateLimited("budget low", 60)
+        if aid in self.filtered:
+            raise ActivityTypeFiltered("Yoga is not enabled")
+        if aid in self.fail:
+            raise StravaError("upstream 500")
+        self.built.append(aid)
+        payload = {
+            "workout": {
+                "title": f"Activity {aid}",
+                "exercises": [{"title": "Running"}],
+            }
+        }
+        return payload, f"hevy-{aid}"
+
+    def activities_after(self, hevy_user_id, cursor, priority="background", max_pages=5):
+        self.listed_from.append(tuple(cursor))
+        fresh = sorted(
+            (a for a in self.feed if (a["start_ts"], int(a["id"])) > tuple(cursor)),
+            key=lambda a: (a["start_ts"], int(a["id"])),
+        )
+        reached = (fresh[-1]["start_ts"], int(fresh[-1]["id"])) if fresh else tuple(cursor)
+        return fresh, reached, self.caught_up
+
+
+class FakeHevy:
+    def __init__(self):
+        self.submitted: list[str] = []
+        self.status = 200
+
+    def is_authorized(self) -> bool:
+        return True
+
+    def user_id(self) -> str:
+        return "user-1"
+
+    def submit_workout(self, payload, workout_id) -> int:
+        self.submitted.append(workout_id)
+        return self.status
+
+
+class RecordingEvents:
+    """Broadcaster stand-in that keeps what was published."""
+
+    def __init__(self):
+        self.published: list[tuple[str, dict]] = []
+
+    def publish(self, kind, data=None):
+        self.published.append((kind, data or {}))
+
+    def stages(self) -> list[str]:
+        return [d["stage"] for k, d in self.published if k == "progress"]
+
+
+class _PollerCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.state = State(self.db_path)
+        self.strava = FakeStrava()
+        self.hevy = FakeHevy()
+        self.events = RecordingEvents()
+        self.poller = Poller(self.state, self.strava, self.hevy, self.events)
+
+    def tearDown(self):
+        for p in (self.db_path, self.db_path + "-wal", self.db_path + "-shm"):
+            if os.path.exists(p):
+                os.unlink(p)
+
+    def _drain(self) -> dict:
+        """One loop tick's worth of work: inbox → jobs → imports."""
+        async def tick():
+            await self.poller.drain_webhooks()
+            return await self.poller.drain_jobs()
+
+        return asyncio.run(tick())
+
+    def _make_due(self, activity_id: str):
+        self.state.defer_import_job(activity_id, int(time.time()) - 1)
+
+
+@unittest.skipUnless(_POLLER_AVAILABLE, "stravalib / requests not importable")
+class WebhookDrainTests(_PollerCase):
+    def test_create_event_imports_and_clears_queue(self):
+        self.state.enqueue_webhook_event(activity_event(111))
+        result = self._drain()
+        self.assertEqual([r["id"] for r in result["imported"]], ["111"])
+        self.assertTrue(self.state.is_imported("111"))
+        self.assertEqual(self.hevy.submitted, ["hevy-111"])
+        self.assertEqual(self.state.webhook_backlog(), 0)
+
+    def test_duplicate_create_is_skipped_without_upstream_calls(self):
+        self.state.mark_imported("111", "Run", "Run", "hevy-111")
+        self.state.enqueue_webhook_event(activity_event(111))
+        self._drain()
+        self.assertEqual(self.strava.built, [])
+        self.assertIsNone(self.state.import_job("111"))
+
+    def test_update_event_reimports_already_imported_activity(self):
+        self.state.mark_imported("111", "Run", "Run", "hevy-111")
+        self.state.enqueue_webhook_event(activity_event(111, aspect_type="update"))
+        self._drain()
+        self.assertEqual(self.hevy.submitted, ["hevy-111"])
+
+    def test_delete_and_deauthorize_are_acknowledged_only(self):
+        self.state.enqueue_webhook_event(activity_event(111, aspect_type="delete"))
+        self.state.enqueue_webhook_event(deauthorize_event())
+        self._drain()
+        self.assertEqual(self.strava.built, [])
+        self.assertEqual(self.state.webhook_backlog(), 0)
+        self.assertIn(
+            "revoked", " ".join(e["message"] for e in self.state.recent_logs())
+        )
+
+    def test_filtered_type_is_dropped_quietly(self):
+        self.strava.filtered.add("111")
+        self.state.enqueue_webhook_event(activity_event(111))
+        result = self._drain()
+        self.assertEqual(result["skipped"], ["111"])
+        self.assertEqual(result["errors"], [])
+        self.assertEqual(self.state.import_job("111")["state"], "done")
+
+
+@unittest.skipUnless(_POLLER_AVAILABLE, "stravalib / requests not importable")
+class ImportJobTests(_PollerCase):
+    def test_rate_limited_job_deferred_without_spending_an_attempt(self):
+        self.strava.rate_limited.add("111")
+        self.state.enqueue_import("111", source="poll")
+        result = self._drain()
+        self.assertEqual(result["deferred"], ["111"])
+        job = self.state.import_job("111")
+        self.assertEqual(job["state"], "pending")
+        self.assertEqual(job["attempts"], 0)
+        self.assertGreater(job["next_attempt_at"], time.time() + 30)
+
+    def test_failure_backs_off_then_succeeds(self):
+        self.strava.fail.add("111")
+        self.state.enqueue_import("111", source="poll")
+        before = int(time.time())
+        result = self._drain()
+        self.assertEqual(len(result["errors"]), 1)
+        job = self.state.import_job("111")
+        self.assertEqual((job["state"], job["attempts"]), ("pending", 1))
+        self.assertGreaterEqual(job["next_attempt_at"], before + Poller.BACKOFF_BASE_SECONDS)
+        # Not due yet: a second tick doesn't retry.
+        self._drain()
+        self.assertEqual(self.state.import_job("111")["attempts"], 1)
+
+        self.strava.fail.clear()
+        self._make_due("111")
+        self._drain()
+        self.assertEqual(self.state.import_job("111")["state"], "done")
+        self.assertTrue(self.state.is_imported("111"))
+
+    def test_hevy_rejection_is_retried_not_recorded(self):
+        self.hevy.status = 500
+        self.state.enqueue_import("111", source="poll")
+        self._drain()
+        self.assertFalse(self.state.is_imported("111"))
+        self.assertEqual(self.state.import_job("111")["last_error"], "HTTP 500")
+
+    def test_dead_letter_after_max_attempts(self):
+        self.strava.fail.add("111")
+        self.state.enqueue_import("111", source="poll")
+        for _ in range(Poller.MAX_ATTEMPTS):
+            self._make_due("111")
+            self._drain()
+        job = self.state.import_job("111")
+        self.assertEqual(job["state"], "failed")
+        self.assertEqual(job["attempts"], Poller.MAX_ATTEMPTS)
+        # A later poll doesn't resurrect it; an explicit retry does.
+        self.assertFalse(self.state.enqueue_import("111", source="poll"))
+        self.assertTrue(self.state.enqueue_import("111", source="manual", force=True))
+        self.assertEqual(self.state.import_job("111")["attempts"], 0)
+
+    def test_urgent_jobs_claimed_first(self):
+        for i in range(Poller.JOBS_PER_DRAIN):
+            self.state.enqueue_import(f"bg-{i}", source="schedule")
+        self.state.enqueue_import("manual-1", source="manual", priority=1)
+        self._drain()
+        self.assertIn("manual-1", self.strava.built)
+        self.assertEqual(len(self.strava.built), Poller.JOBS_PER_DRAIN)
+
+    def test_progress_published_per_job(self):
+        self.strava.rate_limited.add("222")
+        self.strava.fail.add("333")
+        for aid in ("111", "222", "333"):
+            self.state.enqueue_import(aid, source="poll")
+        self._drain()
+        self.assertEqual(
+            sorted(self.events.stages()),
+            ["building"] * 3 + ["deferred", "error", "submitted"],
+        )
+        self.assertEqual(self.events.published[-1], ("status", {}))
+
+    def test_interrupted_running_jobs_requeued_on_start(self):
+        self.state.enqueue_import("111", source="poll")
+        self.state.claim_import_jobs(10)
+        self.assertEqual(self.state.import_job("111")["state"], "running")
+        self.assertEqual(self.state.requeue_running_jobs(), 1)
+        self._drain()
+        self.assertTrue(self.state.is_imported("111"))
+
+
+def _activity(aid: int, start_ts: int, name: str | None = None) -> dict:
+    return {
+        "id": str(aid),
+        "name": name or f"Activity {aid}",
+        "type": "Run",
+        "type_title": "Running",
+        "start_ts": start_ts,
+    }
+
+
+@unittest.skipUnless(_POLLER_AVAILABLE, "stravalib / requests not importable")
+class CursorPollTests(_PollerCase):
+    def _poll(self, triggered_by: str = "schedule") -> dict:
+        return asyncio.run(self.poller.poll_once(triggered_by=triggered_by))
+
+    def test_scheduled_polls_list_only_past_the_cursor(self):
+        now = int(time.time())
+        self.strava.feed = [_activity(1, now - 600), _activity(2, now - 300)]
+        self._poll()  # first poll is a deep pass over the lookback window
+        self.assertEqual(self.state.get_json("strava_poll_cursor", None), [now - 300, 2])
+        self.assertEqual(set(self.strava.built), {"1", "2"})
+
+        self.strava.feed.append(_activity(3, now - 60))
+        self._poll()
+        self.assertEqual(self.strava.listed_from[-1], (now - 300, 2))
+        self.assertEqual(self.strava.built[-1], "3")
+        self.assertEqual(self.state.get_json("strava_poll_cursor", None), [now - 60, 3])
+
+    def test_partial_listing_keeps_deep_pass_due(self):
+        self.strava.caught_up = False
+        self.strava.feed = [_activity(1, int(time.time()) - 60)]
+        self._poll()
+        self.assertEqual(self.state.get_int("last_deep_reconcile_ts"), 0)
+        self.assertEqual(self.state.get_json("strava_poll_cursor", None)[1], 1)
+
+    def test_deep_pass_reimports_edited_activity(self):
+        now = int(time.time())
+        self.strava.feed = [_activity(1, now - 600)]
+        self._poll()
+        self.assertEqual(self.hevy.submitted, ["hevy-1"])
+
+        self.strava.feed = [_activity(1, now - 600, name="Morning Run (renamed)")]
+        self._poll()  # incremental: cursor is past it, nothing listed
+        self.assertEqual(self.hevy.submitted, ["hevy-1"])
+        self._poll(triggered_by="manual")  # manual sync is a deep pass
+        self.assertEqual(self.hevy.submitted, ["hevy-1", "hevy-1"])
+
+    def test_unchanged_imports_are_skipped_on_deep_pass(self):
+        now = int(time.time())
+        self.strava.feed = [_activity(1, now - 600)]
+        self._poll()
+        result = self._poll(triggered_by="manual")
+        self.assertEqual(result["skipped"], ["1"])
+        self.assertEqual(self.hevy.submitted, ["hevy-1"])
+
+
+@unittest.skipUnless(_POLLER_AVAILABLE, "stravalib / requests not importable")
+class HevySyncTests(_PollerCase):
+    def test_non_hevy_errors_are_logged_not_raised(self):
+        def sync_workouts():
+            raise sqlite3.OperationalError("database is locked")
+
+        self.hevy.sync_workouts = sync_workouts
+        result = asyncio.run(self.poller.sync_hevy())
+        self.assertEqual(result, {"error": "database is locked"})
+        self.assertIn(
+            "Hevy workout sync failed", self.state.recent_logs(1)[0]["message"]
+        )
+
+
+@unittest.skipUnless(_POLLER_AVAILABLE, "stravalib / requests not importable")
+class BackoffTests(unittest.TestCase):
+    def test_grows_exponentially_within_jittered_bounds(self):
+        rng = random.Random(7)
+        for attempts in range(1, 8):
+            ceiling = min(3600, 60 * 2 ** (attempts - 1))
+            for _ in range(50):
+                d = backoff_seconds(attempts, 60, 3600, rng)
+                self.assertGreaterEqual(d, 60)
+                self.assertLessEqual(d, ceiling)
+
+    def test_capped(self):
+        self.assertLessEqual(backoff_seconds(30, 60, 3600), 3600)
+
+    def test_jitter_spreads_simultaneous_failures(self):
+        rng = random.Random(1)
+        delays = {backoff_seconds(5, 60, 3600, rng) for _ in range(20)}
+        self.assertGreater(len(delays), 10)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""Unit tests for the Strava request budget in rate_limit.py.
+
+Run from the server/ directory:
+    python -m unittest test_rate_limit
+
+Uses a fake clock so window rollover is deterministic.
+"""
+
+from __future__ import annotations
+
+import unittest
+
+from rate_limit import (
+    BACKGROUND,
+    URGENT,
+    BudgetExhausted,
+    StravaBudget,
+)
+
+
+# 2025-08-23T00:05:00Z — five minutes into a quarter-hour window.
+T0 = 1755907500
+
+
+class _Clock:
+    def __init__(self, now: int = T0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return float(self.now)
+
+
+def _headers(usage: str, limit: str = "200,2000") -> dict:
+    return {"X-RateLimit-Usage": usage, "X-RateLimit-Limit": limit}
+
+
+class StravaBudgetTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        self.budget = StravaBudget(clock=self.clock)
+
+    def test_headers_resync_usage_and_limits(self):
+        self.budget.observe(_headers("37,412", "100,1000"))
+        snap = self.budget.snapshot()
+        self.assertEqual(snap["short"]["limit"], 100)
+        self.assertEqual(snap["short"]["remaining"], 63)
+        self.assertEqual(snap["daily"]["remaining"], 588)
+
+    def test_header_names_are_case_insensitive(self):
+        self.budget.observe({"x-ratelimit-usage": "10,10", "x-ratelimit-limit": "200,2000"})
+        self.assertEqual(self.budget.snapshot()["short"]["usage"], 10)
+
+    def test_read_limit_preferred_for_get(self):
+        headers = _headers("10,10")
+        headers["X-ReadRateLimit-Usage"] = "90,500"
+        headers["X-ReadRateLimit-Limit"] = "100,1000"
+        self.budget.observe(headers, "GET")
+        self.assertEqual(self.budget.snapshot()["short"]["remaining"], 10)
+        self.budget.observe(headers, "POST")
+        self.assertEqual(self.budget.snapshot()["short"]["remaining"], 190)
+
+    def test_missing_or_garbage_headers_ignored(self):
+        self.budget.observe({})
+        self.budget.observe(_headers("n/a"))
+        self.assertEqual(self.budget.snapshot()["short"]["usage"], 0)
+
+    def test_acquire_debits_locally(self):
+        self.budget.acquire(3)
+        self.assertEqual(self.budget.snapshot()["short"]["usage"], 3)
+        self.assertEqual(self.budget.snapshot()["daily"]["usage"], 3)
+
+    def test_background_deferred_inside_reserve(self):
+        # 20% of 200 is held back; 165 used leaves 35 < 40.
+        self.budget.observe(_headers("165,400"))
+        with self.assertRaises(BudgetExhausted) as ctx:
+            self.budget.acquire(1, BACKGROUND)
+        # Five minutes into the window → ten minutes to the reset.
+        self.assertEqual(ctx.exception.retry_after, 600)
+        self.assertTrue(self.budget.would_defer(BACKGROUND))
+        # Nothing was debited by the refused call.
+        self.assertEqual(self.budget.snapshot()["short"]["usage"], 165)
+
+    def test_urgent_may_spend_the_reserve(self):
+        self.budget.observe(_headers("165,400"))
+        self.budget.acquire(2, URGENT)
+        self.assertEqual(self.budget.snapshot()["short"]["remaining"], 33)
+
+    def test_urgent_refused_when_window_empty(self):
+        self.budget.observe(_headers("200,400"))
+        with self.assertRaises(BudgetExhausted):
+            self.budget.acquire(1, URGENT)
+
+    def test_daily_window_also_gates(self):
+        self.budget.observe(_headers("0,1990"))
+        with self.assertRaises(BudgetExhausted):
+            self.budget.acquire(1, BACKGROUND)
+        self.budget.acquire(1, URGENT)
+
+    def test_short_window_rolls_over_on_quarter_hour(self):
+        self.budget.observe(_headers("200,400"))
+        self.clock.now += 10 * 60
+        snap = self.budget.snapshot()
+        self.assertEqual(snap["short"]["usage"], 0)
+        # Daily usage survives the quarter-hour reset.
+        self.assertEqual(snap["daily"]["usage"], 400)
+        self.budget.acquire(1, BACKGROUND)
+
+    def test_daily_window_rolls_over_at_utc_midnight(self):
+        self.budget.observe(_headers("0,2000"))
+        self.clock.now += 24 * 3600
+        self.assertEqual(self.budget.snapshot()["daily"]["usage"], 0)
+
+    def test_callable_as_stravalib_rate_limiter(self):
+        self.budget(_headers("50,60"), "GET")
+        self.assertEqual(self.budget.snapshot()["short"]["usage"], 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
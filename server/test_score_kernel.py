@@ -0,0 +1,103 @@
+"""Property tests: score_kernel.py must agree with matcher.score().
+
+Run from the server/ directory:
+    python -m unittest test_score_kernel
+"""
+
+from __future__ import annotations
+
+import math
+import random
+import unittest
+
+from matcher import score
+from test_matcher import T0, _brick_hevy, _hevy, _random_backfill, _strava
+
+try:
+    import numpy as np
+
+    from score_kernel import HevyArrays, score_matrix
+    _NUMPY_AVAILABLE = True
+except ImportError:
+    _NUMPY_AVAILABLE = False
+
+
+# The scenarios test_matcher exercises pair by pair, as one batch.
+SCENARIO_STRAVAS = [
+    _strava(),
+    _strava(start=T0 + 12 * 60),
+    _strava(moving=0),
+    _strava(distance=0.0),
+    _strava(distance=float("nan")),
+    _strava(moving=-5),
+    _strava("Ride", moving=3600, distance=30000.0),
+    _strava("VirtualRide", moving=3600, distance=30000.0),
+    _strava("Walk"),
+    _strava("Yoga"),
+]
+SCENARIO_HEVYS = [
+    _hevy(),
+    _hevy(workout_id="far", start=T0 + 30 * 60),
+    _hevy(workout_id="close", start=T0 + 60),
+    _hevy(workout_id="half", duration=2050, distance=5015.0),
+    _hevy(workout_id="no-dist", distance=0.0),
+    _hevy(workout_id="inf", distance=float("inf")),
+    _hevy(workout_id="lifts", template_ids=("SQUAT", "BENCH")),
+    _hevy(workout_id="vr", template_ids=("89f3ed93-5418-4cc6-a114-0590f2977ae8",)),
+    _hevy(workout_id="zero-span", end=T0),
+    _brick_hevy(
+        exercises=(("D8F7F851", 1800, 15000.0), ("AC1BB830", 4101, 10030.0))
+    ),
+    _brick_hevy(
+        workout_id="double-run",
+        exercises=(("AC1BB830", 2000, 5000.0), ("AC1BB830", 2101, 5030.0)),
+    ),
+]
+
+
+@unittest.skipUnless(_NUMPY_AVAILABLE, "numpy not importable")
+class ScoreKernelParityTests(unittest.TestCase):
+    def assertMatchesScalar(self, stravas, hevys):
+        matrix = score_matrix(stravas, hevys)
+        self.assertEqual(matrix.shape, (len(stravas), len(hevys)))
+        for i, s in enumerate(stravas):
+            for j, h in enumerate(hevys):
+                expected = score(s, h).score
+                self.assertTrue(
+                    math.isclose(matrix[i, j], expected, abs_tol=1e-12),
+                    f"{s.activity_type} {s.start_ts} vs {h.workout_id}: "
+                    f"{matrix[i, j]!r} != {expected!r}",
+                )
+
+    def test_scenarios(self):
+        self.assertMatchesScalar(SCENARIO_STRAVAS, SCENARIO_HEVYS)
+
+    def test_random_backfills(self):
+        for seed in range(10):
+            with self.subTest(seed=seed):
+                stravas, hevys = _random_backfill(seed, 60, 120, days=3)
+                self.assertMatchesScalar(stravas, hevys)
+
+    def test_scores_are_clamped(self):
+        stravas, hevys = _random_backfill(3, 80, 80, days=2)
+        matrix = score_matrix(stravas, hevys)
+        self.assertTrue(np.all((matrix >= 0.0) & (matrix <= 1.0)))
+
+    def test_random_order_of_types_in_batch(self):
+        stravas = list(SCENARIO_STRAVAS)
+        random.Random(5).shuffle(stravas)
+        self.assertMatchesScalar(stravas, SCENARIO_HEVYS)
+
+    def test_arrays_reusable_across_batches(self):
+        arrays = HevyArrays(SCENARIO_HEVYS)
+        first = arrays.score(SCENARIO_STRAVAS[:3])
+        again = arrays.score(SCENARIO_STRAVAS)
+        np.testing.assert_array_equal(first, again[:3])
+
+    def test_empty_inputs(self):
+        self.assertEqual(score_matrix([], SCENARIO_HEVYS).shape, (0, len(SCENARIO_HEVYS)))
+        self.assertEqual(score_matrix(SCENARIO_STRAVAS, []).shape, (len(SCENARIO_STRAVAS), 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
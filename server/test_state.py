@@ -1,4 +1,4 @@
-"""Unit tests for the merged_workouts persistence layer in state.py.
+"""Unit tests for the persistence layer in state.py.
 
 Run from the server/ directory:
     python -m unittest test_state
@@ -10,10 +10,14 @@ with the real /data/state.db.
 from __future__ import annotations
 
 import os
+import sqlite3
 import tempfile
 import unittest
 
-from state import State
+from fake_strava_events import activity_event, deauthorize_event
+from matcher import CandidateIndex, best_match, summarize_hevy
+from state import State, WEBHOOK_RETAIN_PROCESSED_ROWS
+from test_matcher import _random_backfill
 
 
 class MergedWorkoutsTests(unittest.TestCase):
@@ -94,6 +98,11 @@ class MergedWorkoutsTests(unittest.TestCase):
         with self.assertRaises(sqlite3.IntegrityError):
             self.state.mark_merged("s-x", "h-x", 0.5, source="hacker")
 
+    def test_user_merges_lists_only_sticky_rows(self):
+        self.state.mark_merged("s1", "h1", 0.9)
+        self.state.mark_merged("s2", "h2", 0.7, source="user")
+        self.assertEqual(self.state.user_merges(), [("s2", "h2")])
+
     def test_recent_merges_orders_by_time_desc(self):
         # mark_merged stamps merged_at with seconds resolution, so we can't
         # rely on insertion order alone — but we can rely on the secondary
@@ -106,5 +115,205 @@ class MergedWorkoutsTests(unittest.TestCase):
         self.assertIn(rows[0]["strava_activity_id"], {"s1", "s2"})
 
 
+class _TempStateCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.state = State(self.db_path)
+
+    def tearDown(self):
+        for p in (self.db_path, self.db_path + "-wal", self.db_path + "-shm"):
+            if os.path.exists(p):
+                os.unlink(p)
+
+
+class ImportCountTests(_TempStateCase):
+    def _backdate(self, activity_id: str, imported_at: str):
+        with sqlite3.connect(self.db_path) as c:
+            c.execute(
+                "UPDATE imported_activities SET imported_at=? WHERE strava_activity_id=?",
+                (imported_at, activity_id),
+            )
+            c.execute("DELETE FROM import_counters")
+
+    def test_counts_follow_mark_imported(self):
+        self.state.mark_imported("1", "Run", "Running")
+        self.state.mark_imported("2", "Ride", "Cycling")
+        self.state.mark_imported("1", "Run (edited)", "Running")
+        self.assertEqual(self.state.import_counts(), {"total": 2, "today": 2})
+
+    def test_backfill_and_reimport_moves_row_to_today(self):
+        self.state.mark_imported("1", "Run", "Running")
+        self.state.mark_imported("2", "Ride", "Cycling")
+        self._backdate("1", "2025-01-01T08:00:00Z")
+        state = State(self.db_path)  # rebuilds the counters
+        self.assertEqual(state.import_counts(), {"total": 2, "today": 1})
+        state.mark_imported("1", "Run", "Running")
+        self.assertEqual(state.import_counts(), {"total": 2, "today": 2})
+
+    def test_version_bumps_only_on_changes(self):
+        before = self.state.version
+        self.state.claim_import_jobs(10)  # nothing to claim
+        self.assertEqual(self.state.version, before)
+        self.state.set("last_poll_at", "2025-08-23T00:00:00Z")
+        self.assertGreater(self.state.version, before)
+
+
+class WebhookQueueTests(_TempStateCase):
+    def test_enqueue_and_drain_in_arrival_order(self):
+        self.state.enqueue_webhook_event(activity_event(111))
+        self.state.enqueue_webhook_event(activity_event(222, aspect_type="update"))
+        pending = self.state.pending_webhook_events()
+        self.assertEqual([e["object_id"] for e in pending], ["111", "222"])
+        self.assertEqual(pending[1]["aspect_type"], "update")
+        self.assertEqual(pending[0]["payload"]["object_type"], "activity")
+        self.assertEqual(self.state.webhook_backlog(), 2)
+
+    def test_processed_events_leave_the_queue(self):
+        eid = self.state.enqueue_webhook_event(activity_event(111))
+        self.state.mark_webhook_processed(eid)
+        self.assertEqual(self.state.pending_webhook_events(), [])
+        self.assertEqual(self.state.webhook_backlog(), 0)
+
+    def test_queue_survives_reopen(self):
+        self.state.enqueue_webhook_event(deauthorize_event())
+        reopened = State(self.db_path)
+        pending = reopened.pending_webhook_events()
+        self.assertEqual(len(pending), 1)
+        self.assertEqual(pending[0]["object_type"], "athlete")
+
+    def test_processed_rows_are_pruned_but_pending_are_not(self):
+        keep = self.state.enqueue_webhook_event(activity_event(1))
+        for i in range(WEBHOOK_RETAIN_PROCESSED_ROWS + 5):
+            eid = self.state.enqueue_webhook_event(activity_event(1000 + i))
+            self.state.mark_webhook_processed(eid)
+        pending = self.state.pending_webhook_events()
+        self.assertEqual([e["id"] for e in pending], [keep])
+
+
+class ImportJobQueueTests(_TempStateCase):
+    def test_enqueue_is_idempotent_and_priority_only_rises(self):
+        self.assertTrue(self.state.enqueue_import("111", source="poll"))
+        self.assertTrue(self.state.enqueue_import("111", source="manual", priority=1))
+        self.assertTrue(self.state.enqueue_import("111", source="poll", priority=0))
+        self.assertEqual(self.state.import_job("111")["priority"], 1)
+        self.assertEqual(self.state.import_job_counts()["pending"], 1)
+
+    def test_claim_respects_due_time_and_priority(self):
+        self.state.enqueue_import("low", source="poll")
+        self.state.enqueue_import("high", source="manual", priority=1)
+        self.state.enqueue_import("later", source="poll")
+        self.state.defer_import_job("later", 10**10)
+        claimed = self.state.claim_import_jobs(10)
+        self.assertEqual([j["strava_activity_id"] for j in claimed], ["high", "low"])
+        self.assertEqual(self.state.claim_import_jobs(10), [])
+        self.assertEqual(self.state.import_job_counts()["running"], 2)
+
+    def test_failed_jobs_are_not_revived_without_force(self):
+        self.state.enqueue_import("111", source="poll")
+        self.state.claim_import_jobs(1)
+        self.state.fail_import_job("111", "HTTP 500", None)
+        self.assertFalse(self.state.enqueue_import("111", source="poll"))
+        self.assertEqual(self.state.failed_import_jobs()[0]["last_error"], "HTTP 500")
+        self.assertTrue(self.state.enqueue_import("111", source="manual", force=True))
+        job = self.state.import_job("111")
+        self.assertEqual((job["state"], job["attempts"]), ("pending", 0))
+        self.assertIsNone(job["last_error"])
+
+
+def _raw_workout(summary, updated_at: str = "2025-08-23T00:00:00Z") -> dict:
+    """Inverse of summarize_hevy, shaped like a Hevy API workout."""
+    return {
+        "workout": {
+            "workout_id": summary.workout_id,
+            "updated_at": updated_at,
+            "start_time": summary.start_ts,
+            "end_time": summary.end_ts,
+            "exercises": [
+                {
+                    "exercise_template_id": e.template_id,
+                    "sets": [
+                        {
+                            "duration_seconds": e.duration_seconds,
+                            "distance_meters": e.distance_meters,
+                        }
+                    ],
+                }
+                for e in summary.exercises
+            ],
+        }
+    }
+
+
+class HevySummaryStoreTests(_TempStateCase):
+    def setUp(self):
+        super().setUp()
+        self.stravas, self.hevys = _random_backfill(4, 80, 200, days=20)
+        self.raw = [_raw_workout(h) for h in self.hevys]
+
+    def test_round_trip_matches_summarize_hevy(self):
+        self.assertEqual(self.state.store_hevy_workouts(self.raw), len(self.raw))
+        stored = {
+            h.workout_id: h for h in self.state.hevy_summaries_between(0, 2**40)
+        }
+        for raw in self.raw:
+            expected = summarize_hevy(raw)
+            self.assertEqual(stored[expected.workout_id], expected)
+
+    def test_unchanged_workouts_are_not_rewritten(self):
+        self.state.store_hevy_workouts(self.raw)
+        self.assertEqual(self.state.store_hevy_workouts(self.raw), 0)
+        edited = _raw_workout(self.hevys[0], updated_at="2025-09-01T00:00:00Z")
+        edited["workout"]["end_time"] += 60
+        self.assertEqual(self.state.store_hevy_workouts([edited]), 1)
+        [row] = [
+            h
+            for h in self.state.hevy_summaries_between(0, 2**40)
+            if h.workout_id == self.hevys[0].workout_id
+        ]
+        self.assertEqual(row.end_ts, self.hevys[0].end_ts + 60)
+
+    def test_candidates_match_in_memory_index(self):
+        self.state.store_hevy_workouts(self.raw)
+        index = CandidateIndex(self.hevys)
+        for s in self.stravas:
+            stored = self.state.hevy_candidates(s)
+            self.assertLessEqual(
+                {h.workout_id for h in index.candidates_for(s)},
+                {h.workout_id for h in stored},
+            )
+            full = best_match(s, self.hevys)
+            ranged = best_match(s, stored)
+            self.assertEqual(ranged.auto_merge, full.auto_merge)
+            self.assertEqual(set(ranged.review), set(full.review))
+
+    def test_delete(self):
+        self.state.store_hevy_workouts(self.raw[:1])
+        self.assertEqual(self.state.delete_hevy_summary(self.hevys[0].workout_id), 1)
+        self.assertEqual(self.state.hevy_summaries_between(0, 2**40), [])
+
+    def _synced(self, i: int) -> dict:
+        """Workout i as workouts_sync_batch returns it, edited since stored."""
+        w = self.raw[i]["workout"]
+        return dict(w, id=w["workout_id"], updated_at="2025-09-01T00:00:00Z")
+
+    def test_sync_skips_unreadable_workouts_in_one_transaction(self):
+        good = self._synced(0)
+        bad = dict(self._synced(1), exercises=5)
+        self.state.store_hevy_workouts(self.raw[:2])
+        self.state.apply_hevy_sync([good, bad], [])
+        self.assertEqual(self.state.hevy_mirror_count(), 2)
+        stored = {h.workout_id for h in self.state.hevy_summaries_between(0, 2**40)}
+        # The stale summary of the unreadable workout is dropped, not kept.
+        self.assertEqual(stored, {self.hevys[0].workout_id})
+        self.assertIn("unreadable Hevy workout", self.state.recent_logs(1)[0]["message"])
+
+    def test_sync_deletes_mirror_and_summary(self):
+        self.state.apply_hevy_sync([self._synced(0)], [])
+        self.state.apply_hevy_sync([], [self.hevys[0].workout_id])
+        self.assertEqual(self.state.hevy_mirror_count(), 0)
+        self.assertEqual(self.state.hevy_summaries_between(0, 2**40), [])
+
+
 if __name__ == "__main__":
     unittest.main()
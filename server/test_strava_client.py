@@ -0,0 +1,201 @@
+"""Unit tests for the list paths and token refresh in strava_client.py.
+
+Run from the server/ directory:
+    python -m unittest test_strava_client
+
+The stravalib Client is replaced with an in-process fake that answers
+`after` queries the way Strava does: ascending by start time, one page
+per call. Token refresh goes through a fake stravalib Client class that
+rotates the refresh token on every call, as Strava does.
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from state import State
+
+try:
+    from strava_client import StravaClient
+    _CLIENT_AVAILABLE = True
+except ImportError:
+    _CLIENT_AVAILABLE = False
+
+
+T0 = 1755907500
+
+
+def _activity(aid: int, start_ts: int, atype: str = "Run"):
+    return SimpleNamespace(
+        id=aid,
+        name=f"Activity {aid}",
+        type=atype,
+        start_date=datetime.fromtimestamp(start_ts, timezone.utc),
+        distance=5000.0,
+        moving_time=1500,
+    )
+
+
+class FakeStravalib:
+    def __init__(self, activities):
+        self.activities = activities
+        self.requests = 0
+
+    def get_activities(self, after=None, limit=None):
+        self.requests += 1
+        after_ts = int(after.timestamp())
+        page = sorted(
+            (a for a in self.activities if int(a.start_date.timestamp()) > after_ts),
+            key=lambda a: a.start_date,
+        )
+        return iter(page[:limit])
+
+
+@unittest.skipUnless(_CLIENT_AVAILABLE, "stravalib / requests not importable")
+class ActivitiesAfterTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.client = StravaClient(State(self.db_path))
+        self.client.PAGE_SIZE = 3
+
+    def tearDown(self):
+        for p in (self.db_path, self.db_path + "-wal", self.db_path + "-shm"):
+            if os.path.exists(p):
+                os.unlink(p)
+
+    def _use(self, activities) -> FakeStravalib:
+        fake = FakeStravalib(activities)
+        self.client._client = lambda: fake
+        return fake
+
+    def test_pages_through_a_gap_without_skipping_shared_start_seconds(self):
+        # Page boundary falls between 3 and 4, which share a start second.
+        self._use(
+            [
+                _activity(1, T0 + 10),
+                _activity(2, T0 + 20),
+                _activity(3, T0 + 30),
+                _activity(4, T0 + 30),
+                _activity(5, T0 + 40),
+            ]
+        )
+        found, cursor, caught_up = self.client.activities_after(None, (T0, 0))
+        self.assertEqual([a["id"] for a in found], ["1", "2", "3", "4", "5"])
+        self.assertEqual(cursor, (T0 + 40, 5))
+        self.assertTrue(caught_up)
+
+    def test_cursor_advances_past_disabled_types(self):
+        self._use([_activity(1, T0 + 10, atype="Yoga")])
+        found, cursor, _ = self.client.activities_after(None, (T0, 0))
+        self.assertEqual(found, [])
+        self.assertEqual(cursor, (T0 + 10, 1))
+
+    def test_page_cap_returns_resumable_cursor(self):
+        fake = self._use([_activity(i, T0 + 10 * i) for i in range(1, 8)])
+        found, cursor, caught_up = self.client.activities_after(
+            None, (T0, 0), max_pages=1
+        )
+        self.assertFalse(caught_up)
+        self.assertEqual(cursor, (T0 + 30, 3))
+        rest, cursor, caught_up = self.client.activities_after(None, cursor)
+        self.assertTrue(caught_up)
+        self.assertEqual([a["id"] for a in found + rest], [str(i) for i in range(1, 8)])
+        self.assertEqual(fake.requests, 4)
+
+    def test_quiet_poll_is_one_request(self):
+        fake = self._use([_activity(1, T0 + 10)])
+        found, cursor, caught_up = self.client.activities_after(None, (T0 + 10, 1))
+        self.assertEqual((found, cursor, caught_up), ([], (T0 + 10, 1), True))
+        self.assertEqual(fake.requests, 1)
+
+
+class FakeClientClass:
+    """Replaces stravalib.Client; counts constructions and refreshes."""
+
+    refreshes: list[str] = []
+    constructed = 0
+
+    def __init__(self, access_token=None, **kwargs):
+        type(self).constructed += 1
+        self.access_token = access_token
+
+    def refresh_access_token(self, client_id, client_secret, refresh_token):
+        time.sleep(0.05)  # wide window for a racing caller
+        self.refreshes.append(refresh_token)
+        n = len(self.refreshes)
+        return {
+            "access_token": f"access-{n}",
+            "refresh_token": f"refresh-{n}",
+            "expires_at": int(time.time()) + 6 * 3600,
+        }
+
+
+@unittest.skipUnless(_CLIENT_AVAILABLE, "stravalib / requests not importable")
+class TokenRefreshTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.state = State(self.db_path)
+        self.client = StravaClient(self.state)
+        FakeClientClass.refreshes = []
+        FakeClientClass.constructed = 0
+        patcher = mock.patch("strava_client.Client", FakeClientClass)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        for p in (self.db_path, self.db_path + "-wal", self.db_path + "-shm"):
+            if os.path.exists(p):
+                os.unlink(p)
+
+    def _store(self, expires_in: int):
+        self.state.set_many(
+            {
+                "strava_client_id": "123",
+                "strava_client_secret": "secret",
+                "strava_access_token": "access-0",
+                "strava_refresh_token": "refresh-0",
+                "strava_token_expires_at": str(int(time.time()) + expires_in),
+            }
+        )
+
+    def test_refreshes_ahead_of_expiry(self):
+        self._store(120)
+        self.assertEqual(self.client._refresh_if_needed(), "access-1")
+        self.assertEqual(self.state.get("strava_refresh_token"), "refresh-1")
+
+    def test_concurrent_callers_share_one_refresh(self):
+        self._store(-1)
+        tokens = []
+        threads = [
+            threading.Thread(
+                target=lambda: tokens.append(self.client._refresh_if_needed())
+            )
+            for _ in range(8)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(FakeClientClass.refreshes, ["refresh-0"])
+        self.assertEqual(tokens, ["access-1"] * 8)
+
+    def test_client_reused_until_token_rotates(self):
+        self._store(3600)
+        first = self.client._client()
+        self.assertIs(self.client._client(), first)
+        self.assertEqual(FakeClientClass.constructed, 1)
+        self.state.set("strava_access_token", "access-9")
+        self.assertIsNot(self.client._client(), first)
+
+
+if __name__ == "__main__":
+    unittest.main()
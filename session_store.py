@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Session store
+
+One place to read and write ~/.underthebar/session.json (Hevy tokens,
+Strava tokens, user id and settings), shared by hevy_api, strava_api and
+the pages
+"""
+
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# Held for every read-modify-write, re-entrant so edit() can call load()/save()
+_lock = threading.RLock()
+
+# In-memory copy of the file, and the (mtime, size) it was read at
+_cache = None
+_cache_stamp = None
+
+
+def utb_folder():
+	return str(Path.home()) + "/.underthebar"
+
+
+def session_path():
+	return utb_folder() + "/session.json"
+
+
+#
+# True if session.json exists
+#
+def exists():
+	return os.path.exists(session_path())
+
+
+#
+# Return a copy of the session data, {} if there is no session.json
+# Only re-reads the file when its mtime or size has changed since the last read,
+# so the hot path (is_logged_in on every API call) is a stat rather than a parse
+#
+def load():
+	global _cache, _cache_stamp
+	with _lock:
+		stamp = _stamp()
+		if stamp is None:
+			_cache, _cache_stamp = None, None
+			return {}
+		if stamp != _cache_stamp:
+			with open(session_path(), 'r') as file:
+				_cache = json.load(file)
+			_cache_stamp = stamp
+		return dict(_cache)
+
+
+#
+# Replace the session data. Written to a temp file in the same folder and then
+# renamed over session.json, so a reader never sees a half written file
+#
+def save(session_data):
+	global _cache, _cache_stamp
+	with _lock:
+		folder = utb_folder()
+		if not os.path.exists(folder):
+			os.makedirs(folder)
+		fd, temp_path = tempfile.mkstemp(dir=folder, prefix=".session-", suffix=".json")
+		try:
+			with os.fdopen(fd, 'w') as f:
+				json.dump(session_data, f)
+			os.replace(temp_path, session_path())
+		except BaseException:
+			if os.path.exists(temp_path):
+				os.remove(temp_path)
+			raise
+		_cache = dict(session_data)
+		_cache_stamp = _stamp()
+
+
+#
+# Read-modify-write under the lock, so concurrent writers (token refreshes from
+# different workers, settings checkboxes) never drop each other's keys:
+#
+#	with session_store.edit() as session_data:
+#		session_data["access_token"] = access_token
+#
+@contextmanager
+def edit():
+	with _lock:
+		session_data = load()
+		yield session_data
+		save(session_data)
+
+
+#
+# Set some keys, keeping the rest of the session
+#
+def update(changes):
+	with edit() as session_data:
+		session_data.update(changes)
+		return dict(session_data)
+
+
+def _stamp():
+	try:
+		st = os.stat(session_path())
+	except FileNotFoundError:
+		return None
+	return (st.st_mtime_ns, st.st_size)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""Social store
+
+Keeps user_<id>/social.db, who you follow, who follows you, your squad (users
+liking your recent workouts) and the suggested users, with when each user was
+added or removed. hevy_api syncs each list in after fetching it and the social
+page queries it, instead of both reading and diffing the old following.json,
+follower.json, squad.json and suggested_users.json lists
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DB_FILE = "social.db"
+
+FOLLOWING = "following"
+FOLLOWER = "follower"
+SQUAD = "squad"
+SUGGESTED = "suggested"
+
+# The lists kept in json files before, read once to seed a new store
+_LEGACY_FILES = {
+	FOLLOWING: "following.json",
+	FOLLOWER: "follower.json",
+	SQUAD: "squad.json",
+	SUGGESTED: "suggested_users.json",
+}
+
+# Held for every connection, hevy_api syncs on worker threads while the page reads
+_lock = threading.RLock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS members (
+	kind TEXT NOT NULL,
+	username TEXT NOT NULL,
+	score INTEGER NOT NULL DEFAULT 0,
+	following_status TEXT,
+	added_at REAL NOT NULL,
+	removed_at REAL,
+	PRIMARY KEY (kind, username)
+);
+CREATE TABLE IF NOT EXISTS syncs (
+	kind TEXT PRIMARY KEY,
+	synced_at REAL NOT NULL
+);
+"""
+
+
+#
+# Replace the list kind with users, {username: {"score": .., "following_status": ..}} or just usernames
+# Users not in the list before are recorded as added now, and users gone as removed now
+# Returns (added, removed) usernames
+#
+def sync(user_folder, kind, users):
+	if not isinstance(users, dict):
+		users = {username: {} for username in users}
+	now = time.time()
+	with _connect(user_folder) as conn:
+		current = {row[0] for row in conn.execute("SELECT username FROM members WHERE kind=? AND removed_at IS NULL", (kind,))}
+		added = [username for username in users if username not in current]
+		removed = [username for username in current if username not in users]
+		for username, details in users.items():
+			conn.execute(
+				"INSERT INTO members (kind, username, score, following_status, added_at) VALUES (?,?,?,?,?) "
+				"ON CONFLICT (kind, username) DO UPDATE SET score=excluded.score, following_status=excluded.following_status, "
+				"added_at=CASE WHEN removed_at IS NULL THEN added_at ELSE excluded.added_at END, removed_at=NULL",
+				(kind, username, details.get("score", 0), details.get("following_status"), now))
+		conn.executemany("UPDATE members SET removed_at=? WHERE kind=? AND username=?", [(now, kind, username) for username in removed])
+		conn.execute("INSERT OR REPLACE INTO syncs (kind, synced_at) VALUES (?,?)", (kind, now))
+		return added, removed
+
+
+#
+# Current users in the list kind as {username: {"score", "following_status", "added_at"}},
+# highest score first, then by username in reverse order
+#
+def members(user_folder, kind):
+	with _connect(user_folder) as conn:
+		rows = conn.execute(
+			"SELECT username, score, following_status, added_at FROM members WHERE kind=? AND removed_at IS NULL "
+			"ORDER BY score DESC, username DESC", (kind,))
+		return {row[0]: {"score": row[1], "following_status": row[2], "added_at": row[3]} for row in rows}
+
+
+#
+# (added, removed) usernames of the list kind at its last sync, sorted
+#
+def changes(user_folder, kind):
+	with _connect(user_folder) as conn:
+		synced = conn.execute("SELECT synced_at FROM syncs WHERE kind=?", (kind,)).fetchone()
+		if synced is None:
+			return [], []
+		added = conn.execute("SELECT username FROM members WHERE kind=? AND removed_at IS NULL AND added_at=? ORDER BY username", (kind, synced[0]))
+		added = [row[0] for row in added]
+		removed = conn.execute("SELECT username FROM members WHERE kind=? AND removed_at=? ORDER BY username", (kind, synced[0]))
+		removed = [row[0] for row in removed]
+		return added, removed
+
+
+@contextmanager
+def _connect(user_folder):
+	with _lock:
+		path = os.path.join(user_folder, DB_FILE)
+		new_store = not os.path.exists(path)
+		conn = sqlite3.connect(path)
+		try:
+			conn.executescript(_SCHEMA)
+			with conn:
+				if new_store:
+					_seed(conn, user_folder)
+				yield conn
+		finally:
+			conn.close()
+
+
+#
+# A new store starts with every list the old json files had, added at 0 and not
+# yet synced, so the page shows them straight away and the first sync of each
+# list reports only the changes since the json file was written
+#
+def _seed(conn, user_folder):
+	for kind in _LEGACY_FILES:
+		conn.executemany(
+			"INSERT OR IGNORE INTO members (kind, username, score, added_at) VALUES (?,?,?,?)",
+			[(kind, username, score, 0) for username, score in _legacy_members(user_folder, kind).items()])
+
+
+#
+# {username: score} from the old json file of the list kind
+# following / follower hold usernames, squad {username: score} and suggested users user dicts
+#
+def _legacy_members(user_folder, kind):
+	filename = _LEGACY_FILES.get(kind)
+	if filename is None or not os.path.exists(os.path.join(user_folder, filename)):
+		return {}
+	try:
+		with open(os.path.join(user_folder, filename), 'r') as file:
+			data = json.load(file)["data"]
+		if isinstance(data, dict):
+			return {username: score if isinstance(score, int) else 0 for username, score in data.items()}
+		return {user["username"] if isinstance(user, dict) else user: 0 for user in data}
+	except (ValueError, KeyError, TypeError):
+		return {}
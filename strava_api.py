@@ -1,4 +1,3 @@
-from pathlib import Path
 import os
 import json
 import http.server
@@ -7,13 +6,19 @@ from urllib.parse import urlparse, parse_qs
 import sys
 from stravalib import Client
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import requests, json
+import requests.adapters
 import webbrowser
 import uuid
 import random
 import copy
 from dotenv import load_dotenv
 import subprocess
+import threading
+import time
+
+import session_store
 
 
 def _is_production():
@@ -47,15 +52,8 @@ class Handler(http.server.BaseHTTPRequestHandler):
 
             print("Writing strava code to file")
 
-            home_folder = str(Path.home())
-            utb_folder = home_folder + "/.underthebar"
-            session_data = {}
-            if os.path.exists(utb_folder+"/session.json"):
-                with open(utb_folder+"/session.json", 'r') as file:
-                    session_data = json.load(file)
-                    session_data["strava-token-code"] = code_value
-                with open(utb_folder+"/session.json", 'w') as file:
-                    json.dump(session_data,file)
+            if session_store.exists():
+                session_store.update({"strava-token-code": code_value})
 
         except:
 
@@ -90,6 +88,14 @@ ALL_ACTIVITY_TYPES = [
 ]
 
 
+# Refresh the Strava access token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 300
+
+# Held while checking / refreshing the cached access token, so concurrent
+# workers share one refresh instead of each doing their own
+_token_lock = threading.Lock()
+
+
 def _get_client():
 	"""Authenticate with Strava and return an authenticated client, or None on failure."""
 	script_folder = os.path.split(os.path.abspath(__file__))[0]
@@ -101,12 +107,7 @@ def _get_client():
 		print("NEED TO ADD YOUR STRAVA API DETAILS TO .env !!!\n"*5)
 		return None, 404
 
-	home_folder = str(Path.home())
-	utb_folder = home_folder + "/.underthebar"
-	session_data = {}
-	if os.path.exists(utb_folder+"/session.json"):
-		with open(utb_folder+"/session.json", 'r') as file:
-			session_data = json.load(file)
+	session_data = session_store.load()
 
 	get_token_url = "strava-token-refresh" not in session_data
 	get_token_refresh = False
@@ -122,9 +123,7 @@ def _get_client():
 		with Server(("", 8888), Handler) as httpd:
 			httpd.handle_request()
 
-		if os.path.exists(utb_folder+"/session.json"):
-			with open(utb_folder+"/session.json", 'r') as file:
-				session_data = json.load(file)
+		session_data = session_store.load()
 
 		get_token_refresh = True
 
@@ -132,24 +131,38 @@ def _get_client():
 		token_response = client.exchange_code_for_token(client_id=cl_id,
 												  client_secret=cl_secret,
 												  code=session_data["strava-token-code"])
-		access_token = token_response['access_token']
-		refresh_token = token_response['refresh_token']
-		client = Client(access_token=access_token)
-		session_data["strava-token-refresh"] = refresh_token
-		with open(utb_folder+"/session.json", 'w') as file:
-			json.dump(session_data, file)
+		with _token_lock:
+			session_data = _store_token(token_response)
+		client = Client(access_token=token_response['access_token'])
 		get_token_access = False
 
 	if get_token_access:
-		token_response = client.refresh_access_token(client_id=cl_id,
-										  client_secret=cl_secret,
-										  refresh_token=session_data["strava-token-refresh"])
-		new_access_token = token_response['access_token']
-		client = Client(access_token=new_access_token)
+		with _token_lock:
+			# Re-read, another worker may have refreshed while we waited
+			session_data = session_store.load()
+			access_token = session_data.get("strava-token-access")
+			expires_at = session_data.get("strava-token-expires", 0)
+			if not access_token or expires_at - TOKEN_REFRESH_MARGIN <= time.time():
+				print("Refreshing Strava access token")
+				token_response = client.refresh_access_token(client_id=cl_id,
+												  client_secret=cl_secret,
+												  refresh_token=session_data["strava-token-refresh"])
+				session_data = _store_token(token_response)
+				access_token = token_response['access_token']
+		client = Client(access_token=access_token)
 
 	return client, session_data
 
 
+def _store_token(token_response):
+	"""Save a Strava token response (access, refresh, expiry) to session.json and return the session data."""
+	return session_store.update({
+		"strava-token-access": token_response['access_token'],
+		"strava-token-refresh": token_response['refresh_token'],
+		"strava-token-expires": int(token_response['expires_at']),
+	})
+
+
 def _get_submittable_types(enabled_types, session_data):
 	"""Return the list of ActivityType objects that are currently enabled."""
 	submittable = [at for at in ALL_ACTIVITY_TYPES if at.type in enabled_types]
@@ -205,65 +218,110 @@ def get_recent_activities(enabled_types=None):
 	return 200, matching
 
 
+# Activities fetched and submitted at once by import_activities
+IMPORT_WORKERS = 4
+
+HEVY_BASIC_HEADERS = {
+	'x-api-key': 'with_great_power',
+	'Content-Type': 'application/json',
+	'accept-encoding':'gzip'
+}
+
+# JSON of a basic workout, we'll adjust this
+WORKOUT_TEMPLATE = {
+  "workout": {
+	"workout_id": "3413fa99-ace5-4209-b997-1ca3251f9fbc",
+	"title": "Running (import)",
+	"description": "(Import from Strava)",
+	"exercises": [
+	  {
+		"title": "Running",
+		"exercise_template_id": "AC1BB830",
+		"rest_timer_seconds": 0,
+		"notes": "",
+		"volume_doubling_enabled": False,
+		"sets": [
+		  {
+			"index": 0,
+			"type": "normal",
+			"distance_meters": 10030,
+			"duration_seconds": 4101,
+			"completed_at": "2025-08-23T00:53:43.532Z"
+		  }
+		]
+	  }
+	],
+	"start_time": 1755906339,
+	"end_time": 1755910466,
+	"apple_watch": False,
+	"wearos_watch": False,
+	"is_private": False,
+	"is_biometrics_public": True
+  },
+  "share_to_strava": False,
+  "strava_activity_local_time": "2025-8-23T9:15:39Z"
+}
+
+
 def import_activity(activity_id, enabled_types=None, is_private=None):
 	"""
 	Import a specific Strava activity (by id) into Hevy.
 	Returns status code (200 on success).
 	is_private defaults to True in dev mode, False in production.
 	"""
+	print("starting strava_api > import_activity()", activity_id)
+	return import_activities([activity_id], enabled_types, is_private)[activity_id]
+
+
+def import_activities(activity_ids, enabled_types=None, is_private=None):
+	"""
+	Import several Strava activities (by id) into Hevy.
+	Authenticates with Strava and Hevy once, then fetches, builds and submits
+	the activities concurrently (IMPORT_WORKERS at a time).
+	Returns {activity_id: status code} (200 on success, 0 on an exception).
+	is_private defaults to True in dev mode, False in production.
+	"""
 	if enabled_types is None:
 		enabled_types = [at.type for at in ALL_ACTIVITY_TYPES]
 	if is_private is None:
 		is_private = not _is_production()
+	activity_ids = list(dict.fromkeys(activity_ids))
 
-	print("starting strava_api > import_activity()", activity_id)
+	print("starting strava_api > import_activities()", activity_ids)
 	client, session_data = _get_client()
 	if client is None:
-		return session_data  # error code
+		return {activity_id: session_data for activity_id in activity_ids}  # error code
+
+	# Log in to Hevy once for the whole batch
+	import hevy_api
+	user_data = hevy_api.is_logged_in()
+	if user_data[0] == False:
+		print("403")
+		return {activity_id: 403 for activity_id in activity_ids}
+	auth_token = user_data[2]
+
+	s = requests.Session()
+	s.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=IMPORT_WORKERS))
+	s.headers.update(HEVY_BASIC_HEADERS)
+	s.headers.update({'Authorization': "Bearer " + auth_token})
 
 	submittable_types = _get_submittable_types(enabled_types, session_data)
 
-	# JSON of a basic workout, we'll adjust this
-	run_template_tocopy = {
-	  "workout": {
-		"workout_id": "3413fa99-ace5-4209-b997-1ca3251f9fbc",
-		"title": "Running (import)",
-		"description": "(Import from Strava)",
-		"exercises": [
-		  {
-			"title": "Running",
-			"exercise_template_id": "AC1BB830",
-			"rest_timer_seconds": 0,
-			"notes": "",
-			"volume_doubling_enabled": False,
-			"sets": [
-			  {
-				"index": 0,
-				"type": "normal",
-				"distance_meters": 10030,
-				"duration_seconds": 4101,
-				"completed_at": "2025-08-23T00:53:43.532Z"
-			  }
-			]
-		  }
-		],
-		"start_time": 1755906339,
-		"end_time": 1755910466,
-		"apple_watch": False,
-		"wearos_watch": False,
-		"is_private": is_private,
-		"is_biometrics_public": True
-	  },
-	  "share_to_strava": False,
-	  "strava_activity_local_time": "2025-8-23T9:15:39Z"
-	}
-
-	BASIC_HEADERS = {
-		'x-api-key': 'with_great_power',
-		'Content-Type': 'application/json',
-		'accept-encoding':'gzip'
-	}
+	def run(activity_id):
+		try:
+			return _import_one(client, s, activity_id, submittable_types, is_private)
+		except Exception as e:
+			print("import_activities exception:", activity_id, e)
+			return 0
+
+	with ThreadPoolExecutor(max_workers=IMPORT_WORKERS) as pool:
+		results = dict(zip(activity_ids, pool.map(run, activity_ids)))
+	print("import_activities results", results)
+	return results
+
 
+def _import_one(client, s, activity_id, submittable_types, is_private):
+	"""Fetch one activity (and its heart rate stream) and submit it to Hevy."""
 	activity = client.get_activity(activity_id)
 
 	matched_type = None
@@ -273,12 +331,23 @@ def import_activity(activity_id, enabled_types=None, is_private=None):
 			break
 
 	if matched_type is None:
-		print("Activity type not in submittable types")
+		print("Activity type not in submittable types", activity_id)
 		return 400
 
-	run_template = copy.deepcopy(run_template_tocopy)
+	streams = None
+	if activity.average_heartrate:
+		streams = client.get_activity_streams(activity.id, types=["time", "heartrate"])
+
+	run_template = _build_workout(activity, matched_type, streams, is_private)
+	return _submit_workout(s, run_template)
+
+
+def _build_workout(activity, matched_type, streams, is_private):
+	"""Fill in a copy of WORKOUT_TEMPLATE from a Strava activity."""
+	run_template = copy.deepcopy(WORKOUT_TEMPLATE)
 	print("Importing", activity.name, activity.start_date)
 
+	run_template["workout"]["is_private"] = is_private
 	run_template["workout"]["title"] = activity.name
 	run_template["workout"]["exercises"][0]["title"] = matched_type.title
 	run_template["workout"]["exercises"][0]["exercise_template_id"] = matched_type.id
@@ -298,7 +367,6 @@ def import_activity(activity_id, enabled_types=None, is_private=None):
 	if activity.average_heartrate:
 		run_template["workout"]["exercises"][0]["notes"] = "Heartrate Avg: " + str(activity.average_heartrate) + "bpm, Max: " + str(activity.max_heartrate) + "bpm."
 
-		streams = client.get_activity_streams(activity.id, types=["time", "heartrate"])
 		samples = []
 		for datapoint in range(0, len(streams["time"].data)):
 			samples.append({"timestamp_ms": int((activity.start_date.timestamp() + streams["time"].data[datapoint]) * 1000), "bpm": streams["heartrate"].data[datapoint]})
@@ -308,24 +376,11 @@ def import_activity(activity_id, enabled_types=None, is_private=None):
 	if activity.average_watts:
 		run_template["workout"]["exercises"][0]["notes"] += "\nPower Avg: " + str(activity.average_watts) + "W, Max: " + str(activity.max_watts) + "W."
 
-	# Log in to Hevy and submit
-	import hevy_api
-	user_data = hevy_api.is_logged_in()
-	if user_data[0] == False:
-		print("403")
-		return 403
-	user_folder = user_data[1]
-	auth_token = user_data[2]
-
-	s = requests.Session()
-	s.headers.update({'Authorization': "Bearer " + auth_token})
-	headers = BASIC_HEADERS.copy()
+	return run_template
 
-	r = s.get("https://api.hevyapp.com/account", headers=headers)
-	data = r.json()
-	username = data["username"]
-	print("Hello from Hevy,", username)
 
+def _submit_workout(s, run_template):
+	"""POST the workout to Hevy (PUT if it already exists). Returns status code."""
 	rnd = random.Random()
 	rnd.seed(run_template["workout"]["start_time"])
 	local_id = uuid.UUID(int=rnd.getrandbits(128), version=4)
@@ -333,13 +388,13 @@ def import_activity(activity_id, enabled_types=None, is_private=None):
 
 	workout_id = str(local_id)
 	payload = json.dumps(run_template)
-	r = s.post('https://api.hevyapp.com/v2/workout', data=payload, headers=headers)
+	r = s.post('https://api.hevyapp.com/v2/workout', data=payload)
 	print(f"Hevy POST {r.status_code}")
 
 	if r.status_code == 409:
 		# Workout already exists — update it via PUT
 		print(f"Workout {workout_id} already exists, updating via PUT")
-		r = s.put(f'https://api.hevyapp.com/v2/workout/{workout_id}', data=payload, headers=headers)
+		r = s.put(f'https://api.hevyapp.com/v2/workout/{workout_id}', data=payload)
 		print(f"Hevy PUT {r.status_code}")
 
 	if r.status_code not in (200, 201):
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""Under the Bar - Feed
+
+Model / view for the Hevy workout feeds on the profile and social pages.
+
+Rows only hold the workout json. The formatted text is made when a row is painted
+and kept in a small LRU, picture thumbnails come from utb_image_cache, and the
+oldest workouts are dropped once the feed gets long, so memory and frame time
+stay flat however far the feed is scrolled.
+"""
+
+import datetime
+import platform
+import textwrap
+from collections import OrderedDict
+from pathlib import Path
+
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex, QRect, QSize, QEvent, Signal
+from PySide6.QtWidgets import QStyledItemDelegate, QStyle, QToolTip, QListView, QAbstractItemView
+from PySide6.QtGui import QPalette, QIcon
+
+from utb_image_cache import image_cache
+
+# Rows whose text is kept ready to paint
+FEED_CACHE_ROWS = 60
+# Workouts kept in a feed, the oldest (top) ones are dropped beyond this
+FEED_MAX_WORKOUTS = 300
+# Size of the workout picture thumbnails, and of the like button
+FEED_THUMB_SIZE = 48
+FEED_ICON_SIZE = 24
+FEED_PADDING = 4
+
+WorkoutRole = Qt.UserRole + 1
+
+
+#
+# The text shown for a workout: title, date, then each exercise and its sets
+#
+def format_workout(workout, weight_unit, show_username=True):
+	lines = []
+	if show_username:
+		lines.append(workout["username"] + " - " + workout["name"])
+	else:
+		lines.append(workout["name"])
+	workout_date = datetime.datetime.fromtimestamp(workout["start_time"], datetime.timezone.utc).astimezone(tz=None)
+	if platform.system() == "Linux":
+		lines.append(workout_date.strftime("%a %b %-d, ") + str(len(workout["exercises"])) + " exercises")
+	else:
+		lines.append(workout_date.strftime("%a %b %#d, ") + str(len(workout["exercises"])) + " exercises")
+
+	the_superset_id = None
+	for exercise in workout["exercises"]:
+		if exercise["superset_id"] != None:
+			ss_string = "|"
+			if exercise["superset_id"] != the_superset_id:
+				the_superset_id = exercise["superset_id"]
+				lines.append("")
+				lines.append("Super Set "+str(the_superset_id+1))
+			else:
+				lines.append(ss_string)
+		else:
+			ss_string = ""
+			lines.append(ss_string)
+		lines.append(ss_string+"    " + exercise["title"])
+
+		# first decide the format, then write it out
+		has_weight = any(exercise_set["weight_kg"] for exercise_set in exercise["sets"])
+		has_reps = any(exercise_set["reps"] for exercise_set in exercise["sets"])
+		has_distance = any(exercise_set["distance_meters"] for exercise_set in exercise["sets"])
+		has_duration = any(exercise_set["duration_seconds"] for exercise_set in exercise["sets"])
+		for exercise_set in exercise["sets"]:
+			parts = [ss_string+"        "+str(exercise_set["index"]+1)+":\t"]
+			if has_weight:
+				if weight_unit == "lbs":
+					lb = round(exercise_set["weight_kg"]*2.20462262,2)
+					if lb.is_integer():
+						lb = int(lb)
+					parts.append(str(lb)+"lbs\t")
+				else:
+					parts.append(str(round(exercise_set["weight_kg"],2))+"kg\t")
+			if has_reps:
+				parts.append(str(exercise_set["reps"])+" reps\t")
+			if has_distance:
+				if exercise_set["distance_meters"] < 1000:
+					parts.append(str(exercise_set["distance_meters"])+"m\t")
+				else:
+					parts.append(str(exercise_set["distance_meters"]/1000)+"km\t")
+			if has_duration:
+				m, s = divmod(exercise_set["duration_seconds"], 60)
+				time_format = "{:02d}:{:02d}".format(m, s)
+				if m>59:
+					h,m = divmod(m, 60)
+					time_format = "{:02d}:{:02d}:{:02d}".format(h, m, s)
+				parts.append(time_format+"\t")
+			lines.append("".join(parts))
+	lines.append("")
+	return "\n".join(lines)
+
+#
+# Number of lines format_workout gives, without formatting anything (the view asks for every row's size)
+#
+def line_count(workout):
+	count = 3
+	the_superset_id = None
+	for exercise in workout["exercises"]:
+		if exercise["superset_id"] != None and exercise["superset_id"] != the_superset_id:
+			the_superset_id = exercise["superset_id"]
+			count += 1
+		count += 2 + len(exercise["sets"])
+	return count
+
+
+def image_path(img_url):
+	return str(Path.home())+ "/.underthebar/temp/" + img_url.split("/")[-1]
+
+
+class FeedModel(QAbstractListModel):
+
+	def __init__(self, weight_unit="kg", show_username=True):
+		super(FeedModel, self).__init__()
+		self.weight_unit = weight_unit
+		self.show_username = show_username
+		self._workouts = []
+		self._rows = {}
+		# workout id -> text
+		self._cache = OrderedDict()
+		image_cache().ready.connect(self.on_image_ready)
+
+	def rowCount(self, parent=QModelIndex()):
+		if parent.isValid():
+			return 0
+		return len(self._workouts)
+
+	def data(self, index, role=Qt.DisplayRole):
+		if not index.isValid():
+			return None
+		workout = self._workouts[index.row()]
+		if role == WorkoutRole:
+			return workout
+		if role == Qt.ToolTipRole:
+			return textwrap.fill(workout["description"] or "",50)
+		return None
+
+	def append(self, workouts):
+		workouts = [workout for workout in workouts if workout["id"] not in self._rows]
+		if not workouts:
+			return
+		first = len(self._workouts)
+		self.beginInsertRows(QModelIndex(), first, first + len(workouts) - 1)
+		for workout in workouts:
+			self._rows[workout["id"]] = len(self._workouts)
+			self._workouts.append(workout)
+		self.endInsertRows()
+
+	def remove_head(self, count):
+		self.beginRemoveRows(QModelIndex(), 0, count - 1)
+		for workout in self._workouts[:count]:
+			self._cache.pop(workout["id"], None)
+		del self._workouts[:count]
+		self._rows = {workout["id"]: row for row, workout in enumerate(self._workouts)}
+		self.endRemoveRows()
+
+	def clear(self):
+		self.beginResetModel()
+		self._workouts = []
+		self._rows = {}
+		self._cache.clear()
+		self.endResetModel()
+
+	def set_weight_unit(self, weight_unit):
+		if weight_unit != self.weight_unit:
+			self.weight_unit = weight_unit
+			self._cache.clear()
+			if self._workouts:
+				self.dataChanged.emit(self.index(0), self.index(len(self._workouts) - 1))
+
+	def set_liked(self, workout_id):
+		row = self._rows.get(workout_id)
+		if row is None:
+			return
+		workout = self._workouts[row]
+		if not workout["is_liked_by_user"]:
+			workout["is_liked_by_user"] = True
+			workout["like_count"] += 1
+			self.dataChanged.emit(self.index(row), self.index(row))
+
+	#
+	# Text and thumbnails for a row. The text is made on first paint and kept for the most
+	# recent FEED_CACHE_ROWS rows, thumbnails not ready yet are None until on_image_ready
+	#
+	def materialize(self, row):
+		workout = self._workouts[row]
+		text = self._cache.get(workout["id"])
+		if text is None:
+			text = format_workout(workout, self.weight_unit, self.show_username)
+			self._cache[workout["id"]] = text
+			while len(self._cache) > FEED_CACHE_ROWS:
+				self._cache.popitem(last=False)
+		else:
+			self._cache.move_to_end(workout["id"])
+		thumbs = [image_cache().get(image_path(img_url), FEED_THUMB_SIZE) for img_url in workout["image_urls"]]
+		return text, thumbs
+
+	#
+	# Repaint the recently painted rows showing a picture whose thumbnail is now ready
+	#
+	def on_image_ready(self, path):
+		for workout_id in self._cache:
+			row = self._rows[workout_id]
+			if any(image_path(img_url) == path for img_url in self._workouts[row]["image_urls"]):
+				self.dataChanged.emit(self.index(row), self.index(row))
+
+
+class FeedDelegate(QStyledItemDelegate):
+	# workout id of a like button click
+	likeClicked = Signal(str)
+
+	def __init__(self, like_icon, parent=None):
+		super(FeedDelegate, self).__init__(parent)
+		self.like_icon = like_icon
+
+	def sizeHint(self, option, index):
+		workout = index.data(WorkoutRole)
+		text_height = line_count(workout) * option.fontMetrics.lineSpacing()
+		return QSize(option.rect.width(), text_height + self._footer_height(workout) + 3*FEED_PADDING)
+
+	def paint(self, painter, option, index):
+		workout = index.data(WorkoutRole)
+		text, thumbs = index.model().materialize(index.row())
+		painter.save()
+		style = option.widget.style() if option.widget else None
+		if style:
+			style.drawPrimitive(QStyle.PE_PanelItemViewRow, option, painter, option.widget)
+		painter.setPen(option.palette.color(QPalette.Text))
+		text_rect = option.rect.adjusted(FEED_PADDING, FEED_PADDING, -FEED_PADDING, 0)
+		text_rect.setHeight(line_count(workout) * option.fontMetrics.lineSpacing())
+		painter.drawText(text_rect, Qt.AlignLeft | Qt.AlignTop | Qt.TextExpandTabs, text)
+
+		like_rect, label_rect, thumb_rects = self._footer_rects(option, workout)
+		mode = QIcon.Normal if workout["is_liked_by_user"] else QIcon.Disabled
+		self.like_icon.paint(painter, like_rect, Qt.AlignCenter, mode)
+		painter.drawText(label_rect, Qt.AlignLeft | Qt.AlignVCenter, str(workout["like_count"])+" prop(s)")
+		for thumb_rect, thumb in zip(thumb_rects, thumbs):
+			if thumb is not None:
+				painter.drawPixmap(thumb_rect.topLeft(), thumb)
+			else:
+				painter.drawText(thumb_rect, Qt.AlignCenter, "Picture")
+		painter.restore()
+
+	def editorEvent(self, event, model, option, index):
+		if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+			workout = index.data(WorkoutRole)
+			like_rect = self._footer_rects(option, workout)[0]
+			if like_rect.contains(event.position().toPoint()) and not workout["is_liked_by_user"]:
+				# don't allow unliking
+				self.likeClicked.emit(workout["id"])
+				return True
+		return super(FeedDelegate, self).editorEvent(event, model, option, index)
+
+	def helpEvent(self, event, view, option, index):
+		if event.type() == QEvent.ToolTip:
+			workout = index.data(WorkoutRole)
+			thumb_rects = self._footer_rects(option, workout)[2]
+			for thumb_rect, img_url in zip(thumb_rects, workout["image_urls"]):
+				if thumb_rect.contains(event.pos()):
+					QToolTip.showText(event.globalPos(), '<img src="'+image_path(img_url)+'" width="400">', view)
+					return True
+		return super(FeedDelegate, self).helpEvent(event, view, option, index)
+
+	def _footer_height(self, workout):
+		if workout["image_urls"]:
+			return max(FEED_ICON_SIZE, FEED_THUMB_SIZE)
+		return FEED_ICON_SIZE
+
+	def _footer_rects(self, option, workout):
+		height = self._footer_height(workout)
+		top = option.rect.bottom() - FEED_PADDING - height + 1
+		left = option.rect.left() + FEED_PADDING
+		like_rect = QRect(left, top, FEED_ICON_SIZE, height)
+		label_width = option.fontMetrics.horizontalAdvance("0000 prop(s)")
+		label_rect = QRect(like_rect.right() + FEED_PADDING, top, label_width, height)
+		thumb_rects = []
+		x = label_rect.right() + FEED_PADDING
+		for _ in workout["image_urls"]:
+			thumb_rects.append(QRect(x, top, FEED_THUMB_SIZE, FEED_THUMB_SIZE))
+			x += FEED_THUMB_SIZE + FEED_PADDING
+		return like_rect, label_rect, thumb_rects
+
+
+#
+# The feed list widget itself. append_workouts() adds a page of workouts, dropping the
+# oldest beyond FEED_MAX_WORKOUTS without moving what's on screen
+#
+class FeedView(QListView):
+
+	def __init__(self, like_icon, weight_unit="kg", show_username=True):
+		super(FeedView, self).__init__()
+		self.feed_model = FeedModel(weight_unit, show_username)
+		self.feed_delegate = FeedDelegate(like_icon, self)
+		self.setModel(self.feed_model)
+		self.setItemDelegate(self.feed_delegate)
+		self.likeClicked = self.feed_delegate.likeClicked
+		self.setMinimumWidth(150)
+		self.setSelectionMode(QAbstractItemView.NoSelection)
+		self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+		self.setAlternatingRowColors(True)
+		self.setFocusPolicy(Qt.NoFocus)
+		self.setMouseTracking(True)
+		self.verticalScrollBar().setSingleStep(15)
+
+	def append_workouts(self, workouts):
+		self.feed_model.append(workouts)
+		extra = self.feed_model.rowCount() - FEED_MAX_WORKOUTS
+		if extra > 0:
+			removed_height = sum(self.sizeHintForRow(row) for row in range(extra))
+			scrollbar = self.verticalScrollBar()
+			value = scrollbar.value()
+			self.feed_model.remove_head(extra)
+			self.doItemsLayout()
+			scrollbar.setValue(max(0, value - removed_height))
+
+	def clear_feed(self):
+		self.feed_model.clear()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Under the Bar - Image cache
+
+Ready-to-draw thumbnails of profile pictures and feed workout pictures.
+
+Images are decoded, cropped and scaled on a worker thread (as QImage, which is
+safe off the UI thread), kept in memory up to IMAGE_CACHE_BYTES and written to
+~/.underthebar/thumbs, so switching pages doesn't decode the same full size
+pictures again. Thumbnails are keyed by file, size and mtime, so a picture that
+is downloaded again gets a fresh thumbnail.
+"""
+
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+from PySide6.QtCore import Qt, QRect, QObject, Signal, QRunnable, QThreadPool
+from PySide6.QtGui import QImage, QPixmap, QPainter, QBrush, QGuiApplication
+from PySide6.QtWidgets import QLabel
+
+import session_store
+
+# Memory for thumbnails, least recently drawn ones are dropped beyond this
+IMAGE_CACHE_BYTES = 32 * 1024 * 1024
+# Thumbnails on disk not used for this long are deleted
+IMAGE_CACHE_DAYS = 30
+
+_image_cache = None
+
+
+#
+# The shared cache, made on first use from the UI thread
+#
+def image_cache():
+	global _image_cache
+	if _image_cache is None:
+		_image_cache = ImageCache()
+	return _image_cache
+
+
+def thumbs_folder():
+	return session_store.utb_folder() + "/thumbs"
+
+
+#
+# Square crop of image, scaled to size, painted into a circle (profile pictures)
+#
+def circle_image(image, size):
+	imgsize = min(image.width(), image.height())
+	rect = QRect((image.width() - imgsize) // 2, (image.height() - imgsize) // 2, imgsize, imgsize)
+	image = image.copy(rect).scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+	image = image.convertToFormat(QImage.Format_ARGB32)
+
+	out_img = QImage(image.width(), image.height(), QImage.Format_ARGB32)
+	out_img.fill(Qt.transparent)
+	painter = QPainter(out_img)
+	painter.setBrush(QBrush(image))
+	painter.setPen(Qt.NoPen)
+	painter.drawEllipse(0, 0, image.width(), image.height())
+	painter.end()
+	return out_img
+
+
+class ImageCache(QObject):
+	# path of an image whose thumbnail has just become available
+	ready = Signal(str)
+
+	def __init__(self):
+		super(ImageCache, self).__init__()
+		self.pool = QThreadPool()
+		self._pixmaps = OrderedDict()
+		self._bytes = 0
+		self._loading = set()
+		self.pool.start(PruneWorker())
+
+	#
+	# The thumbnail of path at size (scaled to fit, or a circle), or None if the
+	# file doesn't exist yet or is still being made, in which case ready(path) follows
+	#
+	def get(self, path, size, circle=False):
+		try:
+			mtime = os.stat(path).st_mtime_ns
+		except OSError:
+			return None
+		key = (path, size, circle, mtime)
+		pixmap = self._pixmaps.get(key)
+		if pixmap is not None:
+			self._pixmaps.move_to_end(key)
+			return pixmap
+		if key not in self._loading:
+			self._loading.add(key)
+			worker = ThumbnailWorker(key)
+			worker.emitter.done.connect(self.on_thumbnail_done)
+			self.pool.start(worker)
+		return None
+
+	def on_thumbnail_done(self, key, image):
+		self._loading.discard(key)
+		if image.isNull():
+			# not a (complete) picture yet, tried again on the next get()
+			return
+		pixmap = QPixmap.fromImage(image)
+		if key[2]:
+			pixmap.setDevicePixelRatio(QGuiApplication.primaryScreen().devicePixelRatio())
+		self._pixmaps[key] = pixmap
+		self._bytes += _size_of(pixmap)
+		while self._bytes > IMAGE_CACHE_BYTES and len(self._pixmaps) > 1:
+			_, dropped = self._pixmaps.popitem(last=False)
+			self._bytes -= _size_of(dropped)
+		self.ready.emit(key[0])
+
+
+#
+# Label showing a round profile picture, or the placeholder icon while there is none
+# The picture is made by the image cache in the background and shown once ready
+#
+class ProfileImageLabel(QLabel):
+
+	def __init__(self, *args):
+		super(ProfileImageLabel, self).__init__(*args)
+		self.image_path = None
+		self.image_size = None
+		image_cache().ready.connect(self.on_image_ready)
+
+	def setProfileImage(self, path, size):
+		self.image_path = path
+		self.image_size = size
+		pixmap = image_cache().get(path, size, circle=True)
+		if pixmap is None:
+			script_folder = os.path.split(os.path.abspath(__file__))[0]
+			pixmap = QPixmap(script_folder+"/icons/user-solid.svg").scaled(size,size)
+		self.setPixmap(pixmap)
+
+	def on_image_ready(self, path):
+		if path == self.image_path:
+			pixmap = image_cache().get(path, self.image_size, circle=True)
+			if pixmap is not None:
+				self.setPixmap(pixmap)
+
+
+def _size_of(pixmap):
+	return pixmap.width() * pixmap.height() * 4
+
+
+def _thumb_path(key):
+	digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+	return thumbs_folder() + "/" + digest + ".png"
+
+
+class ThumbnailEmitter(QObject):
+	# setting up custom signal, (path, size, circle, mtime) and the thumbnail
+	done = Signal(object, QImage)
+
+class ThumbnailWorker(QRunnable):
+
+	def __init__(self, key):
+		super(ThumbnailWorker, self).__init__()
+
+		self.key = key
+		self.emitter = ThumbnailEmitter()
+
+	def run(self):
+		path, size, circle, mtime = self.key
+		thumb_path = _thumb_path(self.key)
+		try:
+			image = QImage(thumb_path)
+			if not image.isNull():
+				os.utime(thumb_path)
+			else:
+				image = QImage(path)
+				if not image.isNull():
+					if circle:
+						image = circle_image(image, size)
+					else:
+						image = image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+					if not os.path.exists(thumbs_folder()):
+						os.makedirs(thumbs_folder(), exist_ok=True)
+					if image.save(thumb_path + ".tmp", "PNG"):
+						os.replace(thumb_path + ".tmp", thumb_path)
+		except Exception as e:
+			# always answer, or the key stays in the cache's loading set for good
+			print("thumbnail failed", path, e)
+			image = QImage()
+		self.emitter.done.emit(self.key, image)
+
+class PruneWorker(QRunnable):
+
+	def run(self):
+		folder = thumbs_folder()
+		if not os.path.exists(folder):
+			return
+		for f in os.listdir(folder):
+			try:
+				if os.stat(os.path.join(folder,f)).st_mtime < time.time() - IMAGE_CACHE_DAYS * 86400:
+					os.remove(os.path.join(folder,f))
+			except OSError:
+				pass
@@ -14,7 +14,7 @@ import calendar
 import re
 import xml.etree.ElementTree as ET
 
-from PySide6.QtCore import Qt, QSize, QRect, QItemSelectionModel
+from PySide6.QtCore import Qt, QSize, QItemSelectionModel
 from PySide6 import QtSvgWidgets
 from PySide6.QtWidgets import (
     QApplication,
@@ -33,17 +33,19 @@ from PySide6.QtWidgets import (
     QTableWidget,
     QTableWidgetItem,
     QHeaderView,
-    QToolButton,
 	QComboBox,
 )
-from PySide6.QtGui import QPalette, QColor, QWindow
-from PySide6.QtGui import QIcon, QPixmap,QImage, QBrush, QPainter
+from PySide6.QtGui import QPalette, QColor
+from PySide6.QtGui import QIcon, QPixmap, QPainter
 
 from PySide6.QtCore import Slot, Signal, QObject, QThreadPool, QRunnable
 
 import hevy_api	
 import textwrap
 import utb_plot_body_measures
+from utb_feed import FeedView
+from utb_image_cache import ProfileImageLabel
+import feed_pager
 	
 		
 class Profile(QWidget):
@@ -123,15 +125,8 @@ class Profile(QWidget):
 		#self.layout().addStretch()
 
 		toplayout.addStretch()
-		self.piclabel = QLabel("image")
-		if os.path.exists(user_folder+"/profileimage"):
-			pixmap = QPixmap(user_folder+"/profileimage")#.scaled(250,250)
-			pixmap = self.makeProfileImage(pixmap)
-			self.piclabel.setPixmap(pixmap)
-		else:
-			script_folder = os.path.split(os.path.abspath(__file__))[0]
-			pixmap = QPixmap(script_folder+"/icons/user-solid.svg").scaled(250,250)
-			self.piclabel.setPixmap(pixmap)
+		self.piclabel = ProfileImageLabel("image")
+		self.piclabel.setProfileImage(user_folder+"/profileimage", 250)
 		self.piclabel.setMaximumSize(250,250)
 		toplayout.addWidget(self.piclabel)
 	
@@ -205,14 +200,12 @@ class Profile(QWidget):
 		feedbuttonlayout.addWidget(self.feedloadbutton)
 		feedbuttonlayout.addWidget(self.filterCombo)
 
-		self.feedList = QListWidget()
-		self.feedList.setMinimumWidth(150)
-		self.feedList.setSelectionMode(QAbstractItemView.NoSelection)
-		self.feedList.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
-		self.feedList.setAlternatingRowColors(True)
-		self.feedList.setFocusPolicy(Qt.NoFocus);
-		self.feedList.verticalScrollBar().setSingleStep(15)
+		self.feedList = FeedView(self.loadIcon(self.script_folder+"/icons/thumbs-up-solid.svg"), self.weight_unit)
+		self.feedList.likeClicked.connect(self.like_button)
 		self.feedList.verticalScrollBar().valueChanged.connect(self.feedScrollChanged)
+		# show the feed as it was last time until it is reloaded
+		self.feed_pager = feed_pager.FeedPager()
+		self.feedList.append_workouts(self.feed_pager.cached())
 
 		# Build calendar widget
 		self.calendarWidget = QTableWidget(8,53)
@@ -388,8 +381,6 @@ class Profile(QWidget):
 		
 		self.layout().addWidget(self._stack)
 
-		self.feed_last_index = 0
-
 		self.initialised = True
 
 		# Apply layout based on current size
@@ -491,6 +482,7 @@ class Profile(QWidget):
 				self.body_measurement_unit = preference_data["data"]["body_measurement_unit"]
 			else:
 				self.weight_unit = "kg"
+			self.feedList.feed_model.set_weight_unit(self.weight_unit)
 			#self.workoutcountLabel.setText(str(workoutcount_data["data"]["workout_count"]))
 			
 			
@@ -760,14 +752,7 @@ class Profile(QWidget):
 				self.recordList.addItem("\nDownload personal records, \nBottom left gear icon.")
 		
 			#update user profile image		
-			if os.path.exists(user_folder+"/profileimage"):
-				pixmap = QPixmap(user_folder+"/profileimage")#.scaled(250,250)
-				pixmap = self.makeProfileImage(pixmap)
-				self.piclabel.setPixmap(pixmap)
-			else:
-				script_folder = os.path.split(os.path.abspath(__file__))[0]
-				pixmap = QPixmap(script_folder+"/icons/user-solid.svg").scaled(250,250)
-				self.piclabel.setPixmap(pixmap)
+			self.piclabel.setProfileImage(user_folder+"/profileimage", 250)
 			
 	
 	def deleteItemsOfLayout(self, layout):
@@ -1110,18 +1095,13 @@ class Profile(QWidget):
 			self.feed_load_button()
 			
 	def feed_reload_button(self):
-		self.feed_last_index = 0
-		self.feedList.clear()
-		self.feed_load_button()
-		#self.feed_load_button()
-		#self.feed_load_button()
+		self.feed_load_button(reload=True)
 		
 	
-	def feed_load_button(self):
+	def feed_load_button(self, reload=False):
 		self.feedreloadbutton.setEnabled(False)
 		self.feedloadbutton.setEnabled(False)
-		start_index = self.feed_last_index + 0
-		worker = MyFeedWorker(start_index)
+		worker = MyFeedWorker(self.feed_pager, reload)
 		
 		### The line below was creating a segmentation fault, found this: https://stackoverflow.com/questions/29123171/segmentation-fault-when-connecting-a-signal-and-a-slot
 		#worker.emitter.done.connect(self.on_feed_worker_done)
@@ -1130,151 +1110,24 @@ class Profile(QWidget):
 		self.pool.start(worker)
 	
 	@Slot(dict)
-	def on_feed_worker_done(self, returnjson):
+	def on_feed_worker_done(self, feed_page):
 		# modify the UI
-		if returnjson != 304:
-			#self.feedList.addItem(json.dumps(returnjson, indent=4, sort_keys=False))
-			for workout in returnjson["data"]["workouts"]:
-				fancystring = workout["username"] + " - " + workout["name"]
-				workout_date = datetime.datetime.utcfromtimestamp(workout["start_time"])
-				workout_date = workout_date.replace(tzinfo=datetime.timezone.utc).astimezone(tz=None)
-				import platform
-				if platform.system() == "Linux":
-					fancystring += "\n" + workout_date.strftime("%a %b %-d, ") + str(len(workout["exercises"])) + " exercises"
-				else:
-					fancystring += "\n" + workout_date.strftime("%a %b %#d, ") + str(len(workout["exercises"])) + " exercises"
-				
-				
-				the_superset_id = None
-				ss_string = ""
-				for exercise in workout["exercises"]:
-					if exercise["superset_id"] != None:
-						ss_string = "|"
-						if exercise["superset_id"] != the_superset_id:
-							the_superset_id = exercise["superset_id"]
-							fancystring += "\n\nSuper Set "+str(the_superset_id+1)
-						else:
-							fancystring += "\n"+ss_string
-					else:
-						ss_string = ""
-						fancystring += "\n"+ss_string
-					fancystring += "\n"+ss_string+"    " + exercise["title"]
-					
-					has_weight = False
-					has_reps = False
-					has_distance = False
-					has_duration = False
-					
-					# loop twice, first to decide format, then to write it out
-					for exercise_set in exercise["sets"]:
-						#fancystring += "\n        "+str(exercise_set["index"]+1)+":\t"
-						if exercise_set["weight_kg"] != 0 and exercise_set["weight_kg"] != None:
-							#fancystring += str(exercise_set["weight_kg"])+"kg\t"
-							has_weight = True
-						if exercise_set["reps"] != 0 and exercise_set["reps"] != None:
-							#fancystring += str(exercise_set["reps"])+" reps\t"
-							has_reps = True
-						if exercise_set["distance_meters"] != 0 and exercise_set["distance_meters"] != None:
-							#fancystring += str(exercise_set["distance_meters"])+"m\t"
-							has_distance = True
-						if exercise_set["duration_seconds"] != 0 and exercise_set["duration_seconds"] != None:
-							#fancystring += str(exercise_set["duration_seconds"])+"s\t"
-							has_duration = True
-						#print(exercise_set)
-					for exercise_set in exercise["sets"]:
-						fancystring += "\n"+ss_string+"        "+str(exercise_set["index"]+1)+":\t"
-						if has_weight:
-							if self.weight_unit == "lbs":
-								lb = round(exercise_set["weight_kg"]*2.20462262,2)
-								if lb.is_integer():
-									lb = int(lb)
-								fancystring += str(lb)+"lbs\t"
-							else:
-								fancystring += str(round(exercise_set["weight_kg"],2))+"kg\t"
-						if has_reps:
-							fancystring += str(exercise_set["reps"])+" reps\t"
-						if has_distance:
-							if exercise_set["distance_meters"] < 1000:
-								fancystring += str(exercise_set["distance_meters"])+"m\t"
-							else:
-								fancystring += str(exercise_set["distance_meters"]/1000)+"km\t"
-						if has_duration:
-							#fancystring += str(datetime.timedelta(seconds=exercise_set["duration_seconds"]))+"\t"
-							m, s = divmod(exercise_set["duration_seconds"], 60) 
-							time_format = "{:02d}:{:02d}".format(m, s) 
-							if m>59:
-								h,m = divmod(m, 60) 
-								time_format = "{:02d}:{:02d}:{:02d}".format(h, m, s) 
-							fancystring += time_format+"\t"
-				fancystring += "\n"
-				
-				itemtoadd = QListWidgetItem(fancystring)
-				itemtoadd.setToolTip(textwrap.fill(workout["description"],50))
-				self.feedList.addItem(itemtoadd)
-				#self.feedList.addItem(fancystring)
-				#self.feedList.addItem("")
-				
-				
-
-				
-				
-				item = QListWidgetItem()
-				internalWidget = QWidget()
-				internalLayout = QHBoxLayout()
-				likebutton = QToolButton()
-				likebutton.setIcon(self.loadIcon(self.script_folder+"/icons/thumbs-up-solid.svg"))
-				likebutton.setCheckable(True)
-				likebutton.setChecked(False)
-				
-				internalLayout.addWidget(likebutton)
-				counterLabel = QLabel(str(workout["like_count"]))
-				#counterLabel.setToolTip('<img src="https://b.thumbs.redditmedia.com/wjrOwbynl7LAxh4UACgPS4MBu3vjUXanM_NBsxixtys.jpg" width="100">')
-				#counterLabel.setToolTip('<img src="test.jpg" width="400">')
-				internalLayout.addWidget(counterLabel)
-				internalLayout.addWidget(QLabel("prop(s)"))
-				# add the workout pics
-				for img_url in workout["image_urls"]:
-					filename = img_url.split("/")[-1]
-					img_folder = str(Path.home())+ "/.underthebar/temp/"
-					#if os.path.exists(img_folder+filename): # following three lines were under this if, but now image might not be downloaded immediately
-					pic_label = QLabel("Picture ")
-					pic_label.setToolTip('<img src="'+img_folder+filename+'" width="400">')
-					internalLayout.addWidget(pic_label)
-				internalLayout.addStretch()
-				internalLayout.setContentsMargins(0,0,0,0)
-				internalWidget.setLayout(internalLayout)
-				#item.setWidget(internalWidget)
-				#item.setText("\n\"sick workout dude\" - a guy\n\n\"awesome!!!\" - a hot chick")
-				#item.setText(str(workout["like_count"])+ " prop(s)")
-				#item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
-				#item.setCheckState(Qt.Unchecked)
-				if workout["is_liked_by_user"]:
-					likebutton.setChecked(True)
-				item.setSizeHint(internalWidget.sizeHint())   
-				self.feedList.addItem(item)
-				self.feedList.setItemWidget(item, internalWidget)
-				
-				
-				likebutton.clicked.connect(lambda *args, x=workout["id"], y=likebutton, z=counterLabel: self.like_button(args, x,y,z))
-				self.feed_last_index = workout["index"]
+		if feed_page["reset"]:
+			self.feedList.clear_feed()
+		self.feedList.append_workouts(feed_page["workouts"])
 		
 		self.feedreloadbutton.setEnabled(True)
 		self.feedloadbutton.setEnabled(True)
 	
-	def like_button(self, checked, workout_id, button, label):
-		#print(checked, workout_id, button.isChecked())
-		if button.isChecked():
-			worker = LikeWorker(label, workout_id)
-			worker.emitter.done.connect(self.on_like_worker_done)
-			self.pool.start(worker)	
-		else:
-			button.setChecked(True) # don't allow unliking
+	def like_button(self, workout_id):
+		worker = LikeWorker(workout_id)
+		worker.emitter.done.connect(self.on_like_worker_done)
+		self.pool.start(worker)	
 
-	@Slot(QLabel)
-	def on_like_worker_done(self, the_label):
-		if the_label != None:
-			value = int(the_label.text()) + 1
-			the_label.setText(str(value))
+	@Slot(str)
+	def on_like_worker_done(self, workout_id):
+		if workout_id:
+			self.feedList.feed_model.set_liked(workout_id)
 		
 	def loadIcon(self, path):
 	
@@ -1302,91 +1155,44 @@ class Profile(QWidget):
 		ic.addPixmap(img,QIcon.Normal,QIcon.Off)
 		return ic
 			
-	def makeProfileImage(self,pixmap):
-		# Load image
-		image = pixmap.toImage()
-
-		# convert image to 32-bit ARGB (adds an alpha
-		# channel ie transparency factor):
-		image.convertToFormat(QImage.Format_ARGB32)
-
-		# Crop image to a square:
-		imgsize = min(image.width(), image.height())
-		rect = QRect(
-		(image.width() - imgsize) / 2,
-		(image.height() - imgsize) / 2,
-		imgsize,
-		imgsize,
-		)
-		image = image.copy(rect)
-
-		# Create the output image with the same dimensions 
-		# and an alpha channel and make it completely transparent:
-		out_img = QImage(imgsize, imgsize, QImage.Format_ARGB32)
-		out_img.fill(Qt.transparent)
-
-		# Create a texture brush and paint a circle 
-		# with the original image onto the output image:
-		brush = QBrush(image)
-
-		# Paint the output image
-		painter = QPainter(out_img)
-		painter.setBrush(brush)
-
-		# Don't draw an outline
-		painter.setPen(Qt.NoPen)
-
-		# drawing circle
-		painter.drawEllipse(0, 0, imgsize, imgsize)
-
-
-		# closing painter event
-		painter.end()
-
-		# Convert the image to a pixmap and rescale it. 
-		pr = QWindow().devicePixelRatio()
-		pm = QPixmap.fromImage(out_img)
-		pm.setDevicePixelRatio(pr)
-		#size *= pr
-		pm = pm.scaled(250, 250, Qt.KeepAspectRatio, 
-				       Qt.SmoothTransformation)
-		return pm
-
 class MyEmitter(QObject):
 	# setting up custom signal
 	done = Signal(dict)
 
 class MyFeedWorker(QRunnable):
 
-	def __init__(self, start_from):
+	def __init__(self, pager, reload):
 		super(MyFeedWorker, self).__init__()
 
-		self.start_from = start_from + 0
+		self.pager = pager
+		self.reload = reload
 		self.emitter = MyEmitter()
 
 	def run(self):
-		returnjson = hevy_api.feed_workouts_paged(self.start_from)
-		self.emitter.done.emit(returnjson)
+		if self.reload:
+			feed_page = self.pager.reload()
+		else:
+			feed_page = self.pager.next_page()
+		self.emitter.done.emit(feed_page)
 
 class LikeEmitter(QObject):
-	# setting up custom signal
-	done = Signal(QLabel)
+	# setting up custom signal, the liked workout id or "" if it failed
+	done = Signal(str)
 
 class LikeWorker(QRunnable):
 
-	def __init__(self, the_label, workout_id):
+	def __init__(self, workout_id):
 		super(LikeWorker, self).__init__()
 
-		self.the_label = the_label
 		self.workout_id = workout_id
 		self.emitter = LikeEmitter()
 
 	def run(self):
 		returnstatus = hevy_api.like_workout(self.workout_id, True)
 		if returnstatus == 200:
-			self.emitter.done.emit(self.the_label)
+			self.emitter.done.emit(self.workout_id)
 		else:
-			self.emitter.done.emit(None)
+			self.emitter.done.emit("")
 
 if __name__ == "__main__":
 	app = QApplication(sys.argv)
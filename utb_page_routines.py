@@ -31,6 +31,7 @@ from PySide6.QtCore import Slot, Signal, QObject, QThreadPool, QRunnable
 
 import hevy_api	
 import garmin_translate
+import routines_store
 		
 class Routines(QWidget):
 
@@ -228,71 +229,18 @@ class Routines(QWidget):
 		self.workoutList.item(1).setTextAlignment(Qt.AlignHCenter)
 		
 		
-		fileslist = sorted(os.listdir(self.routines_folder), reverse=True)
+		# Sorted via folders / index, from the routines index rather than the routine files
 		self.workoutList_files = []
-		self.exercises = {}
-		counter = 0
-		
-		# Attempt at sorting via folders / index
-		folders = {}
-		for filename in fileslist:
-			match_workout = re.search('^routine_([A-Za-z0-9_-]+).json\Z',filename)
-			if match_workout:
-				with open(self.routines_folder+"/"+filename, 'r') as openfile:
-					temp_data = json.load(openfile)
-					routine_index = temp_data["index"]
-					routine_folder = temp_data["folder_id"]
-					if not routine_folder:
-						routine_folder = 0
-					
-					#print(routine_index, routine_folder, match_workout[1])
-					
-					if routine_folder in folders.keys():
-						folders[routine_folder].append([filename,routine_index])
-					else:
-						folders[routine_folder] = [[filename,routine_index],]
-		newlist = []
-		for folder_key in sorted(folders.keys()):
-			indexes = {}
-			for bodge_file in folders[folder_key]:
-				if bodge_file[1] in indexes.keys():
-					indexes[bodge_file[1]].append(bodge_file[0])
-				else:
-					indexes[bodge_file[1]] = [bodge_file[0],]
-			for bodge_index in sorted(indexes.keys()):
-				for super_bodge_index in indexes[bodge_index]:
-					newlist.append(super_bodge_index)
-		fileslist = newlist
-		# End attempt at sorting via folders / index
-
-		
-		for filename in fileslist:
-			match_workout = re.search('^routine_([A-Za-z0-9_-]+).json\Z',filename)
-			if match_workout:
-				with open(self.routines_folder+"/"+filename, 'r') as openfile:
-					temp_data = json.load(openfile)
-					routine_date = temp_data["updated_at"]
-					routine_title = temp_data["title"]
-					#workout_date = workout_date.replace(tzinfo=datetime.timezone.utc).astimezone(tz=None)
-
-					if os.path.exists(self.routines_folder+"/modified/"+filename):
-						self.workoutList.addItem("* "+temp_data["title"]+"\n    "+routine_date)
-					else:
-						self.workoutList.addItem(temp_data["title"]+"\n    "+routine_date)
-					
-					self.workoutList_files.append(filename)
-			
-					
-					for exercise in temp_data["exercises"]:
-						exercise_title = exercise["title"]
-						exercise_json = "        "+json.dumps(self.jsonStripExercise(exercise), indent=4).replace("\n","\n        ")
-						text_to_add = "From routine: "+routine_title+"\n\n"+exercise_json
-						if exercise_title not in self.exercises.keys():
-							#self.exercises[exercise_title] = routine_date + str(len(exercise["sets"])) + " sets"
-							self.exercises[exercise_title] = text_to_add
-						else:
-							self.exercises[exercise_title] = self.exercises[exercise_title] + "\n\n" + text_to_add
-			counter += 1
+		entries = routines_store.ordered(routines_store.load_index(self.routines_folder))
+		for entry in entries:
+			if entry["modified"]:
+				self.workoutList.addItem("* "+entry["title"]+"\n    "+entry["updated_at"])
+			else:
+				self.workoutList.addItem(entry["title"]+"\n    "+entry["updated_at"])
+			self.workoutList_files.append(entry["file"])
+
+		# exercise title -> routine files using it, the text is built when the exercise is selected
+		self.exercises = routines_store.exercise_routines(entries)
 							
 		for exercise_title in sorted(self.exercises.keys()):
 			self.exercisesList.addItem(exercise_title+"\n")
@@ -332,8 +280,9 @@ class Routines(QWidget):
   
   "Discard Local" will entirely discard any of your local edits and display the original version.
   
-  "Push to Server" will submit your changes to Hevy. Follow with a "Reload from Hevy" to confirm.
-  (local version is retained unchanged in case Hevy doesn't accept)
+  "Push to Server" will submit all your local changes to Hevy and show what Hevy saved.
+  (a local version Hevy doesn't accept is kept unchanged, uploaded ones are kept in modified/uploaded)
+  (a routine changed on Hevy since you started editing isn't pushed, discard local and edit it again)
   
   "Delete Routine" will tell Hevy to delete the routine. (Applied locally after you "Reload from Hevy")
   
@@ -431,6 +380,7 @@ class Routines(QWidget):
 				oldText = self.workoutList.item(selected_row).text()
 				if not oldText.startswith("* "):
 					self.workoutList.item(selected_row).setText("* "+oldText)
+					routines_store.set_modified(self.routines_folder, filename, True)
 			
 			with open(editedFile, 'w') as openfile:
 				openfile.write(self.routineEditor.toPlainText())
@@ -475,7 +425,21 @@ class Routines(QWidget):
 		#print("exercisesList",row)
 		print("selecting",self.exercisesList.currentItem().text().rstrip())
 		the_exercise = self.exercisesList.currentItem().text().rstrip()
-		self.exercisesView.setPlainText(self.exercises[the_exercise])
+		self.exercisesView.setPlainText(self.exerciseText(the_exercise))
+
+	#
+	# The raw data of an exercise in each routine that uses it
+	#
+	def exerciseText(self, exercise_title):
+		texts = []
+		for filename in self.exercises[exercise_title]:
+			with open(self.routines_folder+"/"+filename, 'r') as openfile:
+				temp_data = json.load(openfile)
+			for exercise in temp_data["exercises"]:
+				if exercise["title"] == exercise_title:
+					exercise_json = "        "+json.dumps(self.jsonStripExercise(exercise), indent=4).replace("\n","\n        ")
+					texts.append("From routine: "+temp_data["title"]+"\n\n"+exercise_json)
+		return "\n\n".join(texts)
 		
 	def closeButtonClicked(self):
 		print("closing")
@@ -498,6 +462,7 @@ class Routines(QWidget):
 			filename = self.workoutList_files[selected_row-2]
 			if os.path.exists(self.routines_folder+'/modified/'+filename):
 				os.remove(self.routines_folder+'/modified/'+filename)
+				routines_store.set_modified(self.routines_folder, filename, False)
 			self.workoutList.setCurrentRow(0)
 			self.workoutList.setCurrentRow(selected_row)
 			oldText = self.workoutList.item(selected_row).text()
@@ -631,59 +596,48 @@ class Routines(QWidget):
 				self.populate_lists()
 				
 	def push_button_pushed(self):
+		#
+		# Upload every local edit (including a new routine) in one go
+		#
 		print("start upload")
-		
-		
-		selected_row = self.workoutList.currentRow()
-		if selected_row == 0:
-			return
-		elif selected_row ==1:
-			#return # haven't handled yet
-			
-			if os.path.exists(self.routines_folder+'/modified/newroutine.json'):
-				with open(self.routines_folder+'/modified/newroutine.json', 'r') as openfile:
-					try:
-						routine_json = json.load(openfile)
-					except:
-						self.statusText.setText("fail: not valid json")
-						return
-				
-					worker = MyUploadWorker(routine_json)
-					worker.emitter.done.connect(self.on_push_worker_done)
-					self.statusText.setText("Uploading")
-					self.pushButton.setEnabled(False)
-					self.pool.start(worker)
-			else:
-				self.statusText.setText("Fail: no modified file")
-			
-		else:
-			filename = self.workoutList_files[selected_row-2]
-			if os.path.exists(self.routines_folder+'/modified/'+filename):
-				match_workout = re.search('^routine_([A-Za-z0-9_-]+).json\Z',filename)
-				routine_id = match_workout[1]
-				with open(self.routines_folder+'/modified/'+filename, 'r') as openfile:
-					try:
-						routine_json = json.load(openfile)
-					except:
-						self.statusText.setText("fail: not valid json")
-						return
-				
-					worker = MyUploadWorker(routine_json,routine_id=routine_id)
-					worker.emitter.done.connect(self.on_push_worker_done)
-					self.statusText.setText("Uploading")
-					self.pool.start(worker)
-				
-				#os.remove(self.routines_folder+'/modified/'+filename)
-			else:
-				self.statusText.setText("Fail: no modified file")
+		if self.workoutList.currentRow() == 1 and os.path.exists(self.routines_folder+'/modified/newroutine.json'):
+			with open(self.routines_folder+'/modified/newroutine.json', 'r') as openfile:
+				try:
+					json.load(openfile)
+				except:
+					self.statusText.setText("fail: not valid json")
+					return
+
+		worker = MyUploadQueueWorker()
+		worker.emitter.done.connect(self.on_push_worker_done)
+		self.statusText.setText("Uploading")
+		self.pushButton.setEnabled(False)
+		self.pool.start(worker)
 			
 		
-	@Slot(str,int,int)
-	def on_push_worker_done(self, routine_id, routine_json, status):
+	@Slot(object)
+	def on_push_worker_done(self, results):
 		# modify the UI
-		print("task completed:", routine_id, status)
-		self.statusText.setText("Uploaded (do a reload)")
+		print("task completed:", results)
 		self.pushButton.setEnabled(True)
+		if not isinstance(results, dict):
+			self.statusText.setText("Upload failed ({})".format(results))
+			return
+		if not results:
+			self.statusText.setText("Fail: no modified file")
+			return
+		uploaded = [filename for filename, result in results.items() if result[0] in (200, 201)]
+		conflicts = [filename for filename, result in results.items() if result[0] == 409]
+		failed = len(results) - len(uploaded) - len(conflicts)
+		status = "Uploaded {}".format(len(uploaded))
+		if conflicts:
+			status += ", {} changed on Hevy (discard local and re-edit)".format(len(conflicts))
+		if failed:
+			status += ", {} failed".format(failed)
+		if not all(results[filename][1] for filename in uploaded):
+			status += " (do a reload)"
+		self.statusText.setText(status)
+		self.populate_lists()
 		return
 
 
@@ -691,19 +645,23 @@ class MyEmitter(QObject):
 	# setting up custom signal
 	done = Signal(str,int,int)
 
-class MyUploadWorker(QRunnable):
+class UploadEmitter(QObject):
+	done = Signal(object)
 
-	def __init__(self, the_json, routine_id=None):
-		super(MyUploadWorker, self).__init__()
-		self.routine_id = routine_id
-		self.the_json = the_json
-		self.emitter = MyEmitter()
+class MyUploadQueueWorker(QRunnable):
+
+	def __init__(self):
+		super(MyUploadQueueWorker, self).__init__()
+		self.emitter = UploadEmitter()
 
 	@Slot()
 	def run(self):
-
-		status = hevy_api.put_routine(self.the_json, routine_id = self.routine_id)
-		self.emitter.done.emit(str(self.routine_id),self.the_json,status)
+		try:
+			results = hevy_api.upload_routines()
+		except Exception as e:
+			print("MyUploadQueueWorker exception:", e)
+			results = 0
+		self.emitter.done.emit(results)
 		
 		
 class MyBatchWorker(QRunnable):
@@ -11,6 +11,7 @@ from pathlib import Path
 
 from PySide6.QtCore import QSize, Qt
 from PySide6.QtWidgets import (
+    QAbstractItemView,
     QApplication,
     QCheckBox,
     QDialog,
@@ -34,6 +35,7 @@ from dotenv import load_dotenv, set_key
 
 import hevy_api
 import strava_api
+import session_store
 import utb_prs
 
 STRAVA_SETTINGS_KEY = "strava-activity-type-filters"
@@ -53,11 +55,8 @@ class Setting(QWidget):
 		self.script_folder = os.path.split(os.path.abspath(__file__))[0]
 		self.utb_folder = utb_folder
 
-		session_data = {}
-		if os.path.exists(utb_folder+"/session.json"):
-			with open(utb_folder+"/session.json", 'r') as file:
-				session_data = json.load(file)
-		else:
+		session_data = session_store.load()
+		if not session_store.exists():
 			return 403
 		user_folder = utb_folder + "/user_" + session_data["user-id"]
 		if not os.path.exists(user_folder):
@@ -283,23 +282,13 @@ class Setting(QWidget):
 	def save_strava_type_filters(self):
 		"""Persist the current checkbox state to session.json."""
 		enabled = self.get_enabled_strava_types()
-		session_path = self.utb_folder + "/session.json"
-		if os.path.exists(session_path):
-			with open(session_path, 'r') as f:
-				session_data = json.load(f)
-			session_data[STRAVA_SETTINGS_KEY] = enabled
-			with open(session_path, 'w') as f:
-				json.dump(session_data, f)
+		if session_store.exists():
+			session_store.update({STRAVA_SETTINGS_KEY: enabled})
 
 	def save_strava_private_setting(self):
 		"""Persist the private activity setting to session.json."""
-		session_path = self.utb_folder + "/session.json"
-		if os.path.exists(session_path):
-			with open(session_path, 'r') as f:
-				session_data = json.load(f)
-			session_data[STRAVA_PRIVATE_KEY] = self.strava_private_cb.isChecked()
-			with open(session_path, 'w') as f:
-				json.dump(session_data, f)
+		if session_store.exists():
+			session_store.update({STRAVA_PRIVATE_KEY: self.strava_private_cb.isChecked()})
 
 	def save_strava_credentials(self):
 		cl_id = self.stravaClientIdField.text().strip()
@@ -355,30 +344,33 @@ class Setting(QWidget):
 		# Show activity picker dialog
 		dialog = StravaActivityPickerDialog(activities, self)
 		if dialog.exec() == QDialog.Accepted:
-			selected = dialog.selected_activity()
+			selected = dialog.selected_activities()
 			if selected:
-				self.stravaimportstateLabel.setText("importing...")
+				self.stravaimportstateLabel.setText("importing {}...".format(len(selected)))
 				self.stravaimportbtn.setEnabled(False)
 				self.stravaimportbtn.setIcon(self.loadIcon(self.script_folder+"/icons/spinner-solid.svg"))
 				self.stravaimportbtn.setIconSize(QSize(24,24))
 				enabled_types = self.get_enabled_strava_types()
-				worker = StravaImportWorker(selected["id"], enabled_types, self.strava_private_cb.isChecked())
+				worker = StravaImportWorker([act["id"] for act in selected], enabled_types, self.strava_private_cb.isChecked())
 				worker.emitter.done.connect(self.on_import_done)
 				self.pool.start(worker)
 		else:
 			self.stravaimportstateLabel.setText("cancelled")
 
-	@Slot(int)
-	def on_import_done(self, status_code):
+	@Slot(dict)
+	def on_import_done(self, results):
 		self.stravaimportbtn.setIcon(self.loadIcon(self.script_folder+"/icons/cloud-arrow-down-solid.svg"))
 		self.stravaimportbtn.setIconSize(QSize(24,24))
 		self.stravaimportbtn.setEnabled(True)
-		if status_code == 200:
+		failed = [status_code for status_code in results.values() if status_code != 200]
+		if not failed:
 			self.stravaimportstateLabel.setText("completed")
-		elif status_code == 404:
+		elif len(failed) < len(results):
+			self.stravaimportstateLabel.setText("imported {} of {}".format(len(results) - len(failed), len(results)))
+		elif failed[0] == 404:
 			self.stravaimportstateLabel.setText("API details not found")
 		else:
-			self.stravaimportstateLabel.setText("failed (code {})".format(status_code))
+			self.stravaimportstateLabel.setText("failed (code {})".format(failed[0]))
 
 	def update_button_pushed(self, button_id):
 
@@ -481,9 +473,10 @@ class StravaActivityPickerDialog(QDialog):
 		self._selected = None
 
 		layout = QVBoxLayout()
-		layout.addWidget(QLabel("Choose an activity to import:"))
+		layout.addWidget(QLabel("Choose activities to import:"))
 
 		self.list_widget = QListWidget()
+		self.list_widget.setSelectionMode(QAbstractItemView.ExtendedSelection)
 		for act in activities:
 			date_str = act["start_date"].strftime("%Y-%m-%d %H:%M") if act["start_date"] else "?"
 			dist_km = act["distance"] / 1000.0 if act["distance"] else 0
@@ -504,11 +497,9 @@ class StravaActivityPickerDialog(QDialog):
 		self.setLayout(layout)
 		self.resize(600, 300)
 
-	def selected_activity(self):
-		row = self.list_widget.currentRow()
-		if row >= 0:
-			return self.activities[row]
-		return None
+	def selected_activities(self):
+		rows = sorted(index.row() for index in self.list_widget.selectedIndexes())
+		return [self.activities[row] for row in rows]
 
 
 class MyEmitter(QObject):
@@ -521,7 +512,7 @@ class StravaFetchEmitter(QObject):
 	done = Signal(int, list)
 
 class StravaImportEmitter(QObject):
-	done = Signal(int)
+	done = Signal(dict)
 
 class StravaTestWorker(QRunnable):
 
@@ -570,11 +561,11 @@ class StravaFetchWorker(QRunnable):
 
 
 class StravaImportWorker(QRunnable):
-	"""Imports a specific Strava activity into Hevy."""
+	"""Imports the selected Strava activities into Hevy in one batch."""
 
-	def __init__(self, activity_id, enabled_types, is_private):
+	def __init__(self, activity_ids, enabled_types, is_private):
 		super().__init__()
-		self.activity_id = activity_id
+		self.activity_ids = activity_ids
 		self.enabled_types = enabled_types
 		self.is_private = is_private
 		self.emitter = StravaImportEmitter()
@@ -582,11 +573,11 @@ class StravaImportWorker(QRunnable):
 	@Slot()
 	def run(self):
 		try:
-			status = strava_api.import_activity(self.activity_id, self.enabled_types, self.is_private)
-			self.emitter.done.emit(status)
+			results = strava_api.import_activities(self.activity_ids, self.enabled_types, self.is_private)
+			self.emitter.done.emit(results)
 		except Exception as e:
 			print("StravaImportWorker exception:", e)
-			self.emitter.done.emit(0)
+			self.emitter.done.emit({activity_id: 0 for activity_id in self.activity_ids})
 
 
 class MyWorker(QRunnable):